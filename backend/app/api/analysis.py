@@ -1,26 +1,45 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import subprocess
+import time
 import uuid
+from contextlib import suppress
 from pathlib import Path
+from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.models.database import get_db
-from app.models.schemas import AnalyzeRequest, AnalyzeResponse, GeneratePatchRequest, GeneratePatchResponse
+from app.models.database import AsyncSessionLocal, get_db
+from app.models.schemas import (
+    AnalyzeJobRequest,
+    AnalyzeRequest,
+    AnalyzeResponse,
+    BatchPatchRequest,
+    GeneratePatchJobRequest,
+    GeneratePatchRequest,
+    GeneratePatchResponse,
+    JobSummary,
+    RunSummary,
+)
+from app.services.checkpoint_store import RunRecord, checkpoint_store
 from app.services.conversation_service import ConversationService
-from app.services.deepseek_service import DeepSeekService
-from app.services.llm_service import LLMService
+from app.services.event_channel import EventChannel, stage_scope
+from app.services.job_queue import job_queue
+from app.services.llm_registry import get_deepseek_service, get_llm_service
 from app.services.mcp_service import MCPService
-from app.services.patch_orchestrator import PatchOrchestrator
+from app.services.patch_orchestrator import PatchOrchestrator, PatchResult
 from app.services.repo_analyzer import RepoAnalyzer
+from app.utils.exceptions import ValidationError
 
 router = APIRouter(prefix="/api", tags=["analysis"])
 
-llm_service = LLMService()
-deepseek_service = DeepSeekService()
+llm_service = get_llm_service()
+deepseek_service = get_deepseek_service()
 patch_orchestrator = PatchOrchestrator(llm_service, deepseek_service)
 mcp_service = MCPService()
 repo_analyzer = RepoAnalyzer()
@@ -28,34 +47,168 @@ repo_analyzer = RepoAnalyzer()
 
 @router.post("/analyze", response_model=AnalyzeResponse)
 async def analyze_repo(request: AnalyzeRequest):
-    repo_path, source = _resolve_repo_path(request.repo_path, request.github_url)
-    summary = repo_analyzer.analyze(repo_path, focus=request.focus)
-    return AnalyzeResponse(repo_summary=summary, repo_path=repo_path, source=source)
+    return await _analyze(request)
 
 
 @router.post("/generate_patch", response_model=GeneratePatchResponse)
 async def generate_patch(request: GeneratePatchRequest, db: AsyncSession = Depends(get_db)):
-    repo_path, _ = _resolve_repo_path(request.repo_path, request.github_url)
+    return await _generate_patch(request, db)
 
-    if request.conversation_id:
-        conversation = await ConversationService.get_active_conversation(db, request.conversation_id)
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-        conversation_id = conversation.id
-    else:
-        conversation = await ConversationService.create_conversation(
-            db, title=request.feature_request[:50]
+
+@router.post("/generate_patch/batch")
+async def generate_patch_batch(request: BatchPatchRequest, db: AsyncSession = Depends(get_db)):
+    """同一仓库的多个需求：仓库只克隆、分析一次，各需求的补丁有限并发生成，每完成一条即以 SSE 推送"""
+    total = len(request.feature_requests) * request.candidates
+    if total > settings.PATCH_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {total} patches requested, limit is {settings.PATCH_BATCH_MAX_ITEMS}",
         )
-        conversation_id = conversation.id
+    repo_path, _ = await asyncio.to_thread(_resolve_repo_path, request.repo_path, request.github_url)
+    conversation_id = await _patch_conversation(db, request.conversation_id, request.feature_requests[0])
 
-    await ConversationService.add_message(
+    async def event_generator():
+        events = EventChannel()
+        task = asyncio.create_task(_run_patch_batch(request, repo_path, conversation_id, db, events))
+        task.add_done_callback(lambda _: events.close())
+        try:
+            async for event in events.stream(idle_timeout=settings.SSE_KEEPALIVE_INTERVAL):
+                yield _sse({"type": "ping"} if event is None else event.to_dict())
+            if not task.cancelled() and (exc := task.exception()) is not None:
+                yield _sse({"type": "error", "message": str(exc)})
+        finally:
+            # 客户端断开时取消未完成的生成
+            if not task.done():
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@router.post("/generate_patch/{run_id}/resume", response_model=GeneratePatchResponse)
+async def resume_patch(run_id: str, db: AsyncSession = Depends(get_db)):
+    """从最后完成的节点继续中断的补丁生成，已完成节点的 LLM 结果直接复用"""
+    run = await checkpoint_store.get_run(run_id) if checkpoint_store is not None else None
+    if run is None or run.graph != "patch":
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.resume_blocker:
+        raise HTTPException(status_code=409, detail=run.resume_blocker)
+    try:
+        return await _resume_patch(run, db)
+    except ValidationError as e:
+        # 检查之后另一个恢复请求已抢先开始执行
+        raise HTTPException(status_code=409, detail=e.message)
+
+
+@router.get("/runs", response_model=list[RunSummary])
+async def list_runs(graph: str | None = None, limit: int = 50):
+    """列出检查点中的运行（patch / reasoning），status 不为 completed 的可恢复"""
+    if checkpoint_store is None:
+        return []
+    return [RunSummary(**run.to_dict()) for run in await checkpoint_store.list_runs(graph, min(limit, 500))]
+
+
+@router.get("/runs/{run_id}", response_model=RunSummary)
+async def get_run(run_id: str):
+    run = await checkpoint_store.get_run(run_id) if checkpoint_store is not None else None
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return RunSummary(**run.to_dict())
+
+
+@router.post("/jobs/analyze", response_model=JobSummary)
+async def submit_analyze_job(request: AnalyzeJobRequest):
+    """提交仓库分析任务，立即返回任务 ID；进度与结果见 /api/jobs/{job_id}"""
+    job = await job_queue.submit("analyze", request.model_dump(exclude={"priority"}), request.priority)
+    return JobSummary(**job_queue.describe(job))
+
+
+@router.post("/jobs/generate_patch", response_model=JobSummary)
+async def submit_patch_job(request: GeneratePatchJobRequest):
+    """提交补丁生成任务；未指定 run_id 时以任务 ID 作为检查点 ID，服务重启后从检查点继续"""
+    job = await job_queue.submit("generate_patch", request.model_dump(exclude={"priority"}), request.priority)
+    return JobSummary(**job_queue.describe(job))
+
+
+async def _analyze_job(job_id: str, payload: dict, events: EventChannel) -> dict:
+    with stage_scope(events, "repo") as report:
+        response = await _analyze(AnalyzeRequest(**payload))
+        report.artifact = {"file_count": response.repo_summary.get("file_count"), "source": response.source}
+    return response.model_dump(mode="json")
+
+
+async def _patch_job(job_id: str, payload: dict, events: EventChannel) -> dict:
+    request = GeneratePatchRequest(**payload)
+    run_id = request.run_id or job_id
+    async with AsyncSessionLocal() as db:
+        run = await checkpoint_store.resumable_run(run_id, "patch") if checkpoint_store is not None else None
+        if run is not None:
+            # 重新排队的任务（服务重启）从检查点继续，已完成节点的 LLM 结果直接复用
+            response = await _resume_patch(run, db, events)
+            return response.model_dump(mode="json")
+
+        repo_path, _ = await asyncio.to_thread(_resolve_repo_path, request.repo_path, request.github_url)
+        if payload.get("request_message_id"):
+            # 在第一个检查点之前中断：会话与需求消息已在上次执行时写入，不再重复创建
+            conversation_id = request.conversation_id
+        else:
+            conversation_id = await _patch_conversation(db, request.conversation_id, request.feature_request)
+            message = await _add_patch_request(db, conversation_id, request.feature_request, repo_path)
+            await job_queue.update_payload(job_id, conversation_id=conversation_id, request_message_id=message.id)
+        response = await _run_patch(
+            request.model_copy(update={"run_id": run_id}), repo_path, conversation_id, db, events
+        )
+    return response.model_dump(mode="json")
+
+
+job_queue.register("analyze", _analyze_job)
+job_queue.register("generate_patch", _patch_job)
+
+
+async def _analyze(request: AnalyzeRequest) -> AnalyzeResponse:
+    # clone 与目录遍历都是阻塞 IO，放到线程中执行，不占用事件循环
+    repo_path, source = await asyncio.to_thread(_resolve_repo_path, request.repo_path, request.github_url)
+    summary = await asyncio.to_thread(repo_analyzer.analyze, repo_path, focus=request.focus)
+    return AnalyzeResponse(repo_summary=summary, repo_path=repo_path, source=source)
+
+
+async def _generate_patch(
+    request: GeneratePatchRequest,
+    db: AsyncSession,
+    events: EventChannel | None = None,
+) -> GeneratePatchResponse:
+    repo_path, _ = await asyncio.to_thread(_resolve_repo_path, request.repo_path, request.github_url)
+    conversation_id = await _patch_conversation(db, request.conversation_id, request.feature_request)
+    await _add_patch_request(db, conversation_id, request.feature_request, repo_path)
+    return await _run_patch(request, repo_path, conversation_id, db, events)
+
+
+async def _add_patch_request(db: AsyncSession, conversation_id: str, feature_request: str, repo_path: str):
+    return await ConversationService.add_message(
         db,
         conversation_id=conversation_id,
         role="user",
-        content=request.feature_request,
+        content=feature_request,
         meta_info={"repo_path": repo_path},
     )
 
+
+async def _run_patch(
+    request: GeneratePatchRequest,
+    repo_path: str,
+    conversation_id: str,
+    db: AsyncSession,
+    events: EventChannel | None,
+) -> GeneratePatchResponse:
     history = await ConversationService.get_conversation_history(db, conversation_id)
     mcp_context = mcp_service.build_context(
         question=request.feature_request,
@@ -67,8 +220,108 @@ async def generate_patch(request: GeneratePatchRequest, db: AsyncSession = Depen
         request=request.feature_request,
         repo_path=repo_path,
         mcp_context=mcp_context,
+        events=events,
+        per_file=request.per_file,
+        run_id=request.run_id,
+        run_context={"conversation_id": conversation_id},
+    )
+    return await _save_patch_result(db, conversation_id, result)
+
+
+async def _run_patch_batch(
+    request: BatchPatchRequest,
+    repo_path: str,
+    conversation_id: str,
+    db: AsyncSession,
+    events: EventChannel,
+) -> None:
+    started = time.perf_counter()
+    total = len(request.feature_requests) * request.candidates
+    repo_summary = await patch_orchestrator.analyze_repo(repo_path, events)
+
+    # 完整摘要可能很大（含重要文件内容）：批次消息与 batch_started 事件只带概要
+    overview = {"file_count": repo_summary["file_count"], "languages": repo_summary["languages"]}
+    await ConversationService.add_message(
+        db,
+        conversation_id=conversation_id,
+        role="user",
+        content="\n".join(f"{index}. {item}" for index, item in enumerate(request.feature_requests, 1)),
+        meta_info={"repo_path": repo_path, "batch": True, "candidates": request.candidates, "repo": overview},
+    )
+    events.publish("batch_started", conversation_id=conversation_id, total=total, repo=overview)
+
+    history = await ConversationService.get_conversation_history(db, conversation_id)
+    mcp_contexts = [
+        mcp_service.build_context(question=item, conversation_history=history, user_profile={})
+        for item in request.feature_requests
+    ]
+
+    succeeded = 0
+    async for item in patch_orchestrator.generate_batch(
+        request.feature_requests,
+        repo_path,
+        repo_summary,
+        mcp_contexts=mcp_contexts,
+        per_file=request.per_file,
+        candidates=request.candidates,
+        run_context={"conversation_id": conversation_id},
+    ):
+        header = {"index": item.index, "request": item.request, "candidate": item.candidate}
+        if item.result is None:
+            events.publish("patch_result", **header, status="failed", error=item.error)
+            continue
+
+        succeeded += 1
+        result = item.result
+        await ConversationService.add_message(
+            db,
+            conversation_id=conversation_id,
+            role="assistant",
+            content=result.patch,
+            meta_info={**header, "intent": result.intent, "architecture": result.architecture},
+        )
+        events.publish(
+            "patch_result",
+            **header,
+            status="ok",
+            patch=result.patch,
+            intent=result.intent,
+            architecture=result.architecture,
+            metadata={key: value for key, value in result.metadata.items() if key != "mcp_context"},
+        )
+
+    events.publish(
+        "batch_finished",
+        succeeded=succeeded,
+        failed=total - succeeded,
+        total_duration=round(time.perf_counter() - started, 4),
     )
 
+
+async def _patch_conversation(db: AsyncSession, conversation_id: str | None, title: str) -> str:
+    if conversation_id:
+        conversation = await ConversationService.get_active_conversation(db, conversation_id)
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        return conversation.id
+    conversation = await ConversationService.create_conversation(db, title=title[:50])
+    return conversation.id
+
+
+async def _resume_patch(
+    run: RunRecord,
+    db: AsyncSession,
+    events: EventChannel | None = None,
+) -> GeneratePatchResponse:
+    # 先检查恢复所需的上下文，避免重新执行 LLM 阶段后才失败
+    conversation_id = run.context.get("conversation_id")
+    if not conversation_id:
+        raise HTTPException(status_code=409, detail="Run has no conversation context and cannot be resumed")
+    result = await patch_orchestrator.resume(run.run_id, events)
+    return await _save_patch_result(db, conversation_id, result)
+
+
+async def _save_patch_result(db: AsyncSession, conversation_id: str, result: PatchResult) -> GeneratePatchResponse:
     await ConversationService.add_message(
         db,
         conversation_id=conversation_id,
@@ -87,6 +340,7 @@ async def generate_patch(request: GeneratePatchRequest, db: AsyncSession = Depen
         intent=result.intent,
         architecture=result.architecture,
         repo_summary=result.repo_summary,
+        metadata={key: value for key, value in result.metadata.items() if key != "mcp_context"},
     )
 
 
@@ -113,3 +367,7 @@ def _resolve_repo_path(repo_path: str | None, github_url: str | None) -> tuple[s
         return str(target_dir), "github_url"
 
     raise HTTPException(status_code=400, detail="repo_path or github_url is required")
+
+
+def _sse(payload: dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
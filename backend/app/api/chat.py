@@ -4,9 +4,11 @@ from __future__ import annotations
 
 import asyncio
 import json
+import logging
+from contextlib import suppress
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -18,22 +20,32 @@ from app.models.schemas import (
     ConversationSummary,
     MessageDTO,
 )
+from app.services.checkpoint_store import checkpoint_store
 from app.services.conversation_service import ConversationService
-from app.services.llm_service import LLMService
+from app.config import settings
+from app.services.event_channel import EventChannel
+from app.services.llm_registry import get_llm_service
 from app.services.mcp_service import MCPService
 from app.services.reasoning_orchestrator import ReasoningOrchestrator
 from app.services.user_profile_service import UserProfileService
 from app.services.v1_parity_pipeline import V1ParityPipeline
+from app.utils.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
-llm_service = LLMService()
+llm_service = get_llm_service()
 reasoning_orchestrator = ReasoningOrchestrator(llm_service)
 mcp_service = MCPService()
 v1_parity_pipeline = V1ParityPipeline(llm_service)
 
 
-async def _prepare_chat_result(request: ChatRequest, db: AsyncSession) -> dict[str, Any]:
+async def _prepare_chat_result(
+    request: ChatRequest,
+    db: AsyncSession,
+    events: EventChannel | None = None,
+) -> dict[str, Any]:
     conversation_id = request.conversation_id
     if conversation_id:
         conversation = await ConversationService.get_active_conversation(db, conversation_id)
@@ -58,48 +70,58 @@ async def _prepare_chat_result(request: ChatRequest, db: AsyncSession) -> dict[s
         user_profile=profile.preferences,
     )
 
-    if request.deep_thinking or request.web_search_enabled:
-        parity_result = await v1_parity_pipeline.run(
-            question=request.message,
-            conversation_history=history,
-            deep_thinking=request.deep_thinking,
-            web_search_enabled=request.web_search_enabled,
-        )
-        answer = parity_result.answer
-        strategy = parity_result.strategy
-        model = parity_result.model
-        confidence = parity_result.confidence
-        meta_info = {
-            "strategy": strategy,
-            "model": model,
-            "confidence": confidence,
-            "mcp": mcp_context,
-            **parity_result.metadata,
-        }
-        code_modifications = parity_result.code_modifications
-        suggestions = parity_result.suggestions
-    else:
-        reasoning_result = await reasoning_orchestrator.reason(
-            question=request.message,
-            conversation_history=history[-10:],
-            mcp_context=mcp_context,
-        )
-
-        answer = reasoning_result.answer
-        strategy = reasoning_result.strategy
-        model = reasoning_result.model
-        confidence = reasoning_result.confidence
-
-        meta_info = {
-            "strategy": strategy,
-            "model": model,
-            "confidence": confidence,
-            "mcp": mcp_context,
-        }
+    try:
+        if request.deep_thinking or request.web_search_enabled:
+            parity_result = await v1_parity_pipeline.run(
+                question=request.message,
+                conversation_history=history,
+                deep_thinking=request.deep_thinking,
+                web_search_enabled=request.web_search_enabled,
+                events=events,
+                latency_mode=request.latency_mode,
+                latency_budget=request.latency_budget,
+            )
+            answer = parity_result.answer
+            strategy = parity_result.strategy
+            model = parity_result.model
+            confidence = parity_result.confidence
+            meta_info = {
+                "strategy": strategy,
+                "model": model,
+                "confidence": confidence,
+                "mcp": mcp_context,
+                **parity_result.metadata,
+            }
+            code_modifications = parity_result.code_modifications
+            suggestions = parity_result.suggestions
+        else:
+            reasoning_result = await reasoning_orchestrator.reason(
+                question=request.message,
+                conversation_history=history[-10:],
+                mcp_context=mcp_context,
+                events=events,
+                run_id=request.run_id,
+                run_context={"conversation_id": conversation_id},
+            )
 
-        meta_info.update(reasoning_result.metadata)
-        code_modifications = []
-        suggestions = []
+            answer = reasoning_result.answer
+            strategy = reasoning_result.strategy
+            model = reasoning_result.model
+            confidence = reasoning_result.confidence
+
+            meta_info = {
+                "strategy": strategy,
+                "model": model,
+                "confidence": confidence,
+                "mcp": mcp_context,
+            }
+
+            meta_info.update(reasoning_result.metadata)
+            code_modifications = []
+            suggestions = []
+    except asyncio.CancelledError:
+        await _persist_partial_answer(db, conversation_id, events)
+        raise
 
     await UserProfileService.update_from_interaction(
         db,
@@ -142,36 +164,95 @@ async def send_message(request: ChatRequest, db: AsyncSession = Depends(get_db))
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/runs/{run_id}/resume", response_model=ChatResponse)
+async def resume_reasoning(run_id: str, db: AsyncSession = Depends(get_db)):
+    """从最后完成的节点继续中断的推理运行，并把答案写入原会话"""
+    run = await checkpoint_store.get_run(run_id) if checkpoint_store is not None else None
+    if run is None or run.graph != "reasoning":
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.resume_blocker:
+        raise HTTPException(status_code=409, detail=run.resume_blocker)
+    # 先检查恢复所需的上下文，避免重新执行 LLM 阶段后才失败
+    conversation_id = run.context.get("conversation_id")
+    if not conversation_id:
+        raise HTTPException(status_code=409, detail="Run has no conversation context and cannot be resumed")
+
+    try:
+        reasoning_result = await reasoning_orchestrator.resume(run_id)
+    except ValidationError as e:
+        # 检查之后另一个恢复请求已抢先开始执行
+        raise HTTPException(status_code=409, detail=e.message)
+    meta_info = {
+        "strategy": reasoning_result.strategy,
+        "model": reasoning_result.model,
+        "confidence": reasoning_result.confidence,
+        **reasoning_result.metadata,
+    }
+    assistant_message = await ConversationService.add_message(
+        db,
+        conversation_id=conversation_id,
+        role="assistant",
+        content=reasoning_result.answer,
+        meta_info=meta_info,
+    )
+    return ChatResponse(
+        message_id=assistant_message.id,
+        content=reasoning_result.answer,
+        conversation_id=conversation_id,
+        workflow_state={
+            "current_phase": reasoning_result.strategy,
+            "active_personas": [reasoning_result.model],
+            "phase_outputs": meta_info,
+        },
+        code_modifications=[],
+        suggestions=[],
+    )
+
+
 @router.post("/stream")
-async def stream_message(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+async def stream_message(
+    request: ChatRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(get_db),
+):
     try:
         async def event_generator():
-            task = asyncio.create_task(_prepare_chat_result(request, db))
-            yield f"data: {json.dumps({'type': 'status', 'content': '正在处理中...'}, ensure_ascii=False)}\n\n"
-            last_ping = asyncio.get_event_loop().time()
+            events = EventChannel()
+            task = asyncio.create_task(_prepare_chat_result(request, db, events=events))
+            task.add_done_callback(lambda _: events.close())
 
-            while not task.done():
-                now = asyncio.get_event_loop().time()
-                if now - last_ping >= 10:
-                    yield "data: {\"type\": \"ping\"}\n\n"
-                    last_ping = now
-                await asyncio.sleep(0.5)
+            # 客户端断开时取消生成任务，取消会沿 await 链传播到进行中的 httpx 请求
+            watcher = asyncio.create_task(_watch_disconnect(http_request))
+            watcher.add_done_callback(lambda w: w.cancelled() or task.cancel())
+            events.status("正在处理中...")
 
             try:
-                payload = await task
-            except Exception as exc:
-                error_payload = {"type": "error", "message": str(exc)}
-                yield f"data: {json.dumps(error_payload, ensure_ascii=False)}\n\n"
-                return
-
-            content = payload["content"]
-            chunk_size = 40
-            for i in range(0, len(content), chunk_size):
-                chunk = content[i:i + chunk_size]
-                yield f"data: {json.dumps({'type': 'chunk', 'content': chunk}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.01)
-
-            yield f"data: {json.dumps({'type': 'done', 'payload': payload}, ensure_ascii=False)}\n\n"
+                async for event in events.stream(idle_timeout=settings.SSE_KEEPALIVE_INTERVAL):
+                    if event is None:
+                        yield _sse({"type": "ping"})
+                        continue
+                    yield _sse(event.to_dict())
+
+                if task.cancelled():
+                    return
+
+                try:
+                    payload = await task
+                except Exception as exc:
+                    yield _sse({"type": "error", "message": str(exc)})
+                    return
+
+                # ReAct 等非流式路径：一次性下发完整答案
+                if not events.streamed_text and payload["content"]:
+                    yield _sse({"type": "chunk", "content": payload["content"]})
+
+                yield _sse({"type": "done", "payload": payload})
+            finally:
+                watcher.cancel()
+                if not task.done():
+                    task.cancel()
+                    with suppress(asyncio.CancelledError):
+                        await task
 
         return StreamingResponse(
             event_generator(),
@@ -188,6 +269,38 @@ async def stream_message(request: ChatRequest, db: AsyncSession = Depends(get_db
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _persist_partial_answer(
+    db: AsyncSession,
+    conversation_id: str,
+    events: EventChannel | None,
+) -> None:
+    """客户端断开导致生成被取消时，按 STREAM_DISCONNECT_POLICY 决定是否保存已输出的部分答案。"""
+    if settings.STREAM_DISCONNECT_POLICY != "persist_partial" or not events or not events.streamed_text:
+        logger.info("Chat generation cancelled for conversation %s; partial answer discarded", conversation_id)
+        return
+
+    await ConversationService.add_message(
+        db,
+        conversation_id=conversation_id,
+        role="assistant",
+        content=events.streamed_text,
+        meta_info={"partial": True, "cancelled": True},
+    )
+    logger.info("Chat generation cancelled for conversation %s; partial answer persisted", conversation_id)
+
+
+async def _watch_disconnect(http_request: Request) -> None:
+    """请求体已读取完毕，后续 receive() 只会在客户端断开时返回 http.disconnect。"""
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+def _sse(payload: dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
 @router.get("/conversations", response_model=list[ConversationSummary])
 async def list_conversations(db: AsyncSession = Depends(get_db)):
     conversations = await ConversationService.list_active_conversations(db)
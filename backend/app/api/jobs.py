@@ -0,0 +1,67 @@
+"""后台任务 API：查询状态与结果、SSE 订阅进度、取消任务。任务由各业务路由提交（如 /api/jobs/generate_patch）。"""
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.models.schemas import JobSummary
+from app.services.job_queue import TERMINAL_STATUSES, job_queue
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+
+@router.get("", response_model=list[JobSummary])
+async def list_jobs(status: str | None = None, limit: int = 50):
+    jobs = await job_queue.list(status=status, limit=min(limit, 500))
+    return [JobSummary(**job_queue.describe(job)) for job in jobs]
+
+
+@router.get("/{job_id}", response_model=JobSummary)
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobSummary(**job_queue.describe(job))
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """SSE：回放并持续推送任务的阶段事件，以 {"type": "job", "status": ...} 的终态事件结束"""
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_generator():
+        async for event in job_queue.follow(job_id, idle_timeout=settings.SSE_KEEPALIVE_INTERVAL):
+            if event is None:
+                yield _sse({"type": "ping"})
+                continue
+            yield _sse(event)
+            if event.get("type") == "job" and event.get("status") in TERMINAL_STATUSES:
+                return
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@router.delete("/{job_id}", response_model=JobSummary)
+async def cancel_job(job_id: str):
+    job = await job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobSummary(**job_queue.describe(job))
+
+
+def _sse(payload: dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
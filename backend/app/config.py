@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Any, List
 import os
 import json
 from pathlib import Path
@@ -50,7 +50,129 @@ class Settings(BaseSettings):
     WEB_SEARCH_ENABLED: bool = False
     TAVILY_API_KEY: str = ""
     TAVILY_MAX_RESULTS: int = 5
-    
+    TAVILY_API_BASE: str = "https://api.tavily.com"
+    TAVILY_TIMEOUT_SECONDS: float = 15.0
+    TAVILY_CACHE_TTL_SECONDS: float = 600.0  # 新鲜期
+    TAVILY_CACHE_STALE_SECONDS: float = 3600.0  # 新鲜期之后仍可先返回旧结果并后台刷新的时长
+    TAVILY_CACHE_MAX_ENTRIES: int = 500
+    TAVILY_CACHE_SQLITE_PATH: str = ""  # 留空则仅内存
+
+    # 上游 HTTP 连接池（LLM / DeepSeek 共享，长连接复用）
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP_READ_TIMEOUT: float = 300.0
+    HTTP_WRITE_TIMEOUT: float = 30.0
+    HTTP_POOL_TIMEOUT: float = 30.0
+    HTTP2_ENABLED: bool = False  # 需要安装 httpx[http2]
+
+    # LLM 响应缓存（内存 LRU + 可选 SQLite 持久层）
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL_SECONDS: float = 3600.0
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    LLM_CACHE_SQLITE_PATH: str = ""  # 例如 ./data/sqlite/llm_cache.db，留空则仅内存
+    LLM_SINGLEFLIGHT_ENABLED: bool = True  # 合并相同请求的并发调用
+
+    # LLM 按 deployment 限流调度（RPM/TPM 为 0 表示不限，仅遵循服务端限流头）
+    LLM_MAX_INFLIGHT_PER_DEPLOYMENT: int = 16
+    LLM_REQUESTS_PER_MINUTE: float = 0
+    LLM_TOKENS_PER_MINUTE: float = 0
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 60.0
+    LLM_RATE_LIMIT_MAX_RETRIES: int = 3
+
+    # 熔断器（按模型/deployment，滚动窗口错误率）
+    LLM_BREAKER_WINDOW_SECONDS: float = 60.0
+    LLM_BREAKER_MIN_REQUESTS: int = 5
+    LLM_BREAKER_ERROR_RATE: float = 0.5
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0
+
+    # 对冲请求（仅用于显式 hedge=True 的短调用）
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_PERCENTILE: float = 0.9  # 超过该分位延迟仍未返回则发出对冲请求
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # 延迟样本不足时不对冲
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 0.2
+    LLM_HEDGE_MAX_RATIO: float = 0.1  # 对冲请求数占主请求数的上限
+
+    # 多 endpoint 负载均衡：逻辑模型名 -> endpoint 列表（JSON），留空则使用上方 Azure 单 endpoint 配置
+    # 例如 {"gpt-5.1-chat": [{"name": "eastus", "base_url": "https://...", "api_key": "...", "deployment": "gpt-5.1-chat"},
+    #                        {"name": "deepseek", "provider": "openai", "base_url": "https://api.deepseek.com/v1", "api_key": "...", "deployment": "deepseek-chat"}]}
+    # 可选 "structured_output": json_schema | json_object | none，默认 Azure GPT 部署为 json_schema，其余为 none
+    LLM_ENDPOINTS: dict[str, list[dict[str, Any]]] = {}
+    LLM_ENDPOINT_EWMA_ALPHA: float = 0.2  # 延迟/错误率 EWMA 平滑系数
+    LLM_ENDPOINT_EXPLORE_RATIO: float = 0.05  # 偶尔把请求路由到次优 endpoint 以刷新其延迟估计
+
+    # JSON 阶段的约束输出：向支持的 endpoint 发送 response_format，输出不符合 schema 时带错误说明重试
+    LLM_STRUCTURED_OUTPUT_ENABLED: bool = True
+    LLM_JSON_MAX_RETRIES: int = 1
+
+    # 模型路由：关键词 -> 权重（留空使用内置默认表），命中权重和达到阈值时使用 CS_SPECIALIST_MODEL
+    MODEL_ROUTER_KEYWORDS: dict[str, float] = {}
+    MODEL_ROUTER_THRESHOLD: float = 1.0
+
+    # 问题复杂度本地分类器（置信度不足时回退 LLM 分类）
+    COMPLEXITY_CLASSIFIER_ENABLED: bool = True
+    COMPLEXITY_MODEL_PATH: str = "./data/models/complexity_classifier.json"
+    COMPLEXITY_LOG_PATH: str = ""  # 记录 LLM 分类结果作为训练数据（含原始问题），留空不记录
+    COMPLEXITY_LOG_MAX_BYTES: int = 50 * 1024 * 1024  # 日志超过该大小时轮转为 .1（只保留一份）
+    COMPLEXITY_CONFIDENCE_THRESHOLD: float = 0.85
+
+    # ReAct 上下文预算（token）
+    REACT_OBSERVATION_MAX_TOKENS: int = 800  # 单条观察结果写入上下文时的上限
+    REACT_STEP_TOKEN_BUDGET: int = 6000  # 每步发送给模型的上下文上限
+    REACT_COMPACT_OBSERVATION_TOKENS: int = 120  # 超出预算时早期观察结果压缩到的长度
+    REACT_MAX_ACTIONS_PER_STEP: int = 5  # 单步批量动作数上限
+    REACT_MAX_PARALLEL_ACTIONS: int = 3  # 单步内并发执行的动作数
+
+    # 工具执行器
+    TOOL_MAX_CONCURRENCY: int = 16  # 全进程同时执行的工具调用上限
+    TOOL_DEFAULT_TIMEOUT_SECONDS: float = 20.0
+    TOOL_MAX_RESULT_CHARS: int = 20000
+    TOOL_RESULT_CACHE_TTL_SECONDS: float = 300.0
+    TOOL_RESULT_CACHE_MAX_ENTRIES: int = 500
+
+    # 深度思考流水线的延迟预算：fast | balanced | thorough（thorough 不设截止时间，运行全部阶段）
+    LATENCY_DEFAULT_MODE: str = "thorough"
+    LATENCY_MODE_BUDGETS: dict[str, float] = {"fast": 20.0, "balanced": 60.0}  # 各模式的默认预算（秒）
+    LATENCY_MODE_MAX_TOKENS: dict[str, int] = {"fast": 800, "balanced": 2000}  # 各模式单阶段输出 token 上限
+    LATENCY_FAST_MODEL: str = ""  # fast 模式统一使用的模型，留空使用 DEFAULT_MODEL
+    # 各阶段耗时的先验估计（秒），有观测数据后按 EWMA 更新
+    LATENCY_STAGE_PRIORS: dict[str, float] = {
+        "understanding": 3.0,
+        "search": 3.0,
+        "initial_analysis": 15.0,
+        "reflection": 15.0,
+        "detailed_analysis": 10.0,
+        "code_generation": 20.0,
+    }
+    LATENCY_SHRINK_RATIO: float = 0.5  # 预算不足以完整运行时，按该比例缩减输出 token 后再尝试
+
+    # 按文件并发生成补丁（per_file 模式）
+    PATCH_MAX_FILES: int = 20  # 架构阶段给出的目标文件数上限
+    PATCH_FILE_CONCURRENCY: int = 4
+    PATCH_FILE_MAX_RETRIES: int = 1  # 只重试未通过解析或 git apply --check 的文件
+    PATCH_FILE_CONTEXT_CHARS: int = 12000  # 提示词中附带的单个文件当前内容上限
+    PATCH_APPLY_CHECK_TIMEOUT_SECONDS: float = 20.0
+
+    # 批量补丁生成（/api/generate_patch/batch）：共享一次仓库分析
+    PATCH_BATCH_MAX_ITEMS: int = 20  # 需求数 × 候选数上限
+    PATCH_BATCH_CONCURRENCY: int = 3  # 同时运行的补丁工作流数
+
+    # LangGraph 工作流检查点（按运行 ID 恢复中断的补丁生成/推理），留空则不启用
+    CHECKPOINT_SQLITE_PATH: str = "./data/sqlite/checkpoints.db"
+    CHECKPOINT_MAX_RUNS: int = 500  # 超出后淘汰最久未更新的运行
+    CHECKPOINT_TTL_SECONDS: float = 7 * 24 * 3600.0
+
+    # 后台任务队列（/api/jobs），任务状态保存在 DATABASE_URL 的 jobs 表中
+    JOB_WORKERS: int = 2  # 同时执行的任务数
+    JOB_EVENT_HISTORY: int = 500  # 每个任务在内存中保留的进度事件数，供 SSE 订阅者回放
+    JOB_RETENTION_SECONDS: float = 7 * 24 * 3600.0  # 已结束任务在启动时超过该时长即清理
+
+    # SSE 流式响应
+    SSE_KEEPALIVE_INTERVAL: float = 10.0  # 空闲超过该秒数才发送 ping
+    STREAM_DISCONNECT_POLICY: str = "discard"  # 客户端断开时: discard | persist_partial
+
     class Config:
         env_file = str(ENV_FILE)
         env_file_encoding = 'utf-8'
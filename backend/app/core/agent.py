@@ -1,17 +1,57 @@
+import asyncio
 import json
 import re
-from typing import Any
+import time
+from typing import Any, AsyncIterator
 
 from app.config import settings
-from app.services.llm_service import LLMService
-from app.tools.tavily_search import tavily_search
+from app.core.react_context import ReactContext
+from app.services.complexity_classifier import get_complexity_classifier, log_decision
+from app.services.llm_registry import get_llm_service
+from app.services.llm_service import LLMService, TokenCallback
+from app.tools.registry import tool_executor, tool_registry
+
+
+# 流式输出时先缓冲开头若干字符，以便剥离 "Final Answer:" 等前缀
+_STREAM_PREFIX_HOLD = 16
+_THINKING_BLOCK_RE = re.compile(r'\*\*思考过程：?\*\*[\s\S]*?\*\*最终答案：?\*\*', re.IGNORECASE)
+_FINAL_PREFIX_RE = re.compile(r'^(Final Answer:|最终答案：)\s*', re.IGNORECASE)
+
+_REACT_SYSTEM_PROMPT_TEMPLATE = """
+You are an AI agent using ReAct (Reason + Act) framework.
+You can think step by step, call tools, observe results, and continue reasoning.
+
+Available tools:
+{tools}
+
+Usage:
+Action: {{
+    "tool": "<tool name>",
+    "query": "<the query>"
+}}
+
+If several independent lookups are needed, emit them together as a JSON list in one
+Action; they run in parallel and their observations come back numbered in the same order:
+Action: [
+    {{"tool": "<tool name>", "query": "<first query>"}},
+    {{"tool": "<tool name>", "query": "<second query>"}}
+]
+
+When you have enough information, respond with:
+Final Answer: <answer>
+""".strip()
+
+
+def build_react_system_prompt() -> str:
+    """ReAct 的固定 system prompt，工具列表由注册表生成"""
+    return _REACT_SYSTEM_PROMPT_TEMPLATE.format(tools=tool_registry.describe())
 
 
 class Agent:
     """智能体：支持 CoT（简单问题）和 ReAct（复杂问题）"""
 
-    def __init__(self, max_react_steps: int = 20):
-        self.llm = LLMService()
+    def __init__(self, llm_service: LLMService | None = None, max_react_steps: int = 20):
+        self.llm = llm_service or get_llm_service()
         self.max_react_steps = max_react_steps
 
     async def run(self, user_message: str, conversation_history: list, mcp_context: dict[str, Any] | None = None):
@@ -22,6 +62,14 @@ class Agent:
         return await self._cot_reasoning(user_message, conversation_history, mcp_context)
 
     async def _is_complex_question(self, user_message: str, mcp_context: dict[str, Any] | None = None) -> bool:
+        """先用本地分类器判断，置信度不足时才调用 LLM；LLM 的判断记录下来作为训练数据"""
+        if settings.COMPLEXITY_CLASSIFIER_ENABLED:
+            prediction = get_complexity_classifier().predict(user_message)
+            if prediction is not None and prediction[1] >= settings.COMPLEXITY_CONFIDENCE_THRESHOLD:
+                return prediction[0]
+
+        # MCP 上下文只给出摘要，避免把整个上下文序列化进分类 prompt
+        context_keys = ", ".join(sorted((mcp_context or {}).keys())) or "none"
         prompt = f"""
 You are a classifier. Determine whether the user question requires multi-step reasoning,
 external knowledge, or tool use.
@@ -29,15 +77,31 @@ external knowledge, or tool use.
 User question:
 {user_message}
 
-MCP context:
-{json.dumps(mcp_context or {}, ensure_ascii=False)}
+Available MCP context: {context_keys}
 
 Is this a complex question? Answer with "yes" or "no" only.
 """
-        result = await self.llm.generate_simple(prompt, model=settings.DEFAULT_MODEL)
-        return "yes" in result.lower()
-
-    async def _cot_reasoning(self, user_message: str, history: list, mcp_context: dict[str, Any] | None = None):
+        # 记录训练数据时不走响应缓存：缓存命中会以约 0ms 的延迟重复记录同一样本
+        collecting = bool(settings.COMPLEXITY_LOG_PATH) and self.llm.configured
+        started = time.perf_counter()
+        result = await self.llm.generate_simple(
+            prompt, model=settings.DEFAULT_MODEL, cache=not collecting, hedge=True
+        )
+        is_complex = "yes" in result.lower()
+        # 未配置 LLM 时返回的是占位回复，不能作为标签
+        if collecting:
+            await asyncio.to_thread(
+                log_decision, user_message, is_complex, "llm", (time.perf_counter() - started) * 1000
+            )
+        return is_complex
+
+    async def _cot_reasoning(
+        self,
+        user_message: str,
+        history: list,
+        mcp_context: dict[str, Any] | None = None,
+        on_token: TokenCallback | None = None,
+    ):
         model = self.llm.get_recommended_model(user_message)
 
         system_prompt = f"""
@@ -47,112 +111,162 @@ MCP context (JSON):
 {json.dumps(mcp_context or {}, ensure_ascii=False)}
 """
 
-        result = await self.llm.generate_response(
-            system_prompt=system_prompt,
-            user_message=user_message,
-            conversation_history=history,
-            model=model,
-        )
-
-        content = result["content"].strip()
-        content = re.sub(r'\*\*思考过程：?\*\*[\s\S]*?\*\*最终答案：?\*\*', '', content, flags=re.IGNORECASE).strip()
-        content = re.sub(r'^(Final Answer:|最终答案：)\s*', '', content, flags=re.IGNORECASE).strip()
-
-        return content, []
+        if on_token is None:
+            result = await self.llm.generate_response(
+                system_prompt=system_prompt,
+                user_message=user_message,
+                conversation_history=history,
+                model=model,
+            )
+            content = result["content"]
+        else:
+            content = await self._stream_answer(
+                self.llm.stream_response(
+                    system_prompt=system_prompt,
+                    user_message=user_message,
+                    conversation_history=history,
+                    model=model,
+                ),
+                on_token,
+            )
+
+        return self._clean_answer(content), []
+
+    @staticmethod
+    def _clean_answer(content: str) -> str:
+        content = _THINKING_BLOCK_RE.sub('', content.strip()).strip()
+        return _FINAL_PREFIX_RE.sub('', content).strip()
+
+    async def _stream_answer(self, deltas: AsyncIterator[str], on_token: TokenCallback) -> str:
+        """转发增量文本；开头缓冲到能判断是否带思考过程/最终答案前缀后再放行。"""
+        raw = ""
+        released = False
+        async for delta in deltas:
+            raw += delta
+            if released:
+                await on_token(delta)
+                continue
+
+            head = raw.lstrip()
+            if head.startswith("**思考过程"):
+                released = _THINKING_BLOCK_RE.search(raw) is not None
+            else:
+                released = len(head) >= _STREAM_PREFIX_HOLD
+
+            if released:
+                head = _FINAL_PREFIX_RE.sub('', _THINKING_BLOCK_RE.sub('', head, count=1).lstrip())
+                if head:
+                    await on_token(head)
+
+        if not released:
+            cleaned = self._clean_answer(raw)
+            if cleaned:
+                await on_token(cleaned)
+        return raw
 
     async def _react_reasoning(self, user_message: str, history: list, mcp_context: dict[str, Any] | None = None):
         model = self.llm.get_recommended_model(user_message)
 
-        prompt = self._build_react_prompt(user_message, mcp_context)
+        context = self._build_react_context(user_message, mcp_context)
         used_tools = False
 
         for step_num in range(self.max_react_steps):
-            result = await self.llm.generate_simple(prompt, model=model)
-            result = result.strip()
+            # ReAct 步骤依赖实时工具结果，不走响应缓存
+            response = await self.llm.generate_messages(context.messages(), model=model, cache=False)
+            result = response["content"].strip()
 
             if "Final Answer:" in result:
                 final_answer = result.split("Final Answer:", 1)[1].strip()
                 return final_answer, used_tools
 
+            context.add_step(result)
             if "Action:" in result:
-                action_data = self._extract_action(result)
+                actions = self._extract_actions(result)
 
-                if action_data is None:
-                    prompt += (
-                        f"\n{result}\n\n[ERROR] Invalid action format. Please use exact JSON format:\n"
-                        "Action: {\n    \"tool\": \"search\",\n    \"query\": \"your query\"\n}\n\nThought: "
+                if not actions:
+                    context.add_instruction(
+                        "[ERROR] Invalid action format. Please use exact JSON format:\n"
+                        "Action: {\n    \"tool\": \"<tool name>\",\n    \"query\": \"your query\"\n}"
                     )
                     continue
 
-                if action_data["tool"] == "search":
-                    query = action_data["query"]
-                    search_result = tavily_search(query)
-                    used_tools = True
-
-                    prompt += f"\nObservation: {search_result}\n\nThought: "
-                    continue
+                context.add_observations(await self._run_actions(actions))
+                used_tools = True
+                continue
 
-            prompt += f"\n{result}\n"
+            context.add_instruction("Continue with the next Thought and Action, or give the Final Answer.")
 
-        summary_prompt = (
-            prompt
-            + "\n\n你已经进行了多轮推理。现在请基于已有 Thought/Observation 直接给出最终答案，"
-            + "不再调用工具，格式必须是: Final Answer: <answer>"
+        context.add_instruction(
+            "你已经进行了多轮推理。现在请基于已有 Thought/Observation 直接给出最终答案，"
+            "不再调用工具，格式必须是: Final Answer: <answer>"
         )
-        summary_result = (await self.llm.generate_simple(summary_prompt, model=model)).strip()
+        summary_response = await self.llm.generate_messages(context.messages(), model=model, cache=False)
+        summary_result = summary_response["content"].strip()
         if "Final Answer:" in summary_result:
             return summary_result.split("Final Answer:", 1)[1].strip(), used_tools
 
         return summary_result or "抱歉，我暂时无法完成该问题。", used_tools
 
-    def _extract_action(self, text: str) -> dict | None:
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', text, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except Exception:
-                pass
-
-        json_match = re.search(r'Action:\s*(\{[^}]+\})', text, re.DOTALL)
-        if json_match:
+    async def _run_actions(self, actions: list[dict[str, Any]]) -> list[str]:
+        """并发执行一批动作（单步并发上限，超时由工具执行器控制），按原顺序返回观察结果"""
+        limit = settings.REACT_MAX_ACTIONS_PER_STEP
+        semaphore = asyncio.Semaphore(settings.REACT_MAX_PARALLEL_ACTIONS)
+
+        async def run(action: dict[str, Any]) -> str:
+            query = str(action.get("query", ""))
+            if not query:
+                return f"[ERROR] Missing query: {json.dumps(action, ensure_ascii=False)}"
+            async with semaphore:
+                result = await tool_executor.run(str(action.get("tool", "")), query)
+            return result.output
+
+        observations = list(await asyncio.gather(*(run(action) for action in actions[:limit])))
+        if len(actions) > limit:
+            observations.append(f"[ERROR] Only the first {limit} actions per step are executed.")
+        return observations
+
+    def _extract_actions(self, text: str) -> list[dict[str, Any]]:
+        """解析 Action：单个 JSON 对象或 JSON 列表（批量动作）"""
+        candidates = [m.group(1) for m in re.finditer(r'```(?:json)?\s*([\[{].*?[\]}])\s*```', text, re.DOTALL)]
+        action_pos = text.find("Action:")
+        if action_pos != -1:
+            candidates.append(text[action_pos + len("Action:"):].lstrip())
+
+        decoder = json.JSONDecoder()
+        for candidate in candidates:
             try:
-                return json.loads(json_match.group(1))
-            except Exception:
-                pass
+                data, _ = decoder.raw_decode(candidate)
+            except ValueError:
+                continue
+            items = data if isinstance(data, list) else [data]
+            actions = [item for item in items if isinstance(item, dict) and "tool" in item]
+            if actions:
+                return actions
 
         tool_match = re.search(r'"tool"\s*:\s*"([^"]+)"', text)
         query_match = re.search(r'"query"\s*:\s*"([^"]+)"', text)
 
         if tool_match and query_match:
-            return {
+            return [{
                 "tool": tool_match.group(1),
                 "query": query_match.group(1),
-            }
+            }]
 
-        return None
+        return []
 
-    def _build_react_prompt(self, user_input: str, mcp_context: dict[str, Any] | None = None):
-        return f"""
-You are an AI agent using ReAct (Reason + Act) framework.
-You can think step by step, call tools, observe results, and continue reasoning.
-
-MCP context (JSON):
+    def _build_react_context(self, user_input: str, mcp_context: dict[str, Any] | None = None) -> ReactContext:
+        # 固定说明放在 system 中，与具体问题无关，便于上游复用前缀缓存
+        question_prompt = f"""MCP context (JSON):
 {json.dumps(mcp_context or {}, ensure_ascii=False)}
 
-Available tool:
-1. tavily_search: Search the web for up-to-date information.
-
-Usage:
-Action: {{
-    "tool": "search",
-    "query": "<the query>"
-}}
-
-When you have enough information, respond with:
-Final Answer: <answer>
-
 User question:
 {user_input}
 
-Thought:
-"""
+Thought:"""
+        return ReactContext(
+            system_prompt=build_react_system_prompt(),
+            question_prompt=question_prompt,
+            observation_max_tokens=settings.REACT_OBSERVATION_MAX_TOKENS,
+            step_token_budget=settings.REACT_STEP_TOKEN_BUDGET,
+            compact_observation_tokens=settings.REACT_COMPACT_OBSERVATION_TOKENS,
+        )
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Literal
+
+from app.utils.tokens import count_message_tokens, truncate_to_tokens
+
+
+@dataclass
+class _Turn:
+    role: Literal["assistant", "user"]
+    content: str
+    # 观察结果可在超出预算时被压缩；模型输出与格式纠错提示保持原样
+    observation: bool = False
+    compacted: bool = False
+
+
+@dataclass
+class ReactContext:
+    """ReAct 的结构化消息上下文。
+
+    system（固定的 ReAct 说明与工具列表）在所有问题间保持不变，作为可复用的稳定前缀；
+    其后是本次问题，再依次追加每步的模型输出与观察结果。单条观察写入时先截断，
+    整体超出每步 token 预算时，从最早的观察开始压缩，仍超出则丢弃最早的完整步骤。
+    """
+
+    system_prompt: str
+    question_prompt: str
+    observation_max_tokens: int
+    step_token_budget: int
+    compact_observation_tokens: int
+    keep_recent_turns: int = 4
+    _turns: list[_Turn] = field(default_factory=list)
+
+    def add_step(self, output: str) -> None:
+        self._turns.append(_Turn("assistant", output))
+
+    def add_observation(self, observation: str) -> None:
+        content = truncate_to_tokens(observation, self.observation_max_tokens)
+        self._turns.append(_Turn("user", f"Observation: {content}", observation=True))
+
+    def add_observations(self, observations: list[str]) -> None:
+        """批量动作的观察结果按顺序编号合并为一条，单条上限按数量均分"""
+        if len(observations) == 1:
+            self.add_observation(observations[0])
+            return
+        per_item = max(1, self.observation_max_tokens // max(len(observations), 1))
+        merged = "\n\n".join(
+            f"[{index}] {truncate_to_tokens(text, per_item)}" for index, text in enumerate(observations, 1)
+        )
+        self._turns.append(_Turn("user", f"Observation: {merged}", observation=True))
+
+    def add_instruction(self, text: str) -> None:
+        self._turns.append(_Turn("user", text))
+
+    def messages(self) -> list[dict[str, str]]:
+        self._fit_budget()
+        return self._render()
+
+    def token_count(self) -> int:
+        return count_message_tokens(self._render())
+
+    def _render(self) -> list[dict[str, str]]:
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": self.question_prompt},
+        ]
+        messages.extend({"role": turn.role, "content": turn.content} for turn in self._turns)
+        return messages
+
+    def _fit_budget(self) -> None:
+        if self.token_count() <= self.step_token_budget:
+            return
+
+        protected = max(0, len(self._turns) - self.keep_recent_turns)
+        for turn in self._turns[:protected]:
+            if turn.observation and not turn.compacted:
+                turn.content = truncate_to_tokens(turn.content, self.compact_observation_tokens)
+                turn.compacted = True
+                if self.token_count() <= self.step_token_budget:
+                    return
+
+        # 仍超出：成对丢弃最早的 (模型输出, 观察) 步骤，保留稳定前缀与最近步骤
+        while len(self._turns) > self.keep_recent_turns and self.token_count() > self.step_token_budget:
+            del self._turns[:2]
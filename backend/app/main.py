@@ -5,7 +5,12 @@ from contextlib import asynccontextmanager
 
 from app.config import settings
 from app.models.database import init_db
-from app.api import analysis, chat
+from app.api import analysis, chat, jobs
+from app.services.checkpoint_store import checkpoint_store
+from app.services.job_queue import job_queue
+from app.services.llm_registry import get_llm_service
+from app.tools.registry import tool_executor
+from app.utils.http_client import http_clients
 from app.utils.startup_check import check_environment
 from app.middleware.error_handler import error_handler_middleware
 import logging
@@ -31,10 +36,18 @@ async def lifespan(app: FastAPI):
     logger.info("Initializing database...")
     await init_db()
     logger.info("Database initialized")
+
+    # 初始化上游 HTTP 连接池
+    await http_clients.startup([*get_llm_service().endpoint_base_urls(), settings.DEEPSEEK_API_BASE])
+
+    # 启动后台任务 worker（依赖数据库与连接池），未完成的任务重新排队
+    await job_queue.start()
     
     yield
     
-    # 关闭时清理
+    # 关闭时清理：运行中的任务保持 running，下次启动时继续
+    await job_queue.stop()
+    await http_clients.aclose()
     logger.info("Application shutdown")
 
 app = FastAPI(
@@ -59,6 +72,7 @@ app.add_middleware(
 # 注册路由
 app.include_router(chat.router)
 app.include_router(analysis.router)
+app.include_router(jobs.router)
 
 @app.get("/")
 async def root():
@@ -71,15 +85,21 @@ async def root():
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
-    from app.services.llm_service import LLMService
+    from app.services.llm_registry import get_deepseek_service
     
-    llm_service = LLMService()
+    llm_service = get_llm_service()
     stats = llm_service.get_stats()
     
     return {
         "status": "healthy",
         "llm_configured": llm_service._configured,
+        "llm_endpoints": stats["endpoints"],
         "llm_stats": stats,
+        "deepseek_stats": get_deepseek_service().get_stats(),
+        "http_pool": http_clients.get_stats(),
+        "tools": tool_executor.get_stats(),
+        "jobs": job_queue.get_stats(),
+        "checkpoints": checkpoint_store.get_stats() if checkpoint_store is not None else {"enabled": False},
         "database": "connected"
     }
 
@@ -2,7 +2,7 @@ from datetime import datetime
 from pathlib import Path
 import sqlite3
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, JSON, String, Text
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, JSON, String, Text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 
@@ -62,6 +62,23 @@ class Message(Base):
     conversation = relationship("Conversation", back_populates="messages")
 
 
+class Job(Base):
+    """后台任务（补丁生成 / 仓库分析），服务重启后未完成的任务重新排队"""
+
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, index=True)  # queued | running | succeeded | failed | cancelled
+    priority = Column(Integer, nullable=False, default=0)  # 越大越先执行
+    payload = Column(JSON, default=dict)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=False, default="")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from pydantic import BaseModel, Field
-from typing import Any, Optional
+from typing import Any, Literal, Optional
 
 # -----------------------------
 # Chat 请求
@@ -11,6 +11,11 @@ class ChatRequest(BaseModel):
     conversation_id: Optional[str] = None
     deep_thinking: bool = False
     web_search_enabled: bool = False
+    # 深度思考/搜索流水线的延迟预算：未指定时使用 LATENCY_DEFAULT_MODE，latency_budget 覆盖模式的默认秒数
+    latency_mode: Optional[Literal["fast", "balanced", "thorough"]] = None
+    latency_budget: Optional[float] = Field(default=None, gt=0)
+    # 推理运行的检查点 ID：由客户端指定时，请求中断后可用同一 ID 恢复
+    run_id: Optional[str] = Field(default=None, max_length=64)
 
 
 # -----------------------------
@@ -70,6 +75,22 @@ class GeneratePatchRequest(BaseModel):
     github_url: Optional[str] = None
     feature_request: str
     conversation_id: Optional[str] = None
+    # 按文件并发生成并校验补丁，只重试失败的文件
+    per_file: bool = False
+    # 检查点 ID：由客户端指定时，请求超时或服务重启后可用同一 ID 恢复，未指定时见 metadata["run_id"]
+    run_id: Optional[str] = Field(default=None, max_length=64)
+
+
+class BatchPatchRequest(BaseModel):
+    """同一仓库的多个需求：仓库只分析一次，各需求的补丁并发生成并以 SSE 逐条返回"""
+
+    repo_path: Optional[str] = None
+    github_url: Optional[str] = None
+    feature_requests: list[str] = Field(min_length=1)
+    conversation_id: Optional[str] = None
+    # 每个需求生成的候选补丁数
+    candidates: int = Field(default=1, ge=1, le=5)
+    per_file: bool = False
 
 
 class GeneratePatchResponse(BaseModel):
@@ -78,3 +99,38 @@ class GeneratePatchResponse(BaseModel):
     intent: dict[str, Any]
     architecture: str
     repo_summary: dict[str, Any]
+    metadata: dict[str, Any] = Field(default_factory=dict)
+
+
+class RunSummary(BaseModel):
+    run_id: str
+    graph: str
+    status: str
+    context: dict[str, Any] = Field(default_factory=dict)
+    error: str = ""
+    created_at: float
+    updated_at: float
+    resumable: bool = False
+
+
+# -----------------------------
+# 后台任务
+# -----------------------------
+class AnalyzeJobRequest(AnalyzeRequest):
+    priority: int = Field(default=0, ge=-100, le=100)  # 越大越先执行
+
+
+class GeneratePatchJobRequest(GeneratePatchRequest):
+    priority: int = Field(default=0, ge=-100, le=100)
+
+
+class JobSummary(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    priority: int
+    error: str = ""
+    result: Optional[dict[str, Any]] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
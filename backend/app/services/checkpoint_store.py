@@ -0,0 +1,500 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import zlib
+from collections.abc import AsyncIterator, Iterator, Sequence
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Literal
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+
+from app.config import settings
+from app.utils.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+RunStatus = Literal["running", "failed", "completed"]
+
+# 本进程内正在执行的运行；执行中与中断的运行在库中同为 running，靠它区分，避免同一 thread 被并发执行
+_active_runs: set[str] = set()
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS runs ("
+    "run_id TEXT PRIMARY KEY, graph TEXT NOT NULL, status TEXT NOT NULL, context TEXT NOT NULL, "
+    "error TEXT NOT NULL DEFAULT '', created_at REAL NOT NULL, updated_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS runs_updated_at ON runs (updated_at)",
+    "CREATE TABLE IF NOT EXISTS checkpoints ("
+    "run_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, parent_id TEXT, "
+    "type TEXT NOT NULL, checkpoint BLOB NOT NULL, metadata TEXT NOT NULL, "
+    "PRIMARY KEY (run_id, checkpoint_ns))",
+    "CREATE TABLE IF NOT EXISTS writes ("
+    "run_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL, "
+    "idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT NOT NULL, value BLOB NOT NULL, "
+    "task_path TEXT NOT NULL DEFAULT '', "
+    "PRIMARY KEY (run_id, checkpoint_ns, checkpoint_id, task_id, idx))",
+)
+
+_RUN_COLUMNS = (
+    "SELECT run_id, graph, status, context, error, created_at, updated_at, "
+    "EXISTS (SELECT 1 FROM checkpoints WHERE checkpoints.run_id = runs.run_id) FROM runs"
+)
+
+
+@dataclass
+class RunRecord:
+    run_id: str
+    graph: str
+    status: RunStatus
+    context: dict[str, Any]
+    error: str
+    created_at: float
+    updated_at: float
+    checkpointed: bool = False
+    active: bool = False
+
+    @property
+    def resume_blocker(self) -> str:
+        """不能恢复的原因；可恢复时为空字符串"""
+        if self.status == "completed":
+            return "Run already completed"
+        if self.active:
+            return "Run is currently executing"
+        if not self.checkpointed:
+            # 在第一个检查点之前中断的运行只能重新开始
+            return "Run has no checkpoint to resume from"
+        return ""
+
+    @property
+    def resumable(self) -> bool:
+        return not self.resume_blocker
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "resumable": self.resumable}
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """LangGraph 检查点的本地 SQLite 存储，thread_id 即运行 ID（run_id）。
+
+    为保持紧凑，每个运行只保留最新的检查点及其 pending writes（并发节点中已完成者的输出），
+    这已足够从最后一个完成的节点恢复；检查点以 zlib 压缩存储。
+    运行完成后删除检查点只保留状态行，超过 TTL 或超出数量上限的旧运行整体淘汰。
+    """
+
+    def __init__(self, path: str, *, max_runs: int, ttl_seconds: float) -> None:
+        super().__init__()
+        self._path = Path(path)
+        self._max_runs = max_runs
+        self._ttl_seconds = ttl_seconds
+        self._ready = False
+        self._evictions = 0
+
+    # ---- 运行状态 ----
+
+    async def start_run(self, run_id: str, graph: str, context: dict[str, Any] | None = None) -> None:
+        """登记新运行（已存在的同名运行会被清空）；context 为恢复时调用方需要的附加信息（如会话 ID）"""
+        if run_id in _active_runs:
+            raise ValidationError(f"运行正在执行: {run_id}", field="run_id")
+        await asyncio.to_thread(self._start_run, run_id, graph, context or {})
+
+    async def finish_run(self, run_id: str) -> None:
+        """运行完成：删除检查点，仅保留状态行"""
+        await asyncio.to_thread(self._finish_run, run_id)
+
+    async def fail_run(self, run_id: str, error: str) -> None:
+        await asyncio.to_thread(self._update_run, run_id, "failed", error)
+
+    async def get_run(self, run_id: str) -> RunRecord | None:
+        return await asyncio.to_thread(self._get_run, run_id)
+
+    async def resumable_run(self, run_id: str, graph: str) -> RunRecord | None:
+        """返回可恢复的运行：属于该工作流、尚未完成、未在执行且已写入检查点"""
+        run = await self.get_run(run_id)
+        if run is None or run.graph != graph or not run.resumable:
+            return None
+        return run
+
+    async def list_runs(self, graph: str | None = None, limit: int = 50) -> list[RunRecord]:
+        return await asyncio.to_thread(self._list_runs, graph, limit)
+
+    def get_stats(self) -> dict[str, Any]:
+        try:
+            conn = self._connect()
+            try:
+                statuses = dict(conn.execute("SELECT status, COUNT(*) FROM runs GROUP BY status").fetchall())
+                checkpoint_bytes = conn.execute(
+                    "SELECT COALESCE(SUM(LENGTH(checkpoint)), 0) FROM checkpoints"
+                ).fetchone()[0]
+                write_bytes = conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error as exc:
+            return {"error": str(exc)}
+        return {
+            "runs": statuses,
+            "stored_bytes": checkpoint_bytes + write_bytes,
+            "evictions": self._evictions,
+            "max_runs": self._max_runs,
+            "ttl_seconds": self._ttl_seconds,
+        }
+
+    # ---- BaseCheckpointSaver ----
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        run_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT checkpoint_id, parent_id, type, checkpoint, metadata FROM checkpoints "
+                "WHERE run_id = ? AND checkpoint_ns = ?",
+                (run_id, checkpoint_ns),
+            ).fetchone()
+            if row is None:
+                return None
+            checkpoint_id, parent_id, type_, payload, metadata = row
+            # 只保留最新检查点，请求更早的检查点时视为不存在
+            requested_id = get_checkpoint_id(config)
+            if requested_id and requested_id != checkpoint_id:
+                return None
+            writes = conn.execute(
+                "SELECT task_id, channel, type, value FROM writes "
+                "WHERE run_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+                (run_id, checkpoint_ns, checkpoint_id),
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return CheckpointTuple(
+            config=self._config(run_id, checkpoint_ns, checkpoint_id),
+            checkpoint=self.serde.loads_typed((type_, zlib.decompress(payload))),
+            metadata=json.loads(metadata),
+            parent_config=self._config(run_id, checkpoint_ns, parent_id) if parent_id else None,
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, zlib.decompress(value))))
+                for task_id, channel, value_type, value in writes
+            ],
+        )
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config is not None:
+            run_ids = [config["configurable"]["thread_id"]]
+        else:
+            conn = self._connect()
+            try:
+                run_ids = [row[0] for row in conn.execute("SELECT DISTINCT run_id FROM checkpoints")]
+            finally:
+                conn.close()
+
+        before_id = get_checkpoint_id(before) if before else None
+        for run_id in run_ids:
+            if limit is not None and limit <= 0:
+                return
+            item = self.get_tuple(config or {"configurable": {"thread_id": run_id}})
+            if item is None:
+                continue
+            if before_id and item.config["configurable"]["checkpoint_id"] >= before_id:
+                continue
+            if filter and any(item.metadata.get(key) != value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        run_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, payload = self.serde.dumps_typed(checkpoint)
+        conn = self._connect()
+        try:
+            # aput 在线程中执行，可能乱序落盘；检查点 ID 按时间有序，只允许更新的检查点覆盖
+            conn.execute(
+                "INSERT INTO checkpoints "
+                "(run_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, checkpoint_ns) DO UPDATE SET "
+                "checkpoint_id = excluded.checkpoint_id, parent_id = excluded.parent_id, type = excluded.type, "
+                "checkpoint = excluded.checkpoint, metadata = excluded.metadata "
+                "WHERE excluded.checkpoint_id > checkpoints.checkpoint_id",
+                (
+                    run_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    zlib.compress(payload),
+                    json.dumps(get_serializable_checkpoint_metadata(config, metadata), default=str),
+                ),
+            )
+            # 更早检查点的 pending writes 已并入新检查点
+            conn.execute(
+                "DELETE FROM writes WHERE run_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (run_id, checkpoint_ns, checkpoint["id"]),
+            )
+            conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (time.time(), run_id))
+            conn.commit()
+        finally:
+            conn.close()
+        return self._config(run_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        run_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, payload = self.serde.dumps_typed(value)
+            rows.append(
+                (
+                    run_id,
+                    checkpoint_ns,
+                    checkpoint_id,
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    type_,
+                    zlib.compress(payload),
+                    task_path,
+                )
+            )
+        # 特殊通道（错误、中断等）覆盖旧值，普通写入保持幂等
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        conn = self._connect()
+        try:
+            conn.executemany(
+                f"{verb} INTO writes "
+                "(run_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete_thread(self, thread_id: str) -> None:
+        conn = self._connect()
+        try:
+            for table in ("runs", "checkpoints", "writes"):
+                conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (thread_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # ---- 内部实现 ----
+
+    @staticmethod
+    def _config(run_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+        return {"configurable": {"thread_id": run_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self._path, timeout=30.0)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            self._ready = True
+        return conn
+
+    def _start_run(self, run_id: str, graph: str, context: dict[str, Any]) -> None:
+        now = time.time()
+        conn = self._connect()
+        try:
+            # 复用的 run_id 从头开始，不接续旧检查点
+            conn.execute("DELETE FROM checkpoints WHERE run_id = ?", (run_id,))
+            conn.execute("DELETE FROM writes WHERE run_id = ?", (run_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, graph, status, context, error, created_at, updated_at) "
+                "VALUES (?, ?, 'running', ?, '', ?, ?)",
+                (run_id, graph, json.dumps(context, ensure_ascii=False, default=str), now, now),
+            )
+            self._evict(conn, now)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _finish_run(self, run_id: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM checkpoints WHERE run_id = ?", (run_id,))
+            conn.execute("DELETE FROM writes WHERE run_id = ?", (run_id,))
+            conn.execute(
+                "UPDATE runs SET status = 'completed', error = '', updated_at = ? WHERE run_id = ?",
+                (time.time(), run_id),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _update_run(self, run_id: str, status: RunStatus, error: str = "") -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE runs SET status = ?, error = ?, updated_at = ? WHERE run_id = ?",
+                (status, error, time.time(), run_id),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _get_run(self, run_id: str) -> RunRecord | None:
+        conn = self._connect()
+        try:
+            row = conn.execute(f"{_RUN_COLUMNS} WHERE run_id = ?", (run_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._record(row) if row else None
+
+    def _list_runs(self, graph: str | None, limit: int) -> list[RunRecord]:
+        query = _RUN_COLUMNS
+        params: tuple[Any, ...] = ()
+        if graph:
+            query += " WHERE graph = ?"
+            params = (graph,)
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"{query} ORDER BY updated_at DESC LIMIT ?", (*params, limit)).fetchall()
+        finally:
+            conn.close()
+        return [self._record(row) for row in rows]
+
+    @staticmethod
+    def _record(row: tuple[Any, ...]) -> RunRecord:
+        run_id, graph, status, context, error, created_at, updated_at, checkpointed = row
+        return RunRecord(
+            run_id,
+            graph,
+            status,
+            json.loads(context),
+            error,
+            created_at,
+            updated_at,
+            checkpointed=bool(checkpointed),
+            active=run_id in _active_runs,
+        )
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """淘汰超过 TTL 的运行，再按最近更新时间只保留 max_runs 个，并清理其检查点"""
+        deleted = conn.execute("DELETE FROM runs WHERE updated_at < ?", (now - self._ttl_seconds,)).rowcount
+        deleted += conn.execute(
+            "DELETE FROM runs WHERE run_id NOT IN (SELECT run_id FROM runs ORDER BY updated_at DESC LIMIT ?)",
+            (self._max_runs,),
+        ).rowcount
+        if deleted:
+            conn.execute("DELETE FROM checkpoints WHERE run_id NOT IN (SELECT run_id FROM runs)")
+            conn.execute("DELETE FROM writes WHERE run_id NOT IN (SELECT run_id FROM runs)")
+            self._evictions += deleted
+            logger.info("Evicted %d checkpointed runs", deleted)
+
+
+async def invoke_checkpointed(
+    workflow: Any,
+    graph_input: dict[str, Any] | None,
+    run_id: str,
+    configurable: dict[str, Any],
+) -> dict[str, Any]:
+    """以 run_id 为 thread_id 执行工作流（graph_input 为 None 时从最新检查点恢复），并维护运行状态。
+
+    失败时标记为 failed 并保留检查点；被取消（超时、客户端断开）时保持 running，两者都可恢复。
+    同一 run_id 已在本进程中执行时抛出 ValidationError。
+    """
+    if run_id in _active_runs:
+        raise ValidationError(f"运行正在执行: {run_id}", field="run_id")
+    config = {"configurable": {**configurable, "thread_id": run_id}}
+    _active_runs.add(run_id)
+    try:
+        state = await workflow.ainvoke(graph_input, config=config)
+    except Exception as exc:
+        if checkpoint_store is not None:
+            await checkpoint_store.fail_run(run_id, str(exc) or type(exc).__name__)
+        raise
+    finally:
+        _active_runs.discard(run_id)
+    if checkpoint_store is not None:
+        await checkpoint_store.finish_run(run_id)
+    return state
+
+
+# 留空路径时不启用检查点，工作流照常运行但无法恢复
+checkpoint_store = (
+    SQLiteCheckpointSaver(
+        settings.CHECKPOINT_SQLITE_PATH,
+        max_runs=settings.CHECKPOINT_MAX_RUNS,
+        ttl_seconds=settings.CHECKPOINT_TTL_SECONDS,
+    )
+    if settings.CHECKPOINT_SQLITE_PATH
+    else None
+)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from typing import Any, Literal
+
+logger = logging.getLogger(__name__)
+
+BreakerState = Literal["closed", "open", "half_open"]
+
+
+class CircuitBreaker:
+    """滚动窗口错误率熔断器。
+
+    closed: 正常放行，窗口内请求数达到下限且错误率超过阈值时打开；
+    open: 拒绝请求，冷却 open_seconds 后进入 half_open；
+    half_open: 同一时刻只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window_seconds: float,
+        min_requests: int,
+        error_rate_threshold: float,
+        open_seconds: float,
+    ) -> None:
+        self.name = name
+        self._window_seconds = window_seconds
+        self._min_requests = min_requests
+        self._error_rate_threshold = error_rate_threshold
+        self._open_seconds = open_seconds
+
+        self._state: BreakerState = "closed"
+        self._opened_at = 0.0
+        self._probe_inflight = False
+        self._outcomes: deque[tuple[float, bool]] = deque()
+        self._open_count = 0
+
+    @property
+    def state(self) -> BreakerState:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self._open_seconds:
+            self._state = "half_open"
+            logger.info("Circuit breaker %s half-open, probing", self.name)
+        return self._state
+
+    def before_call(self) -> bool | None:
+        """放行时返回是否为探测请求；拒绝时返回 None"""
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self._probe_inflight:
+            self._probe_inflight = True
+            return True
+        return None
+
+    def record_success(self, probe: bool) -> None:
+        self._record(True)
+        if probe:
+            self._probe_inflight = False
+            self._state = "closed"
+            self._outcomes.clear()
+            logger.info("Circuit breaker %s closed after successful probe", self.name)
+
+    def record_failure(self, probe: bool) -> None:
+        self._record(False)
+        if probe:
+            self._probe_inflight = False
+            self._open()
+            return
+        if self._state == "closed" and self._should_open():
+            self._open()
+
+    def release(self, probe: bool) -> None:
+        """请求既未成功也未失败（取消、限流）时归还探测名额"""
+        if probe:
+            self._probe_inflight = False
+
+    def get_stats(self) -> dict[str, Any]:
+        self._trim()
+        total = len(self._outcomes)
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "window_requests": total,
+            "window_error_rate": failures / max(total, 1),
+            "open_count": self._open_count,
+        }
+
+    def _record(self, ok: bool) -> None:
+        self._outcomes.append((time.monotonic(), ok))
+        self._trim()
+
+    def _trim(self) -> None:
+        cutoff = time.monotonic() - self._window_seconds
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+
+    def _should_open(self) -> bool:
+        total = len(self._outcomes)
+        if total < self._min_requests:
+            return False
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return failures / total >= self._error_rate_threshold
+
+    def _open(self) -> None:
+        self._state = "open"
+        self._opened_at = time.monotonic()
+        self._open_count += 1
+        logger.error(
+            "Circuit breaker %s opened; will probe again in %.0f seconds.",
+            self.name,
+            self._open_seconds,
+        )
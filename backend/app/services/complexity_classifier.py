@@ -0,0 +1,291 @@
+"""问题复杂度本地分类器：哈希 n-gram 特征 + 逻辑回归，纯 CPU、无第三方依赖。
+
+线上：置信度足够时直接给出 yes/no，否则由调用方回退到 LLM 分类；设置 COMPLEXITY_LOG_PATH 时
+把 (question, decision) 追加到 JSONL 日志作为训练数据。
+
+离线训练与评估：
+    python -m app.services.complexity_classifier train --data <log.jsonl> [--out <model.json>]
+    python -m app.services.complexity_classifier eval --data <log.jsonl> [--model <model.json>]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+import random
+import re
+import statistics
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Iterable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_NUM_BUCKETS = 1 << 18
+_WORD_RE = re.compile(r"[a-z0-9_+#.]+")
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+")
+_LENGTH_BUCKETS = (16, 48, 128, 384)
+_REPORT_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+
+
+def featurize(text: str) -> dict[int, float]:
+    """英文词 1/2-gram + CJK 字 1/2-gram + 长度分桶，哈希到固定维度"""
+    lowered = text.lower()
+    tokens: list[str] = []
+
+    words = _WORD_RE.findall(lowered)
+    tokens.extend(f"w:{w}" for w in words)
+    tokens.extend(f"w2:{a} {b}" for a, b in zip(words, words[1:]))
+
+    for run in _CJK_RE.findall(lowered):
+        tokens.extend(f"c:{ch}" for ch in run)
+        tokens.extend(f"c2:{run[i:i + 2]}" for i in range(len(run) - 1))
+
+    length_bucket = sum(1 for bound in _LENGTH_BUCKETS if len(text) > bound)
+    tokens.append(f"len:{length_bucket}")
+    tokens.append(f"q:{lowered.count('?') + lowered.count('？')}")
+
+    features: dict[int, float] = {}
+    for token in tokens:
+        index = zlib.crc32(token.encode("utf-8")) % _NUM_BUCKETS
+        features[index] = features.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+    return {k: v / norm for k, v in features.items()}
+
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class ComplexityClassifier:
+    """稀疏逻辑回归；predict 返回 (is_complex, confidence)，未加载模型时返回 None。"""
+
+    def __init__(self, weights: dict[int, float] | None = None, bias: float = 0.0) -> None:
+        self.weights = weights
+        self.bias = bias
+
+    @property
+    def ready(self) -> bool:
+        return self.weights is not None
+
+    def probability(self, text: str) -> float:
+        weights = self.weights or {}
+        z = self.bias + sum(weights.get(k, 0.0) * v for k, v in featurize(text).items())
+        return _sigmoid(z)
+
+    def predict(self, text: str) -> tuple[bool, float] | None:
+        if not self.ready:
+            return None
+        p = self.probability(text)
+        return p >= 0.5, max(p, 1.0 - p)
+
+    def fit(
+        self,
+        samples: list[tuple[str, bool]],
+        *,
+        epochs: int = 20,
+        learning_rate: float = 0.5,
+        l2: float = 1e-4,
+        seed: int = 0,
+    ) -> None:
+        """SGD 训练（L2 正则按惰性方式近似为每步对触及特征衰减）"""
+        rng = random.Random(seed)
+        weights: dict[int, float] = {}
+        bias = 0.0
+        data = [(featurize(text), 1.0 if label else 0.0) for text, label in samples]
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            lr = learning_rate / (1.0 + epoch)
+            for features, label in data:
+                z = bias + sum(weights.get(k, 0.0) * v for k, v in features.items())
+                gradient = _sigmoid(z) - label
+                bias -= lr * gradient
+                for k, v in features.items():
+                    w = weights.get(k, 0.0)
+                    weights[k] = w - lr * (gradient * v + l2 * w)
+        self.weights = {k: w for k, w in weights.items() if abs(w) > 1e-6}
+        self.bias = bias
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "num_buckets": _NUM_BUCKETS,
+            "bias": self.bias,
+            "weights": {str(k): w for k, w in (self.weights or {}).items()},
+        }
+        path.write_text(json.dumps(payload), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str | Path) -> ComplexityClassifier:
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        if payload.get("num_buckets") != _NUM_BUCKETS:
+            logger.warning("Complexity model %s has incompatible feature size, ignoring", path)
+            return cls()
+        weights = {int(k): float(w) for k, w in payload.get("weights", {}).items()}
+        return cls(weights, float(payload.get("bias", 0.0)))
+
+
+_classifier: ComplexityClassifier | None = None
+
+
+def get_complexity_classifier() -> ComplexityClassifier:
+    """进程级单例，首次使用时从 COMPLEXITY_MODEL_PATH 加载；模型文件不存在时始终回退 LLM"""
+    global _classifier
+    if _classifier is None:
+        _classifier = ComplexityClassifier.load(settings.COMPLEXITY_MODEL_PATH)
+        if _classifier.ready:
+            logger.info("Loaded complexity classifier from %s", settings.COMPLEXITY_MODEL_PATH)
+    return _classifier
+
+
+def log_decision(question: str, decision: bool, source: str, latency_ms: float) -> None:
+    """追加一条分类记录（同步写文件，调用方应放到线程中执行）"""
+    if not settings.COMPLEXITY_LOG_PATH:
+        return
+    path = Path(settings.COMPLEXITY_LOG_PATH)
+    record = {
+        "question": question,
+        "decision": decision,
+        "source": source,
+        "latency_ms": round(latency_ms, 3),
+        "ts": time.time(),
+    }
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and path.stat().st_size >= settings.COMPLEXITY_LOG_MAX_BYTES:
+            path.replace(path.with_name(path.name + ".1"))
+        with path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as exc:
+        logger.warning("Failed to log complexity decision: %s", exc)
+
+
+def load_samples(path: str | Path, sources: Iterable[str] = ("llm",)) -> tuple[list[tuple[str, bool]], list[float]]:
+    """读取日志，返回训练样本与 LLM 分类延迟（毫秒）；默认只用 LLM 给出的标签，避免自我强化"""
+    allowed = set(sources)
+    samples: list[tuple[str, bool]] = []
+    llm_latencies: list[float] = []
+    with Path(path).open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("source") not in allowed:
+                continue
+            samples.append((str(record["question"]), bool(record["decision"])))
+            if record.get("source") == "llm" and record.get("latency_ms"):
+                llm_latencies.append(float(record["latency_ms"]))
+    return samples, llm_latencies
+
+
+def evaluate(
+    classifier: ComplexityClassifier,
+    samples: list[tuple[str, bool]],
+    llm_latency_ms: float | None,
+) -> dict[str, Any]:
+    """按置信度阈值统计本地覆盖率、覆盖样本准确率与期望延迟"""
+    predictions: list[tuple[bool, float, bool]] = []
+    timings: list[float] = []
+    for text, label in samples:
+        started = time.perf_counter()
+        result = classifier.predict(text)
+        timings.append((time.perf_counter() - started) * 1e6)
+        assert result is not None
+        predictions.append((result[0], result[1], label))
+
+    local_us = statistics.median(timings) if timings else 0.0
+    rows = []
+    for threshold in _REPORT_THRESHOLDS:
+        covered = [(p, label) for p, confidence, label in predictions if confidence >= threshold]
+        coverage = len(covered) / max(len(predictions), 1)
+        accuracy = sum(1 for p, label in covered if p == label) / max(len(covered), 1)
+        row: dict[str, Any] = {"threshold": threshold, "coverage": coverage, "local_accuracy": accuracy}
+        if llm_latency_ms is not None:
+            # 未覆盖部分回退 LLM，其标签视为正确
+            row["overall_accuracy"] = coverage * accuracy + (1 - coverage)
+            row["expected_latency_ms"] = coverage * local_us / 1000 + (1 - coverage) * llm_latency_ms
+        rows.append(row)
+
+    return {
+        "samples": len(samples),
+        "accuracy": sum(1 for p, _, label in predictions if p == label) / max(len(predictions), 1),
+        "local_latency_us_p50": local_us,
+        "local_latency_us_p99": sorted(timings)[int(0.99 * (len(timings) - 1))] if timings else 0.0,
+        "llm_latency_ms_mean": llm_latency_ms,
+        "thresholds": rows,
+    }
+
+
+def _print_report(report: dict[str, Any]) -> None:
+    print(f"samples: {report['samples']}  accuracy@0.5: {report['accuracy']:.3f}")
+    print(
+        f"local latency: p50 {report['local_latency_us_p50']:.1f}us  "
+        f"p99 {report['local_latency_us_p99']:.1f}us"
+    )
+    if report["llm_latency_ms_mean"] is not None:
+        print(f"LLM classifier latency (logged mean): {report['llm_latency_ms_mean']:.1f}ms")
+    print(f"{'threshold':>9} {'coverage':>9} {'local_acc':>9} {'overall':>9} {'exp_ms':>9}")
+    for row in report["thresholds"]:
+        overall = f"{row['overall_accuracy']:.3f}" if "overall_accuracy" in row else "-"
+        expected = f"{row['expected_latency_ms']:.1f}" if "expected_latency_ms" in row else "-"
+        print(
+            f"{row['threshold']:>9.2f} {row['coverage']:>9.3f} "
+            f"{row['local_accuracy']:>9.3f} {overall:>9} {expected:>9}"
+        )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="训练/评估问题复杂度本地分类器")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="从分类日志训练模型，并在留出集上输出评估报告")
+    train.add_argument(
+        "--data", default=settings.COMPLEXITY_LOG_PATH or None, required=not settings.COMPLEXITY_LOG_PATH
+    )
+    train.add_argument("--out", default=settings.COMPLEXITY_MODEL_PATH)
+    train.add_argument("--holdout", type=float, default=0.2)
+    train.add_argument("--epochs", type=int, default=20)
+
+    evaluate_cmd = sub.add_parser("eval", help="在日志数据上评估已有模型")
+    evaluate_cmd.add_argument(
+        "--data", default=settings.COMPLEXITY_LOG_PATH or None, required=not settings.COMPLEXITY_LOG_PATH
+    )
+    evaluate_cmd.add_argument("--model", default=settings.COMPLEXITY_MODEL_PATH)
+
+    args = parser.parse_args(argv)
+    samples, llm_latencies = load_samples(args.data)
+    if not samples:
+        parser.error(f"no labelled samples in {args.data}")
+    llm_latency = statistics.mean(llm_latencies) if llm_latencies else None
+
+    if args.command == "train":
+        random.Random(0).shuffle(samples)
+        split = int(len(samples) * (1 - args.holdout))
+        train_set, holdout = samples[:split], samples[split:] or samples[:split]
+        classifier = ComplexityClassifier()
+        classifier.fit(train_set, epochs=args.epochs)
+        classifier.save(args.out)
+        print(f"trained on {len(train_set)} samples -> {args.out}")
+        _print_report(evaluate(classifier, holdout, llm_latency))
+        return
+
+    classifier = ComplexityClassifier.load(args.model)
+    if not classifier.ready:
+        parser.error(f"model not found: {args.model}")
+    _print_report(evaluate(classifier, samples, llm_latency))
+
+
+if __name__ == "__main__":
+    main()
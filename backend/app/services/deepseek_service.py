@@ -1,15 +1,26 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Any
+import time
+from typing import Any, AsyncIterator
 
 import httpx
 
 from app.config import settings
+from app.services.llm_registry import llm_registry
+from app.services.token_usage import record_usage
 from app.utils.exceptions import LLMError
+from app.utils.http_client import http_clients
+from app.utils.llm_cache import LLMResponseCache
+from app.utils.singleflight import SingleFlight
+from app.utils.sse import aiter_sse_json, chat_chunk_delta
 
 logger = logging.getLogger(__name__)
 
+# 相同补丁请求的并发调用合并为一次上游调用
+_inflight = SingleFlight()
+
 
 class DeepSeekService:
     """DeepSeek-R1 客户端（OpenAI 兼容接口）。"""
@@ -27,33 +38,127 @@ class DeepSeekService:
                 "model": "local-fallback",
             }
 
-        url = f"{self._endpoint}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self._api_key}",
-            "Content-Type": "application/json",
-        }
+        if not settings.LLM_SINGLEFLIGHT_ENABLED:
+            return await self._request_patch(messages)
+
+        key = LLMResponseCache.make_key(self._model, messages, {"temperature": 0.2})
+        return await _inflight.do(key, lambda: self._request_patch(messages))
+
+    async def _request_patch(self, messages: list[dict[str, str]]) -> dict[str, Any]:
+        url, headers = self._build_request()
         payload = {
             "model": self._model,
             "messages": messages,
             "temperature": 0.2,
         }
+        probe = self._acquire_breaker()
+        started = time.perf_counter()
 
         try:
-            async with httpx.AsyncClient(timeout=300) as client:
-                response = await client.post(url, headers=headers, json=payload)
-                response.raise_for_status()
-                data = response.json()
+            client = http_clients.get(self._endpoint)
+            response = await client.post(url, headers=headers, json=payload)
+            response.raise_for_status()
+            data = response.json()
 
+            self._record_success(probe, time.perf_counter() - started, data.get("usage"))
             choice = data["choices"][0]["message"]
             return {
                 "content": choice.get("content", ""),
                 "model": data.get("model", self._model),
                 "usage": data.get("usage", {}),
             }
+        except asyncio.CancelledError:
+            llm_registry.breaker(self._upstream_key).release(probe)
+            raise
         except httpx.HTTPError as exc:
-            logger.error("DeepSeek request failed: %s", exc)
+            raise self._to_llm_error(exc, probe)
+        except Exception:
+            # 响应体无法解析等异常同样计为一次上游失败，避免探测名额一直被占用
+            llm_registry.breaker(self._upstream_key).record_failure(probe)
+            raise
+
+    async def stream_patch(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        """流式生成补丁，逐段产出增量文本（推理模型的 reasoning_content 不输出）。"""
+        if not self._configured:
+            yield "DeepSeek 未配置，无法生成真实补丁。"
+            return
+
+        url, headers = self._build_request()
+        payload = {
+            "model": self._model,
+            "messages": messages,
+            "temperature": 0.2,
+            "stream": True,
+        }
+        probe = self._acquire_breaker()
+        started = time.perf_counter()
+
+        try:
+            client = http_clients.get(self._endpoint)
+            usage: dict[str, Any] = {}
+            async with client.stream("POST", url, headers=headers, json=payload) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+
+                async for chunk in aiter_sse_json(response):
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    delta = chat_chunk_delta(chunk)
+                    if delta:
+                        yield delta
+
+            self._record_success(probe, time.perf_counter() - started, usage)
+        except (asyncio.CancelledError, GeneratorExit):
+            llm_registry.breaker(self._upstream_key).release(probe)
+            raise
+        except httpx.HTTPError as exc:
+            raise self._to_llm_error(exc, probe)
+        except Exception:
+            # 响应体无法解析等异常同样计为一次上游失败，避免探测名额一直被占用
+            llm_registry.breaker(self._upstream_key).record_failure(probe)
+            raise
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "configured": self._configured,
+            "circuit_breaker": llm_registry.breaker(self._upstream_key).get_stats(),
+            "upstream": llm_registry.stats(self._upstream_key).get_stats(),
+            "singleflight": _inflight.get_stats(),
+        }
+
+    @property
+    def _upstream_key(self) -> str:
+        return f"deepseek:{self._model}"
+
+    def _acquire_breaker(self) -> bool:
+        probe = llm_registry.breaker(self._upstream_key).before_call()
+        if probe is None:
             raise LLMError(
-                "DeepSeek 请求失败",
-                details={"endpoint": self._endpoint, "model": self._model},
-                original_error=exc,
+                "DeepSeek 服务暂时不可用，请稍后重试",
+                details={"reason": "circuit_breaker_open", "model": self._model},
             )
+        return probe
+
+    def _record_success(self, probe: bool, latency: float, usage: dict[str, Any] | None) -> None:
+        llm_registry.stats(self._upstream_key).record_success(latency, usage)
+        llm_registry.breaker(self._upstream_key).record_success(probe)
+        record_usage(usage)
+
+    def _build_request(self) -> tuple[str, dict[str, str]]:
+        url = f"{self._endpoint}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self._api_key}",
+            "Content-Type": "application/json",
+        }
+        return url, headers
+
+    def _to_llm_error(self, exc: httpx.HTTPError, probe: bool) -> LLMError:
+        logger.error("DeepSeek request failed: %s", exc)
+        llm_registry.stats(self._upstream_key).record_failure()
+        llm_registry.breaker(self._upstream_key).record_failure(probe)
+        return LLMError(
+            "DeepSeek 请求失败",
+            details={"endpoint": self._endpoint, "model": self._model},
+            original_error=exc,
+        )
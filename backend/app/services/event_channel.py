@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Iterator
+
+from app.services.token_usage import TokenUsage, usage_scope
+
+# 阶段事件中中间产物的文本长度上限
+_ARTIFACT_PREVIEW_CHARS = 600
+
+
+@dataclass
+class ProgressEvent:
+    type: str
+    data: dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"type": self.type, **self.data}
+
+
+class EventChannel:
+    """单次请求的进度事件通道。
+
+    编排器通过 publish/status/stage_started/stage_finished/chunk 投递事件，SSE 生成器直接 await 队列消费，
+    生产方结束时调用 close()；仅在真正空闲超过 idle_timeout 时产出 None（用于 keepalive）。
+    """
+
+    _CLOSED = ProgressEvent(type="__closed__")
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue[ProgressEvent] = asyncio.Queue()
+        self._closed = False
+        self._chunks: list[str] = []
+
+    def publish(self, type: str, **data: Any) -> None:
+        if self._closed:
+            return
+        self._queue.put_nowait(ProgressEvent(type=type, data=data))
+
+    def status(self, content: str) -> None:
+        self.publish("status", content=content)
+
+    def stage_started(self, stage: str, **data: Any) -> None:
+        self.publish("stage_started", stage=stage, **data)
+
+    def stage_finished(
+        self,
+        stage: str,
+        *,
+        status: str,
+        duration: float,
+        usage: dict[str, int] | None = None,
+        artifact: Any = None,
+    ) -> None:
+        data: dict[str, Any] = {"status": status, "duration": round(duration, 4)}
+        if usage and usage.get("calls"):
+            data["usage"] = usage
+        if artifact is not None:
+            data["artifact"] = _preview(artifact)
+        self.publish("stage_finished", stage=stage, **data)
+
+    async def chunk(self, content: str) -> None:
+        """TokenCallback 兼容：投递一段最终答案增量文本。"""
+        if not content:
+            return
+        self._chunks.append(content)
+        self.publish("chunk", content=content)
+
+    @property
+    def streamed_text(self) -> str:
+        """已投递的最终答案文本（用于断开时保存部分答案）"""
+        return "".join(self._chunks)
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._queue.put_nowait(self._CLOSED)
+
+    async def stream(self, idle_timeout: float) -> AsyncIterator[ProgressEvent | None]:
+        while True:
+            try:
+                event = await asyncio.wait_for(self._queue.get(), timeout=idle_timeout)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+
+            if event is self._CLOSED:
+                return
+            yield event
+
+
+@dataclass
+class StageReport:
+    """stage_scope 内由阶段填写的中间产物（意图 JSON、搜索摘要等），随 stage_finished 事件下发"""
+
+    artifact: Any = None
+    status: str = "ok"
+    usage: TokenUsage = field(default_factory=TokenUsage)
+    duration: float = 0.0
+
+    def timing(self) -> dict[str, Any]:
+        """阶段结束后的耗时摘要（写入结果 metadata）"""
+        return {"status": self.status, "duration": round(self.duration, 4), "usage": self.usage.to_dict()}
+
+
+@contextmanager
+def stage_scope(events: EventChannel | None, stage: str, **data: Any) -> Iterator[StageReport]:
+    """包裹一个阶段：投递 stage_started，结束时投递带耗时、token 用量与中间产物的 stage_finished"""
+    report = StageReport()
+    if events:
+        events.stage_started(stage, **data)
+    started = time.perf_counter()
+    with usage_scope() as report.usage:
+        try:
+            yield report
+        except asyncio.CancelledError:
+            report.status = "cancelled"
+            raise
+        except Exception:
+            report.status = "failed"
+            raise
+        finally:
+            report.duration = time.perf_counter() - started
+            if events:
+                events.stage_finished(
+                    stage,
+                    status=report.status,
+                    duration=report.duration,
+                    usage=report.usage.to_dict(),
+                    artifact=report.artifact if report.status == "ok" else None,
+                )
+
+
+def _preview(artifact: Any) -> Any:
+    if isinstance(artifact, str):
+        return artifact[:_ARTIFACT_PREVIEW_CHARS]
+    if isinstance(artifact, dict):
+        return {
+            key: value[:_ARTIFACT_PREVIEW_CHARS] if isinstance(value, str) else value
+            for key, value in artifact.items()
+        }
+    return artifact
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class Hedger:
+    """对冲请求：主请求超过延迟阈值仍未返回时再发一个相同请求，先返回者胜出，另一个被取消。
+
+    对冲预算按令牌计：每个主请求积累 max_ratio 个令牌（上限 burst），每次对冲消耗一个，
+    因此长期对冲率不超过 max_ratio。
+    """
+
+    def __init__(self, max_ratio: float, burst: float = 10.0) -> None:
+        self._max_ratio = max_ratio
+        self._burst = burst
+        self._budget = 0.0
+
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._budget_exhausted = 0
+
+    async def run(self, fn: Callable[[], Awaitable[T]], delay: float | None) -> T:
+        """delay 为 None 时不对冲，直接执行 fn"""
+        self._requests += 1
+        self._budget = min(self._burst, self._budget + self._max_ratio)
+
+        primary = asyncio.ensure_future(fn())
+        if delay is None:
+            return await primary
+
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._try_spend():
+                return await primary
+
+            self._hedged += 1
+            tasks.append(asyncio.ensure_future(fn()))
+            pending = set(tasks)
+            first_error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._hedge_wins += 1
+                        return task.result()
+                    first_error = first_error or task.exception()
+            assert first_error is not None
+            raise first_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "requests": self._requests,
+            "hedged": self._hedged,
+            "hedge_wins": self._hedge_wins,
+            "budget_exhausted": self._budget_exhausted,
+            "hedge_rate": self._hedged / max(self._requests, 1),
+        }
+
+    def _try_spend(self) -> bool:
+        if self._budget < 1.0:
+            self._budget_exhausted += 1
+            return False
+        self._budget -= 1.0
+        return True
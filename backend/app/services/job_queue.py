@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from sqlalchemy import delete, select, update
+
+from app.config import settings
+from app.models.database import AsyncSessionLocal, Job
+from app.services.event_channel import EventChannel
+from app.utils.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+# 任务处理函数：接收任务 ID、提交时的 payload 与进度事件通道，返回可 JSON 序列化的结果
+JobHandler = Callable[[str, dict[str, Any], EventChannel], Awaitable[dict[str, Any]]]
+
+TERMINAL_STATUSES = frozenset({"succeeded", "failed", "cancelled"})
+
+
+class _JobEventLog:
+    """单个任务的进度事件记录；多个 SSE 订阅者可各自从头回放并等待新事件"""
+
+    def __init__(self, max_events: int) -> None:
+        self._events: list[dict[str, Any]] = []
+        self._dropped = 0
+        self._max_events = max_events
+        self._wake = asyncio.Event()
+        self.closed = False
+
+    def append(self, event: dict[str, Any]) -> None:
+        self._events.append(event)
+        if len(self._events) > self._max_events:
+            overflow = len(self._events) - self._max_events
+            del self._events[:overflow]
+            self._dropped += overflow
+        self._notify()
+
+    def close(self) -> None:
+        self.closed = True
+        self._notify()
+
+    async def follow(self, idle_timeout: float) -> AsyncIterator[dict[str, Any] | None]:
+        """回放已有事件并持续产出新事件，空闲超过 idle_timeout 时产出 None（用于 keepalive）"""
+        position = 0
+        while True:
+            wake = self._wake
+            position = max(position, self._dropped)
+            while position < self._dropped + len(self._events):
+                yield self._events[position - self._dropped]
+                position += 1
+            if self.closed:
+                return
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=idle_timeout)
+            except asyncio.TimeoutError:
+                yield None
+
+    def _notify(self) -> None:
+        # 唤醒当前所有等待者，之后的等待使用新的 Event
+        self._wake.set()
+        self._wake = asyncio.Event()
+
+
+class JobQueue:
+    """持久化到 SQLite 的后台任务队列。
+
+    提交即写库并返回任务 ID，固定数量的 worker 按优先级（越大越先）、同优先级按提交顺序执行。
+    排队中的任务直接标记取消，运行中的任务通过取消其 asyncio 任务中止。
+    服务关闭时运行中的任务保持 running，下次启动时与 queued 任务一起重新排队。
+    """
+
+    def __init__(self, workers: int, event_history: int, retention_seconds: float) -> None:
+        self._worker_count = workers
+        self._event_history = event_history
+        self._retention_seconds = retention_seconds
+        self._handlers: dict[str, JobHandler] = {}
+        self._queue: asyncio.PriorityQueue[tuple[int, int, str]] | None = None
+        self._sequence = itertools.count()
+        self._workers: list[asyncio.Task] = []
+        # 运行中的任务：(执行任务, 最终状态写入后置位的事件)
+        self._running: dict[str, tuple[asyncio.Task, asyncio.Event]] = {}
+        self._cancel_requested: set[str] = set()
+        self._logs: dict[str, _JobEventLog] = {}
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    async def start(self) -> None:
+        """启动 worker，并把上次未完成（queued / running）的任务重新排队"""
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue()
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                delete(Job).where(
+                    Job.status.in_(tuple(TERMINAL_STATUSES)),
+                    Job.finished_at < datetime.utcnow() - timedelta(seconds=self._retention_seconds),
+                )
+            )
+            await db.execute(update(Job).where(Job.status == "running").values(status="queued", started_at=None))
+            await db.commit()
+            pending = (
+                await db.execute(select(Job).where(Job.status == "queued").order_by(Job.created_at))
+            ).scalars().all()
+        for job in pending:
+            self._enqueue(job.id, job.priority)
+        if pending:
+            logger.info("Re-queued %d unfinished jobs", len(pending))
+
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{index}") for index in range(self._worker_count)
+        ]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, kind: str, payload: dict[str, Any], priority: int = 0) -> Job:
+        if kind not in self._handlers:
+            raise ValidationError(f"不支持的任务类型: {kind}", field="kind")
+        job = Job(
+            id=str(uuid.uuid4()),
+            kind=kind,
+            status="queued",
+            priority=priority,
+            payload=payload,
+            error="",
+            created_at=datetime.utcnow(),
+        )
+        async with AsyncSessionLocal() as db:
+            db.add(job)
+            await db.commit()
+        self._log(job.id).append({"type": "job", "status": "queued"})
+        self._enqueue(job.id, priority)
+        return job
+
+    async def get(self, job_id: str) -> Job | None:
+        async with AsyncSessionLocal() as db:
+            return await db.get(Job, job_id)
+
+    async def update_payload(self, job_id: str, **fields: Any) -> None:
+        """把字段合并进任务 payload；处理函数用它记录已完成的副作用，服务重启后重新执行时据此跳过"""
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+            if job is None:
+                return
+            job.payload = {**(job.payload or {}), **fields}
+            await db.commit()
+
+    async def list(self, status: str | None = None, limit: int = 50) -> list[Job]:
+        query = select(Job).order_by(Job.created_at.desc()).limit(limit)
+        if status:
+            query = query.where(Job.status == status)
+        async with AsyncSessionLocal() as db:
+            return list((await db.execute(query)).scalars().all())
+
+    async def cancel(self, job_id: str) -> Job | None:
+        """取消任务：排队中的直接标记为 cancelled，运行中的中止其执行；已结束的任务不变"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "queued")
+                .values(status="cancelled", finished_at=datetime.utcnow())
+            )
+            await db.commit()
+        if result.rowcount:
+            self._cancelled += 1
+            self._close_log(job_id, {"type": "job", "status": "cancelled"})
+        elif running := self._running.get(job_id):
+            task, finished = running
+            self._cancel_requested.add(job_id)
+            task.cancel()
+            # 等待 worker 写入最终状态后再返回
+            await finished.wait()
+        return await self.get(job_id)
+
+    async def follow(self, job_id: str, idle_timeout: float) -> AsyncIterator[dict[str, Any] | None]:
+        """订阅任务事件：先回放本进程内记录的事件，任务结束后以 {"type": "job", status, result} 收尾"""
+        job = await self.get(job_id)
+        if job is None:
+            return
+        log = self._logs.get(job_id)
+        if log is None:
+            # 事件只保存在内存中：已结束或重启前提交的任务只能给出当前状态
+            yield self._job_event(job)
+            if job.status in TERMINAL_STATUSES:
+                return
+            log = self._log(job_id)
+        async for event in log.follow(idle_timeout):
+            yield event
+
+    @staticmethod
+    def describe(job: Job) -> dict[str, Any]:
+        return {
+            "job_id": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "priority": job.priority,
+            "error": job.error or "",
+            "result": job.result,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": len(self._running),
+            "completed": self._completed,
+            "failed": self._failed,
+            "cancelled": self._cancelled,
+        }
+
+    def _enqueue(self, job_id: str, priority: int) -> None:
+        if self._queue is not None:
+            self._queue.put_nowait((-priority, next(self._sequence), job_id))
+
+    def _log(self, job_id: str) -> _JobEventLog:
+        log = self._logs.get(job_id)
+        if log is None:
+            log = self._logs[job_id] = _JobEventLog(self._event_history)
+        return log
+
+    def _close_log(self, job_id: str, event: dict[str, Any]) -> None:
+        log = self._log(job_id)
+        log.append(event)
+        log.close()
+        # 已结束任务的事件记录只保留最近的一部分，订阅者之后从数据库读取最终状态
+        finished = [key for key, item in self._logs.items() if item.closed]
+        for key in finished[: max(0, len(finished) - self._event_history)]:
+            self._logs.pop(key, None)
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            _, _, job_id = await self._queue.get()
+            try:
+                await self._process(job_id)
+            except Exception:
+                # 数据库错误等意外异常只影响当前任务，worker 继续处理后续任务
+                logger.exception("Job worker failed while processing job %s", job_id)
+
+    async def _process(self, job_id: str) -> None:
+        async with AsyncSessionLocal() as db:
+            # 只有仍处于 queued 的任务会被领取（排队期间可能已被取消）
+            claimed = await db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "queued")
+                .values(status="running", started_at=datetime.utcnow())
+            )
+            await db.commit()
+            job = await db.get(Job, job_id) if claimed.rowcount else None
+        if job is None:
+            return
+        if job.kind not in self._handlers:
+            # 持久化的任务类型在本次启动中已不再注册
+            logger.error("Job %s has unregistered kind %s", job.id, job.kind)
+            await self._finish(job.id, "failed", None, f"不支持的任务类型: {job.kind}")
+            return
+        await self._run(job)
+
+    async def _run(self, job: Job) -> None:
+        log = self._log(job.id)
+        log.append({"type": "job", "status": "running"})
+        events = EventChannel()
+        forwarder = asyncio.create_task(self._forward(events, log))
+        task = asyncio.create_task(self._handlers[job.kind](job.id, job.payload or {}, events))
+        finished = asyncio.Event()
+        self._running[job.id] = (task, finished)
+        try:
+            await self._execute(job, task, events, forwarder, log)
+        finally:
+            self._running.pop(job.id, None)
+            self._cancel_requested.discard(job.id)
+            finished.set()
+
+    async def _execute(
+        self,
+        job: Job,
+        task: asyncio.Task,
+        events: EventChannel,
+        forwarder: asyncio.Task,
+        log: _JobEventLog,
+    ) -> None:
+        result: dict[str, Any] | None = None
+        error = ""
+        try:
+            result = await task
+            status = "succeeded"
+        except asyncio.CancelledError:
+            if job.id not in self._cancel_requested:
+                # 服务关闭：保持 running，下次启动时重新排队
+                raise
+            status = "cancelled"
+        except Exception as exc:
+            logger.exception("Job %s (%s) failed", job.id, job.kind)
+            status = "failed"
+            error = str(exc) or type(exc).__name__
+        finally:
+            events.close()
+            await forwarder
+        await self._finish(job.id, status, result, error)
+
+    async def _finish(self, job_id: str, status: str, result: dict[str, Any] | None, error: str) -> None:
+        """写入最终状态并关闭事件记录"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .values(status=status, result=result, error=error, finished_at=datetime.utcnow())
+            )
+            await db.commit()
+        if status == "succeeded":
+            self._completed += 1
+        elif status == "failed":
+            self._failed += 1
+        else:
+            self._cancelled += 1
+        self._close_log(job_id, {"type": "job", "status": status, "result": result, "error": error})
+
+    @staticmethod
+    async def _forward(events: EventChannel, log: _JobEventLog) -> None:
+        # 处理函数结束时 events 被关闭，stream 随之结束
+        async for event in events.stream(idle_timeout=3600.0):
+            if event is not None:
+                log.append(event.to_dict())
+
+    @staticmethod
+    def _job_event(job: Job) -> dict[str, Any]:
+        return {"type": "job", "status": job.status, "result": job.result, "error": job.error or ""}
+
+
+job_queue = JobQueue(
+    workers=settings.JOB_WORKERS,
+    event_history=settings.JOB_EVENT_HISTORY,
+    retention_seconds=settings.JOB_RETENTION_SECONDS,
+)
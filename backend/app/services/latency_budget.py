@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+from app.config import settings
+
+LatencyMode = Literal["fast", "balanced", "thorough"]
+
+
+@dataclass(frozen=True)
+class StagePlan:
+    run: bool
+    max_tokens: int | None = None
+    shrunk: bool = False
+
+
+class StageLatencyEstimator:
+    """按 (阶段, 模型) 维护阶段耗时的 EWMA 估计；无观测时使用配置中的先验值。"""
+
+    def __init__(self, priors: dict[str, float], alpha: float = 0.3) -> None:
+        self._priors = priors
+        self._alpha = alpha
+        self._ewma: dict[tuple[str, str], float] = {}
+
+    def estimate(self, stage: str, model: str) -> float:
+        return self._ewma.get((stage, model), self._priors.get(stage, 0.0))
+
+    def observe(self, timings: dict[str, dict[str, Any]], model: str) -> None:
+        """记录一次流水线中正常完成的阶段耗时（StageGraph.timings 格式）"""
+        for stage, timing in timings.items():
+            if timing.get("status") != "ok" or "duration" not in timing:
+                continue
+            key = (stage, model)
+            previous = self._ewma.get(key)
+            duration = float(timing["duration"])
+            self._ewma[key] = duration if previous is None else (
+                self._alpha * duration + (1 - self._alpha) * previous
+            )
+
+    def get_stats(self) -> dict[str, float]:
+        return {f"{stage}@{model}": round(value, 3) for (stage, model), value in self._ewma.items()}
+
+
+stage_latency = StageLatencyEstimator(settings.LATENCY_STAGE_PRIORS)
+
+
+@dataclass
+class LatencyBudget:
+    """一次请求的延迟预算：按剩余时间与各阶段耗时估计决定可选阶段是完整运行、缩减输出还是跳过。
+
+    thorough 模式且未指定 budget_seconds 时不设截止时间，所有阶段照常运行。
+    """
+
+    mode: LatencyMode
+    budget_seconds: float | None
+    max_tokens: int | None
+    model_override: str | None = None
+    skipped: dict[str, str] = field(default_factory=dict)
+    shrunk: dict[str, int] = field(default_factory=dict)
+    _started: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def create(cls, mode: LatencyMode | None = None, budget_seconds: float | None = None) -> LatencyBudget:
+        mode = mode or settings.LATENCY_DEFAULT_MODE  # type: ignore[assignment]
+        if budget_seconds is None:
+            budget_seconds = settings.LATENCY_MODE_BUDGETS.get(mode)
+        model_override = (settings.LATENCY_FAST_MODEL or settings.DEFAULT_MODEL) if mode == "fast" else None
+        return cls(
+            mode=mode,
+            budget_seconds=budget_seconds,
+            max_tokens=settings.LATENCY_MODE_MAX_TOKENS.get(mode),
+            model_override=model_override,
+        )
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def remaining(self) -> float | None:
+        if self.budget_seconds is None:
+            return None
+        return self.budget_seconds - self.elapsed()
+
+    def choose_model(self, model: str) -> str:
+        """fast 模式统一使用较快的默认模型，不路由到推理型专家模型"""
+        return self.model_override or model
+
+    def plan(self, stages: tuple[str, ...], model: str, *, after: tuple[str, ...] = ()) -> StagePlan:
+        """规划一组可选阶段（如 detailed_analysis → code_generation）。
+
+        after 为这组阶段开始前仍需完成的阶段；预估总耗时在剩余时间内则完整运行，
+        按 LATENCY_SHRINK_RATIO 缩减后能放下则限制输出 token，否则跳过并记录原因。
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return StagePlan(run=True, max_tokens=self.max_tokens)
+
+        ahead = sum((stage_latency.estimate(stage, model) for stage in after), 0.0)
+        needed = sum((stage_latency.estimate(stage, model) for stage in stages), 0.0)
+        if ahead + needed <= remaining:
+            return StagePlan(run=True, max_tokens=self.max_tokens)
+
+        ratio = settings.LATENCY_SHRINK_RATIO
+        if ahead + needed * ratio <= remaining:
+            base = self.max_tokens or max(settings.LATENCY_MODE_MAX_TOKENS.values(), default=2000)
+            max_tokens = max(1, int(base * ratio))
+            for stage in stages:
+                self.shrunk[stage] = max_tokens
+            return StagePlan(run=True, max_tokens=max_tokens, shrunk=True)
+
+        for stage in stages:
+            self.skip(stage, "budget")
+        return StagePlan(run=False)
+
+    def skip(self, stage: str, reason: str) -> None:
+        self.skipped.setdefault(stage, reason)
+        self.shrunk.pop(stage, None)
+
+    def to_metadata(self) -> dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "budget_seconds": self.budget_seconds,
+            "elapsed": round(self.elapsed(), 3),
+            "skipped_stages": self.skipped,
+            "shrunk_stages": self.shrunk,
+        }
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Any, Literal
+
+from app.config import settings
+from app.services.llm_registry import llm_registry
+from app.utils.exceptions import ValidationError
+
+Provider = Literal["azure", "openai"]
+# 约束输出能力：json_schema 按 schema 约束，json_object 只保证合法 JSON，none 不支持 response_format
+StructuredOutput = Literal["json_schema", "json_object", "none"]
+
+# 无延迟样本时视为最优，保证新 endpoint 能尽快获得样本
+_UNKNOWN_LATENCY = 0.0
+# 错误率的附加惩罚（秒），避免只失败过、尚无延迟样本的 endpoint 排在前面
+_ERROR_PENALTY_SECONDS = 10.0
+_BREAKER_ORDER = {"closed": 0, "half_open": 1, "open": 2}
+
+
+@dataclass(frozen=True)
+class LLMEndpoint:
+    """逻辑模型的一个物理部署：Azure OpenAI deployment 或 OpenAI 兼容接口（如 DeepSeek API）。"""
+
+    name: str
+    base_url: str
+    api_key: str
+    deployment: str  # Azure 为 deployment 名，OpenAI 兼容接口为 model id
+    provider: Provider = "azure"
+    api_version: str = ""
+    structured_output: StructuredOutput = "none"
+
+    @property
+    def key(self) -> str:
+        """熔断器、限流与统计使用的上游键"""
+        return f"{self.name}:{self.deployment}"
+
+    def build_request(self) -> tuple[str, dict[str, str], dict[str, Any]]:
+        """返回 (url, headers, 需合并进请求体的字段)"""
+        base_url = self.base_url.rstrip("/")
+        if self.provider == "openai":
+            url = f"{base_url}/chat/completions"
+            headers = {
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            }
+            return url, headers, {"model": self.deployment}
+
+        url = (
+            f"{base_url}/openai/deployments/{self.deployment}/chat/completions"
+            f"?api-version={self.api_version or settings.AZURE_OPENAI_API_VERSION}"
+        )
+        headers = {
+            "api-key": self.api_key,
+            "Content-Type": "application/json",
+        }
+        return url, headers, {}
+
+    def request_params(self, params: dict[str, Any] | None) -> dict[str, Any]:
+        """把通用请求参数转换为该 endpoint 接受的字段。
+
+        max_tokens：Azure 新版模型只接受 max_completion_tokens，OpenAI 兼容接口使用 max_tokens；
+        response_format：按 endpoint 的约束输出能力降级（json_schema → json_object → 不发送）。
+        """
+        params = params or {}
+        extra: dict[str, Any] = {}
+        if params.get("max_tokens"):
+            field = "max_tokens" if self.provider == "openai" else "max_completion_tokens"
+            extra[field] = params["max_tokens"]
+        response_format = params.get("response_format")
+        if response_format and self.structured_output == "json_schema":
+            extra["response_format"] = response_format
+        elif response_format and self.structured_output == "json_object":
+            extra["response_format"] = {"type": "json_object"}
+        return extra
+
+
+def load_endpoints() -> dict[str, list[LLMEndpoint]]:
+    """从 LLM_ENDPOINTS 读取逻辑模型到 endpoint 的映射；未配置时沿用 Azure 单 endpoint 设置"""
+    if settings.LLM_ENDPOINTS:
+        endpoints: dict[str, list[LLMEndpoint]] = {}
+        for model, items in settings.LLM_ENDPOINTS.items():
+            endpoints[model] = [_parse_endpoint(model, index, item) for index, item in enumerate(items)]
+        return endpoints
+
+    if not (settings.AZURE_OPENAI_ENDPOINT and settings.AZURE_OPENAI_API_KEY):
+        return {}
+
+    def azure(deployment: str) -> list[LLMEndpoint]:
+        return [
+            LLMEndpoint(
+                name="azure",
+                base_url=settings.AZURE_OPENAI_ENDPOINT,
+                api_key=settings.AZURE_OPENAI_API_KEY,
+                deployment=deployment,
+                api_version=settings.AZURE_OPENAI_API_VERSION,
+                structured_output=_default_structured_output("azure", deployment),
+            )
+        ]
+
+    return {
+        settings.DEFAULT_MODEL: azure(settings.AZURE_OPENAI_DEPLOYMENT_NAME),
+        settings.CS_SPECIALIST_MODEL: azure(settings.AZURE_DEEPSEEK_DEPLOYMENT_NAME),
+    }
+
+
+def _parse_endpoint(model: str, index: int, item: dict[str, Any]) -> LLMEndpoint:
+    provider = item.get("provider", "azure")
+    if provider not in ("azure", "openai"):
+        raise ValidationError(f"LLM_ENDPOINTS[{model}][{index}] 不支持的 provider: {provider}", field="LLM_ENDPOINTS")
+    structured_output = item.get("structured_output") or _default_structured_output(
+        provider, str(item.get("deployment") or model)
+    )
+    if structured_output not in ("json_schema", "json_object", "none"):
+        raise ValidationError(
+            f"LLM_ENDPOINTS[{model}][{index}] 不支持的 structured_output: {structured_output}",
+            field="LLM_ENDPOINTS",
+        )
+    try:
+        return LLMEndpoint(
+            name=str(item.get("name") or f"{provider}-{index}"),
+            base_url=str(item["base_url"]),
+            api_key=str(item["api_key"]),
+            deployment=str(item.get("deployment") or model),
+            provider=provider,
+            api_version=str(item.get("api_version", "")),
+            structured_output=structured_output,
+        )
+    except KeyError as exc:
+        raise ValidationError(f"LLM_ENDPOINTS[{model}][{index}] 缺少字段: {exc.args[0]}", field="LLM_ENDPOINTS")
+
+
+def _default_structured_output(provider: str, deployment: str) -> StructuredOutput:
+    """Azure OpenAI 的 GPT 部署支持 json_schema；DeepSeek 等推理模型与未知接口默认不发送 response_format"""
+    if provider == "azure" and "deepseek" not in deployment.lower():
+        return "json_schema"
+    return "none"
+
+
+class EndpointRouter:
+    """按 EWMA 延迟与错误率为逻辑模型挑选 endpoint，熔断打开的 endpoint 排在最后。"""
+
+    def __init__(self, endpoints: dict[str, list[LLMEndpoint]]) -> None:
+        self._endpoints = endpoints
+        self._explored = 0
+
+    @property
+    def models(self) -> list[str]:
+        return list(self._endpoints.keys())
+
+    def base_urls(self) -> list[str]:
+        return sorted({endpoint.base_url for items in self._endpoints.values() for endpoint in items})
+
+    def candidates(self, model: str) -> list[LLMEndpoint]:
+        """返回按优先级排序的候选 endpoint，调用方依次尝试以实现故障转移"""
+        endpoints = self._endpoints.get(model)
+        if not endpoints:
+            raise ValidationError(f"不支持的模型: {model}", field="model")
+
+        ranked = sorted(endpoints, key=self._rank)
+        healthy = [e for e in ranked if llm_registry.breaker(e.key).state == "closed"]
+        if len(healthy) > 1 and random.random() < settings.LLM_ENDPOINT_EXPLORE_RATIO:
+            self._explored += 1
+            ranked.remove(healthy[1])
+            ranked.insert(0, healthy[1])
+        return ranked
+
+    def get_health(self) -> dict[str, Any]:
+        health: dict[str, Any] = {}
+        for model, endpoints in self._endpoints.items():
+            health[model] = [
+                {
+                    "name": endpoint.name,
+                    "provider": endpoint.provider,
+                    "deployment": endpoint.deployment,
+                    "score": self._score(endpoint),
+                    "circuit_breaker": llm_registry.breaker(endpoint.key).get_stats(),
+                    **{
+                        k: v
+                        for k, v in llm_registry.stats(endpoint.key).get_stats().items()
+                        if k in ("calls", "failures", "ewma_latency", "ewma_error_rate", "latency_p90")
+                    },
+                }
+                for endpoint in endpoints
+            ]
+        return {"models": health, "explored": self._explored}
+
+    def _rank(self, endpoint: LLMEndpoint) -> tuple[int, float]:
+        return _BREAKER_ORDER[llm_registry.breaker(endpoint.key).state], self._score(endpoint)
+
+    @staticmethod
+    def _score(endpoint: LLMEndpoint) -> float:
+        """期望有效延迟：EWMA 延迟按 EWMA 成功率放大，再加错误率惩罚"""
+        stats = llm_registry.stats(endpoint.key)
+        latency = stats.ewma_latency if stats.ewma_latency is not None else _UNKNOWN_LATENCY
+        error_rate = stats.ewma_error_rate
+        return latency / max(0.05, 1.0 - error_rate) + error_rate * _ERROR_PENALTY_SECONDS
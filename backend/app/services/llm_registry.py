@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import TYPE_CHECKING, Any
+
+from app.config import settings
+from app.services.circuit_breaker import CircuitBreaker
+
+if TYPE_CHECKING:
+    from app.services.deepseek_service import DeepSeekService
+    from app.services.llm_service import LLMService
+
+_LATENCY_SAMPLES = 512
+
+
+class UpstreamStats:
+    """单个上游（模型/deployment）的调用、token 与延迟统计。"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self._latencies: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.ewma_latency: float | None = None
+        self.ewma_error_rate = 0.0
+
+    def record_success(self, latency: float, usage: dict[str, Any] | None) -> None:
+        self.calls += 1
+        self._latencies.append(latency)
+        self._update_ewma(latency, failed=False)
+        usage = usage or {}
+        self.prompt_tokens += usage.get("prompt_tokens", 0) or 0
+        self.completion_tokens += usage.get("completion_tokens", 0) or 0
+        self.total_tokens += usage.get("total_tokens", 0) or 0
+
+    def record_failure(self) -> None:
+        self.calls += 1
+        self.failures += 1
+        self._update_ewma(None, failed=True)
+
+    @property
+    def sample_count(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, q: float) -> float | None:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "success_rate": (self.calls - self.failures) / max(self.calls, 1),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "latency_p50": self.percentile(0.5),
+            "latency_p90": self.percentile(0.9),
+            "latency_p99": self.percentile(0.99),
+            "ewma_latency": self.ewma_latency,
+            "ewma_error_rate": round(self.ewma_error_rate, 4),
+        }
+
+    def _update_ewma(self, latency: float | None, failed: bool) -> None:
+        alpha = settings.LLM_ENDPOINT_EWMA_ALPHA
+        self.ewma_error_rate = (1 - alpha) * self.ewma_error_rate + alpha * (1.0 if failed else 0.0)
+        if latency is not None:
+            self.ewma_latency = (
+                latency if self.ewma_latency is None else (1 - alpha) * self.ewma_latency + alpha * latency
+            )
+
+
+class LLMRegistry:
+    """进程级 LLM 客户端注册表：每个上游一个共享客户端，按模型/deployment 维护熔断器与统计。"""
+
+    def __init__(self) -> None:
+        self._llm: LLMService | None = None
+        self._deepseek: DeepSeekService | None = None
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._stats: dict[str, UpstreamStats] = {}
+
+    def llm(self) -> LLMService:
+        if self._llm is None:
+            from app.services.llm_service import LLMService
+
+            self._llm = LLMService()
+        return self._llm
+
+    def deepseek(self) -> DeepSeekService:
+        if self._deepseek is None:
+            from app.services.deepseek_service import DeepSeekService
+
+            self._deepseek = DeepSeekService()
+        return self._deepseek
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                key,
+                window_seconds=settings.LLM_BREAKER_WINDOW_SECONDS,
+                min_requests=settings.LLM_BREAKER_MIN_REQUESTS,
+                error_rate_threshold=settings.LLM_BREAKER_ERROR_RATE,
+                open_seconds=settings.LLM_BREAKER_OPEN_SECONDS,
+            )
+            self._breakers[key] = breaker
+        return breaker
+
+    def stats(self, key: str) -> UpstreamStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = UpstreamStats()
+            self._stats[key] = stats
+        return stats
+
+    def get_stats(self) -> dict[str, Any]:
+        upstreams = {key: stats.get_stats() for key, stats in self._stats.items()}
+        total_calls = sum(item["calls"] for item in upstreams.values())
+        failed_calls = sum(item["failures"] for item in upstreams.values())
+        return {
+            "total_calls": total_calls,
+            "failed_calls": failed_calls,
+            "total_tokens": sum(item["total_tokens"] for item in upstreams.values()),
+            "success_rate": (total_calls - failed_calls) / max(total_calls, 1),
+            "circuit_breaker_open": any(b.state != "closed" for b in self._breakers.values()),
+            "circuit_breakers": {key: breaker.get_stats() for key, breaker in self._breakers.items()},
+            "upstreams": upstreams,
+        }
+
+
+llm_registry = LLMRegistry()
+
+
+def get_llm_service() -> LLMService:
+    return llm_registry.llm()
+
+
+def get_deepseek_service() -> DeepSeekService:
+    return llm_registry.deepseek()
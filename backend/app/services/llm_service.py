@@ -2,7 +2,8 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Iterable
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable
 import httpx
 from tenacity import (
     retry,
@@ -14,44 +15,69 @@ from tenacity import (
 import logging
 
 from app.config import settings
-from app.utils.exceptions import LLMError, ValidationError
+from app.services.hedging import Hedger
+from app.services.llm_endpoints import EndpointRouter, LLMEndpoint, load_endpoints
+from app.services.llm_registry import llm_registry
+from app.services.model_router import get_model_router
+from app.services.rate_limiter import rate_limiters
+from app.services.token_usage import record_usage
+from app.utils.http_client import http_clients
+from app.utils.llm_cache import LLMResponseCache, llm_cache
+from app.utils.singleflight import SingleFlight
+from app.utils.json_stream import JsonStreamParser, extract_json_object, validate_json
+from app.utils.sse import aiter_sse_json, chat_chunk_delta
+from app.utils.tokens import count_message_tokens
+from app.utils.exceptions import LLMError
 
 logger = logging.getLogger(__name__)
 
+# 流式输出回调：每收到一段增量文本调用一次
+TokenCallback = Callable[[str], Awaitable[None]]
+# 流式 JSON 回调：每个顶层字段完整后调用一次
+FieldCallback = Callable[[str, Any], Awaitable[None]]
+
+# 进程内共享：相同请求的并发调用合并为一次上游调用
+_inflight = SingleFlight()
+
+# 进程内共享的对冲预算
+_hedger = Hedger(max_ratio=settings.LLM_HEDGE_MAX_RATIO)
+
+# 按 JSON 阶段名统计的解析结果：calls 为逻辑调用数，invalid 为不合法输出次数（含重试），exhausted 为重试耗尽次数
+_json_stats: dict[str, dict[str, int]] = {}
+
 class LLMService:
     """优化后的 LLM 服务"""
     
     def __init__(self) -> None:
-        self._endpoint = settings.AZURE_OPENAI_ENDPOINT.rstrip("/")
-        self._api_version = settings.AZURE_OPENAI_API_VERSION
-        self._api_key = settings.AZURE_OPENAI_API_KEY
-        self._configured = bool(self._endpoint and self._api_key)
-        
-        self._model_deployments = {
-            settings.DEFAULT_MODEL: settings.AZURE_OPENAI_DEPLOYMENT_NAME,
-            settings.CS_SPECIALIST_MODEL: settings.AZURE_DEEPSEEK_DEPLOYMENT_NAME,
-        }
-        
-        self._supported_models = list(self._model_deployments.keys())
-        
-        # 添加熔断器状态
-        self._circuit_breaker_failures = 0
-        self._circuit_breaker_threshold = 5
-        self._circuit_breaker_open = False
-        self._circuit_breaker_reset_time = None
-        
-        # 性能统计
-        self._call_count = 0
-        self._total_tokens = 0
-        self._failed_calls = 0
+        # 每个逻辑模型可对应多个 endpoint（多区域 Azure / OpenAI 兼容接口），按延迟与错误率路由
+        self._router = EndpointRouter(load_endpoints())
+        self._configured = bool(self._router.models)
+        self._supported_models = self._router.models
+        self._model_router = get_model_router()
     
-    async def generate_simple(self, prompt: str, model: str | None = None) -> str:
-        """生成简单回答"""
+    @property
+    def configured(self) -> bool:
+        """是否配置了可用的模型；未配置时所有调用返回占位回复"""
+        return self._configured
+
+    async def generate_simple(
+        self,
+        prompt: str,
+        model: str | None = None,
+        *,
+        cache: bool = True,
+        hedge: bool = False,
+        max_tokens: int | None = None,
+    ) -> str:
+        """生成简单回答（cache=False 时跳过响应缓存；hedge=True 时对慢响应发出对冲请求；
+        max_tokens 限制输出长度，用于延迟预算紧张的阶段）"""
         if model is None:
             model = settings.DEFAULT_MODEL
         
         messages = [{"role": "user", "content": prompt}]
-        response = await self._chat(messages, model=model)
+        response = await self._cached_chat(
+            messages, model=model, params=self._limit_params(max_tokens), cache=cache, hedge=hedge
+        )
         return response["content"]
     
     async def generate_response(
@@ -60,43 +86,314 @@ class LLMService:
         user_message: str,
         conversation_history: Iterable[Any],
         model: str | None = None,
+        *,
+        cache: bool = True,
+        hedge: bool = False,
+        max_tokens: int | None = None,
     ) -> dict[str, Any]:
         """生成对话式回答"""
         if model is None:
             model = settings.DEFAULT_MODEL
         
+        messages = self._build_messages(system_prompt, user_message, conversation_history)
+        return await self._cached_chat(
+            messages, model=model, params=self._limit_params(max_tokens), cache=cache, hedge=hedge
+        )
+
+    async def generate_messages(
+        self,
+        messages: list[dict[str, str]],
+        model: str | None = None,
+        *,
+        cache: bool = True,
+    ) -> dict[str, Any]:
+        """直接以消息列表调用（多轮 ReAct 等需要自行维护上下文的场景）"""
+        if model is None:
+            model = settings.DEFAULT_MODEL
+
+        return await self._cached_chat(messages, model=model, cache=cache)
+
+    async def generate_json(
+        self,
+        prompt: str,
+        schema: dict[str, Any],
+        model: str | None = None,
+        *,
+        name: str,
+        cache: bool = True,
+        hedge: bool = False,
+        max_tokens: int | None = None,
+    ) -> dict[str, Any]:
+        """生成符合 JSON Schema 的对象。
+
+        支持的 endpoint 以 response_format 约束输出；解析或校验失败时附上错误说明重试
+        （最多 LLM_JSON_MAX_RETRIES 次），仍失败则返回已解析出的部分（可能为空字典）。
+        name 用作 schema 名称与解析统计的键。
+        """
+        if model is None:
+            model = settings.DEFAULT_MODEL
+
+        messages = [{"role": "user", "content": prompt}]
+        params = self._json_params(name, schema, max_tokens)
+        response = await self._cached_chat(messages, model=model, params=params, cache=cache, hedge=hedge)
+        return await self._validated_json(name, schema, messages, model, params, response["content"], cache)
+
+    async def stream_json(
+        self,
+        prompt: str,
+        schema: dict[str, Any],
+        model: str | None = None,
+        *,
+        name: str,
+        on_field: FieldCallback | None = None,
+        cache: bool = True,
+        max_tokens: int | None = None,
+    ) -> dict[str, Any]:
+        """流式生成 JSON：每个顶层字段完整后立即回调 on_field，下游可在输出结束前开始工作；
+        结束后与 generate_json 相同地校验与重试（重试结果不再逐字段回调）"""
+        if model is None:
+            model = settings.DEFAULT_MODEL
+
+        messages = [{"role": "user", "content": prompt}]
+        params = self._json_params(name, schema, max_tokens)
+        parser = JsonStreamParser()
+        chunks: list[str] = []
+        async for delta in self._cached_chat_stream(messages, model=model, params=params, cache=cache):
+            chunks.append(delta)
+            for key, value in parser.feed(delta):
+                if on_field:
+                    await on_field(key, value)
+        return await self._validated_json(name, schema, messages, model, params, "".join(chunks), cache)
+
+    async def stream_simple(
+        self,
+        prompt: str,
+        model: str | None = None,
+        *,
+        cache: bool = True,
+    ) -> AsyncIterator[str]:
+        """流式生成简单回答，逐段产出增量文本"""
+        if model is None:
+            model = settings.DEFAULT_MODEL
+
+        messages = [{"role": "user", "content": prompt}]
+        async for delta in self._cached_chat_stream(messages, model=model, cache=cache):
+            yield delta
+
+    async def stream_response(
+        self,
+        system_prompt: str,
+        user_message: str,
+        conversation_history: Iterable[Any],
+        model: str | None = None,
+        *,
+        cache: bool = True,
+        max_tokens: int | None = None,
+    ) -> AsyncIterator[str]:
+        """流式生成对话式回答，逐段产出增量文本"""
+        if model is None:
+            model = settings.DEFAULT_MODEL
+
+        messages = self._build_messages(system_prompt, user_message, conversation_history)
+        params = self._limit_params(max_tokens)
+        async for delta in self._cached_chat_stream(messages, model=model, params=params, cache=cache):
+            yield delta
+
+    @staticmethod
+    def _build_messages(
+        system_prompt: str,
+        user_message: str,
+        conversation_history: Iterable[Any],
+    ) -> list[dict[str, str]]:
         messages = [{"role": "system", "content": system_prompt}]
         for item in conversation_history:
-            role = getattr(item, "role", None) or "user"
-            content = getattr(item, "content", None) or ""
+            # ORM 消息对象或（检查点中保存的）字典
+            if isinstance(item, dict):
+                role, content = item.get("role") or "user", item.get("content") or ""
+            else:
+                role = getattr(item, "role", None) or "user"
+                content = getattr(item, "content", None) or ""
             messages.append({"role": role, "content": content})
         messages.append({"role": "user", "content": user_message})
-        
-        return await self._chat(messages, model=model)
+        return messages
+
+    @staticmethod
+    def _limit_params(max_tokens: int | None) -> dict[str, Any] | None:
+        return {"max_tokens": max_tokens} if max_tokens else None
+
+    @staticmethod
+    def _json_params(name: str, schema: dict[str, Any], max_tokens: int | None) -> dict[str, Any] | None:
+        params: dict[str, Any] = {"max_tokens": max_tokens} if max_tokens else {}
+        if settings.LLM_STRUCTURED_OUTPUT_ENABLED:
+            params["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": name, "schema": schema, "strict": True},
+            }
+        return params or None
+
+    async def _validated_json(
+        self,
+        name: str,
+        schema: dict[str, Any],
+        messages: list[dict[str, str]],
+        model: str,
+        params: dict[str, Any] | None,
+        raw: str,
+        cache: bool,
+    ) -> dict[str, Any]:
+        stats = _json_stats.setdefault(name, {"calls": 0, "invalid": 0, "retries": 0, "exhausted": 0})
+        stats["calls"] += 1
+        data, errors = self._parse_json(raw, schema)
+        if not errors or not self._configured:
+            return data
+
+        cache_key = self._request_key(messages, model, params) if cache and settings.LLM_CACHE_ENABLED else None
+        for _ in range(settings.LLM_JSON_MAX_RETRIES):
+            stats["invalid"] += 1
+            stats["retries"] += 1
+            logger.warning("Invalid JSON from %s (%s), retrying", name, "; ".join(errors[:3]))
+            retry_messages = [
+                *messages,
+                {"role": "assistant", "content": raw},
+                {
+                    "role": "user",
+                    "content": (
+                        f"上面的输出不符合要求：{'; '.join(errors[:5])}。"
+                        "请只输出一个符合 JSON Schema 的 JSON 对象，不要包含其他内容。"
+                    ),
+                },
+            ]
+            response = await self._cached_chat(retry_messages, model=model, params=params, cache=False)
+            raw = response["content"]
+            data, errors = self._parse_json(raw, schema)
+            if not errors:
+                # 用合法结果覆盖首次请求的缓存项，相同请求不会再命中无效输出
+                if cache_key:
+                    await llm_cache.set(cache_key, response)
+                return data
+
+        stats["invalid"] += 1
+        stats["exhausted"] += 1
+        logger.warning("Invalid JSON from %s after retries (%s)", name, "; ".join(errors[:3]))
+        if cache_key:
+            await llm_cache.delete(cache_key)
+        return data
+
+    @staticmethod
+    def _parse_json(raw: str, schema: dict[str, Any]) -> tuple[dict[str, Any], list[str]]:
+        data = extract_json_object(raw)
+        if data is None:
+            return {}, ["output is not a JSON object"]
+        return data, validate_json(data, schema)
     
     def get_recommended_model(self, question: str) -> str:
-        """推荐模型（保持原有逻辑）"""
-        question_lower = question.lower()
-        
-        cs_keywords = {
-            'python', 'java', 'javascript', 'typescript', 'c++', 'c#', 'go', 'rust',
-            'code', 'coding', 'programming', 'debug', 'bug', 'error', 'api',
-            'database', 'sql', 'algorithm', 'function', 'class', 'react', 'vue',
-        }
-        
-        if any(kw in question_lower for kw in cs_keywords):
-            return settings.CS_SPECIALIST_MODEL
-        
-        return settings.DEFAULT_MODEL
+        """推荐模型（关键词加权路由，同一问题的结果会被记忆）"""
+        return self._model_router.route(question).model
 
     def get_stats(self) -> dict[str, Any]:
+        """获取服务统计信息（熔断器与延迟/token 统计来自进程级注册表）"""
         return {
-            "call_count": self._call_count,
-            "failed_calls": self._failed_calls,
-            "total_tokens": self._total_tokens,
-            "circuit_breaker_open": self._circuit_breaker_open,
+            **llm_registry.get_stats(),
+            "cache": llm_cache.get_stats(),
+            "singleflight": _inflight.get_stats(),
+            "rate_limits": rate_limiters.get_stats(),
+            "hedging": _hedger.get_stats(),
+            "endpoints": self._router.get_health(),
+            "model_router": self._model_router.get_stats(),
+            "structured_output": {
+                name: {**stats, "invalid_rate": round(stats["invalid"] / max(stats["calls"] + stats["retries"], 1), 4)}
+                for name, stats in _json_stats.items()
+            },
         }
-    
+
+    def endpoint_base_urls(self) -> list[str]:
+        """已配置 endpoint 的基础 URL，用于启动时预建连接池"""
+        return self._router.base_urls()
+
+    async def _cached_chat(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        *,
+        params: dict[str, Any] | None = None,
+        cache: bool = True,
+        hedge: bool = False,
+    ) -> dict[str, Any]:
+        """_chat 前的缓存与合并层：键为 (deployment, 归一化 messages, 请求参数)
+
+        cache=False 的非确定性阶段既不读写缓存，也不与其他调用合并。
+        """
+        if not cache:
+            return await self._hedged_chat(messages, model, hedge, params)
+
+        key = self._request_key(messages, model, params)
+        if settings.LLM_CACHE_ENABLED:
+            cached = await llm_cache.get(key)
+            if cached is not None:
+                return cached
+
+        async def call() -> dict[str, Any]:
+            response = await self._hedged_chat(messages, model, hedge, params)
+            if settings.LLM_CACHE_ENABLED and response.get("model") != "local-fallback":
+                await llm_cache.set(key, response)
+            return response
+
+        if not settings.LLM_SINGLEFLIGHT_ENABLED:
+            return await call()
+        return await _inflight.do(key, call)
+
+    async def _cached_chat_stream(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        *,
+        params: dict[str, Any] | None = None,
+        cache: bool = True,
+    ) -> AsyncIterator[str]:
+        """流式调用的缓存层：命中时一次性产出完整内容，完整结束后写入缓存"""
+        key = self._request_key(messages, model, params) if cache and settings.LLM_CACHE_ENABLED else None
+        if key:
+            cached = await llm_cache.get(key)
+            if cached is not None:
+                yield cached["content"]
+                return
+
+        chunks: list[str] = []
+        async for delta in self._chat_stream(messages, model=model, params=params):
+            chunks.append(delta)
+            yield delta
+
+        if key and self._configured:
+            await llm_cache.set(key, {"content": "".join(chunks), "model": model, "usage": {}})
+
+    async def _hedged_chat(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        hedge: bool,
+        params: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        if not hedge or not settings.LLM_HEDGE_ENABLED or not self._configured:
+            return await self._chat(messages, model=model, params=params)
+        return await _hedger.run(lambda: self._chat(messages, model=model, params=params), self._hedge_delay(model))
+
+    def _hedge_delay(self, model: str) -> float | None:
+        """对冲阈值取首选 endpoint 观测到的分位延迟；样本不足时返回 None（不对冲）"""
+        stats = llm_registry.stats(self._router.candidates(model)[0].key)
+        if stats.sample_count < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        latency = stats.percentile(settings.LLM_HEDGE_PERCENTILE)
+        return max(settings.LLM_HEDGE_MIN_DELAY_SECONDS, latency or 0.0)
+
+    def _request_key(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        params: dict[str, Any] | None,
+    ) -> str:
+        # 同一逻辑模型的各 endpoint 视为等价，缓存键按模型名而非具体部署
+        return LLMResponseCache.make_key(model, messages, params)
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=2, max=10),
@@ -104,20 +401,13 @@ class LLMService:
         before_sleep=before_sleep_log(logger, logging.WARNING),
         reraise=True
     )
-    async def _chat(self, messages: list[dict[str, str]], model: str) -> dict[str, Any]:
-        """调用 Azure OpenAI Chat API（带重试）"""
-        
-        # 检查熔断器
-        if self._circuit_breaker_open:
-            if self._circuit_breaker_reset_time and asyncio.get_event_loop().time() > self._circuit_breaker_reset_time:
-                logger.info("Circuit breaker reset, retrying...")
-                self._circuit_breaker_open = False
-                self._circuit_breaker_failures = 0
-            else:
-                raise LLMError(
-                    "服务暂时不可用，请稍后重试",
-                    details={"reason": "circuit_breaker_open"}
-                )
+    async def _chat(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        params: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        """调用 Chat API（带重试）：按路由顺序尝试各 endpoint，可转移的失败切换到下一个"""
         
         # 未配置时返回占位
         if not self._configured:
@@ -126,39 +416,48 @@ class LLMService:
                 "model": "local-fallback",
             }
         
-        # 验证模型
-        deployment_name = self._model_deployments.get(model)
-        if not deployment_name:
-            raise ValidationError(
-                f"不支持的模型: {model}",
-                field="model"
-            )
-        
-        # 构造请求
-        url = (
-            f"{self._endpoint}/openai/deployments/{deployment_name}/chat/completions"
-            f"?api-version={self._api_version}"
-        )
-        headers = {
-            "api-key": self._api_key,
-            "Content-Type": "application/json"
-        }
-        payload = {"messages": messages}
+        endpoints = self._router.candidates(model)
+        for index, endpoint in enumerate(endpoints):
+            try:
+                return await self._chat_endpoint(endpoint, messages, model, params)
+            except LLMError as e:
+                if index == len(endpoints) - 1 or not self._should_failover(e):
+                    raise
+                logger.warning("Endpoint %s failed (%s), failing over", endpoint.key, e.message)
+        raise AssertionError("unreachable")
+
+    async def _chat_endpoint(
+        self,
+        endpoint: LLMEndpoint,
+        messages: list[dict[str, str]],
+        model: str,
+        params: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        url, headers, extra = endpoint.build_request()
+        payload = {"messages": messages, **extra, **endpoint.request_params(params)}
+        scheduler = rate_limiters.get(endpoint.key)
+        estimated_tokens = count_message_tokens(messages)
+
+        # 检查熔断器
+        probe = self._acquire_breaker(endpoint)
+        started = time.perf_counter()
         
         try:
-            async with httpx.AsyncClient(timeout=300) as client:
-                response = await client.post(url, headers=headers, json=payload)
-                response.raise_for_status()
-                data = response.json()
+            client = http_clients.get(endpoint.base_url)
+            # 429 由调度器按 Retry-After 排队重试，不计入熔断器
+            for attempt in range(settings.LLM_RATE_LIMIT_MAX_RETRIES + 1):
+                async with scheduler.slot(estimated_tokens):
+                    response = await client.post(url, headers=headers, json=payload)
+                scheduler.observe(response.status_code, response.headers)
+                if response.status_code != 429:
+                    break
+            response.raise_for_status()
+            data = response.json()
             
             # 更新统计
-            self._call_count += 1
-            if "usage" in data:
-                self._total_tokens += data["usage"].get("total_tokens", 0)
-            
-            # 重置熔断器失败计数
-            if self._circuit_breaker_failures > 0:
-                self._circuit_breaker_failures = 0
+            usage = data.get("usage") or {}
+            scheduler.settle(estimated_tokens, usage.get("total_tokens"))
+            self._record_success(endpoint, probe, time.perf_counter() - started, usage)
             
             choice = data["choices"][0]["message"]
             return {
@@ -167,67 +466,161 @@ class LLMService:
                 "usage": data.get("usage", {})
             }
             
-        except httpx.TimeoutException as e:
-            self._failed_calls += 1
-            self._increment_circuit_breaker()
+        except asyncio.CancelledError:
+            llm_registry.breaker(endpoint.key).release(probe)
+            raise
+        except Exception as e:
+            raise self._to_llm_error(e, model, endpoint, probe)
+
+    async def _chat_stream(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        params: dict[str, Any] | None = None,
+    ) -> AsyncIterator[str]:
+        """以 SSE 流式调用 Chat API，逐段产出增量文本。
+
+        已产出部分 token 后无法透明重试，因此流式调用不走 tenacity 重试，
+        也只在尚未产出内容时切换 endpoint。
+        """
+        if not self._configured:
+            yield f"LLM 未配置，返回占位回复。\n请求模型: {model}"
+            return
+
+        endpoints = self._router.candidates(model)
+        for index, endpoint in enumerate(endpoints):
+            emitted = False
+            try:
+                async for delta in self._chat_stream_endpoint(endpoint, messages, model, params):
+                    emitted = True
+                    yield delta
+                return
+            except LLMError as e:
+                if emitted or index == len(endpoints) - 1 or not self._should_failover(e):
+                    raise
+                logger.warning("Endpoint %s failed (%s), failing over", endpoint.key, e.message)
+
+    async def _chat_stream_endpoint(
+        self,
+        endpoint: LLMEndpoint,
+        messages: list[dict[str, str]],
+        model: str,
+        params: dict[str, Any] | None = None,
+    ) -> AsyncIterator[str]:
+        url, headers, extra = endpoint.build_request()
+        payload = {
+            "messages": messages,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            **extra,
+            **endpoint.request_params(params),
+        }
+        scheduler = rate_limiters.get(endpoint.key)
+        estimated_tokens = count_message_tokens(messages)
+
+        probe = self._acquire_breaker(endpoint)
+        started = time.perf_counter()
+
+        try:
+            client = http_clients.get(endpoint.base_url)
+            usage: dict[str, Any] = {}
+            for attempt in range(settings.LLM_RATE_LIMIT_MAX_RETRIES + 1):
+                async with scheduler.slot(estimated_tokens):
+                    async with client.stream("POST", url, headers=headers, json=payload) as response:
+                        scheduler.observe(response.status_code, response.headers)
+                        if response.status_code == 429 and attempt < settings.LLM_RATE_LIMIT_MAX_RETRIES:
+                            continue
+                        if response.is_error:
+                            await response.aread()
+                            response.raise_for_status()
+
+                        async for chunk in aiter_sse_json(response):
+                            if chunk.get("usage"):
+                                usage = chunk["usage"]
+                            delta = chat_chunk_delta(chunk)
+                            if delta:
+                                yield delta
+                break
+
+            scheduler.settle(estimated_tokens, usage.get("total_tokens"))
+            self._record_success(endpoint, probe, time.perf_counter() - started, usage)
+
+        except (asyncio.CancelledError, GeneratorExit):
+            llm_registry.breaker(endpoint.key).release(probe)
+            raise
+        except Exception as e:
+            raise self._to_llm_error(e, model, endpoint, probe)
+
+    @staticmethod
+    def _should_failover(e: LLMError) -> bool:
+        """熔断、限流、超时/网络错误与 5xx 可换 endpoint 重试；其余 4xx 换了也会失败"""
+        status_code = e.details.get("status_code")
+        return status_code is None or status_code == 429 or status_code >= 500
+
+    def _acquire_breaker(self, endpoint: LLMEndpoint) -> bool:
+        """检查 endpoint 的熔断器，放行时返回是否为半开探测请求"""
+        probe = llm_registry.breaker(endpoint.key).before_call()
+        if probe is None:
             raise LLMError(
+                "服务暂时不可用，请稍后重试",
+                details={"reason": "circuit_breaker_open", "endpoint": endpoint.key}
+            )
+        return probe
+
+    def _record_success(
+        self,
+        endpoint: LLMEndpoint,
+        probe: bool,
+        latency: float,
+        usage: dict[str, Any] | None,
+    ) -> None:
+        llm_registry.stats(endpoint.key).record_success(latency, usage)
+        llm_registry.breaker(endpoint.key).record_success(probe)
+        record_usage(usage)
+
+    def _to_llm_error(self, e: Exception, model: str, endpoint: LLMEndpoint, probe: bool) -> LLMError:
+        """将底层异常转换为 LLMError，并计入失败统计与熔断器"""
+        if isinstance(e, LLMError):
+            # 调度器排队超时等本地错误：请求未到达上游，只归还探测名额
+            llm_registry.breaker(endpoint.key).release(probe)
+            return e
+
+        llm_registry.stats(endpoint.key).record_failure()
+        # 429 是配额问题而非服务故障，不计入熔断器
+        if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
+            llm_registry.breaker(endpoint.key).release(probe)
+        else:
+            llm_registry.breaker(endpoint.key).record_failure(probe)
+
+        if isinstance(e, httpx.TimeoutException):
+            return LLMError(
                 "LLM 请求超时",
-                details={"model": model, "timeout": 300},
+                details={"model": model, "endpoint": endpoint.key, "timeout": settings.HTTP_READ_TIMEOUT},
                 original_error=e
             )
-        
-        except httpx.HTTPStatusError as e:
-            self._failed_calls += 1
-            self._increment_circuit_breaker()
-            
+
+        if isinstance(e, httpx.HTTPStatusError):
             if e.response.status_code == 429:
-                raise LLMError(
+                return LLMError(
                     "API 速率限制，请稍后重试",
-                    details={"status_code": 429, "model": model},
+                    details={"status_code": 429, "model": model, "endpoint": endpoint.key},
                     original_error=e
                 )
             elif e.response.status_code >= 500:
-                raise LLMError(
+                return LLMError(
                     "LLM 服务暂时不可用",
-                    details={"status_code": e.response.status_code, "model": model},
+                    details={"status_code": e.response.status_code, "model": model, "endpoint": endpoint.key},
                     original_error=e
                 )
             else:
-                raise LLMError(
+                return LLMError(
                     f"LLM API 错误: {e.response.status_code}",
                     details={"status_code": e.response.status_code, "response": e.response.text[:200]},
                     original_error=e
                 )
-        
-        except Exception as e:
-            self._failed_calls += 1
-            self._increment_circuit_breaker()
-            raise LLMError(
-                f"LLM 调用失败: {str(e)}",
-                details={"model": model},
-                original_error=e
-            )
-    
-    def _increment_circuit_breaker(self):
-        """增加熔断器失败计数"""
-        self._circuit_breaker_failures += 1
-        
-        if self._circuit_breaker_failures >= self._circuit_breaker_threshold:
-            self._circuit_breaker_open = True
-            # 30 秒后尝试重置
-            self._circuit_breaker_reset_time = asyncio.get_event_loop().time() + 30
-            logger.error(
-                f"Circuit breaker opened after {self._circuit_breaker_failures} failures. "
-                f"Will reset in 30 seconds."
-            )
-    
-    def get_stats(self) -> dict[str, Any]:
-        """获取服务统计信息"""
-        return {
-            "total_calls": self._call_count,
-            "failed_calls": self._failed_calls,
-            "total_tokens": self._total_tokens,
-            "success_rate": (self._call_count - self._failed_calls) / max(self._call_count, 1),
-            "circuit_breaker_open": self._circuit_breaker_open,
-            "circuit_breaker_failures": self._circuit_breaker_failures,
-        }
+
+        return LLMError(
+            f"LLM 调用失败: {str(e)}",
+            details={"model": model, "endpoint": endpoint.key},
+            original_error=e
+        )
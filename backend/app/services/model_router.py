@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+from app.config import settings
+
+# 默认关键词权重；"go"、"class" 等在普通文本中也常见的词权重较低，需与其他信号叠加才路由
+DEFAULT_KEYWORD_WEIGHTS: dict[str, float] = {
+    "python": 1.0, "java": 1.0, "javascript": 1.0, "typescript": 1.0, "c++": 1.0, "c#": 1.0,
+    "golang": 1.0, "go": 0.5, "rust": 1.0,
+    "code": 1.0, "coding": 1.0, "programming": 1.0, "debug": 1.0, "bug": 1.0, "error": 0.5, "api": 1.0,
+    "database": 1.0, "sql": 1.0, "algorithm": 1.0, "function": 0.5, "class": 0.5, "react": 1.0, "vue": 1.0,
+    "代码": 1.0, "编程": 1.0, "调试": 1.0, "报错": 1.0, "算法": 1.0, "数据库": 1.0, "函数": 1.0, "接口": 0.5,
+}
+
+# ASCII 关键词按单词边界匹配（避免 "go" 命中 "google"），边界只看 ASCII 字母数字，
+# 因此 "python代码" 中的 python 仍能命中；CJK 关键词没有词边界，按子串匹配
+_ASCII_BOUNDARY_LEFT = r"(?<![a-z0-9_])"
+_ASCII_BOUNDARY_RIGHT = r"(?![a-z0-9_])"
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    model: str
+    score: float
+    matched: tuple[str, ...]
+
+
+class ModelRouter:
+    """关键词加权路由：启动时把全部关键词编译成一个正则自动机，单次扫描得到命中集合。"""
+
+    def __init__(
+        self,
+        keyword_weights: dict[str, float],
+        *,
+        specialist_model: str,
+        default_model: str,
+        threshold: float,
+        cache_size: int = 1024,
+    ) -> None:
+        self._weights = {kw.lower(): weight for kw, weight in keyword_weights.items()}
+        self._specialist_model = specialist_model
+        self._default_model = default_model
+        self._threshold = threshold
+        self._pattern = self._compile(self._weights)
+        # 同一问题在一次请求中会被多处路由，按问题文本记忆结果
+        self.route = lru_cache(maxsize=cache_size)(self._route)
+
+    def _route(self, question: str) -> RouteDecision:
+        matched = tuple(sorted({m.group(0) for m in self._pattern.finditer(question.lower())}))
+        score = sum((self._weights[kw] for kw in matched), 0.0)
+        model = self._specialist_model if score >= self._threshold else self._default_model
+        return RouteDecision(model=model, score=score, matched=matched)
+
+    def get_stats(self) -> dict[str, Any]:
+        info = self.route.cache_info()
+        return {"keywords": len(self._weights), "cache_hits": info.hits, "cache_misses": info.misses}
+
+    @staticmethod
+    def _compile(weights: dict[str, float]) -> re.Pattern[str]:
+        # 长关键词优先，保证 "golang" 不会被 "go" 截断
+        keywords = sorted(weights, key=len, reverse=True)
+        ascii_words = [re.escape(kw) for kw in keywords if kw.isascii()]
+        cjk_words = [re.escape(kw) for kw in keywords if not kw.isascii()]
+        parts = []
+        if ascii_words:
+            parts.append(f"{_ASCII_BOUNDARY_LEFT}(?:{'|'.join(ascii_words)}){_ASCII_BOUNDARY_RIGHT}")
+        if cjk_words:
+            parts.append(f"(?:{'|'.join(cjk_words)})")
+        return re.compile("|".join(parts) or r"(?!)")
+
+
+@lru_cache(maxsize=1)
+def get_model_router() -> ModelRouter:
+    return ModelRouter(
+        settings.MODEL_ROUTER_KEYWORDS or DEFAULT_KEYWORD_WEIGHTS,
+        specialist_model=settings.CS_SPECIALIST_MODEL,
+        default_model=settings.DEFAULT_MODEL,
+        threshold=settings.MODEL_ROUTER_THRESHOLD,
+    )
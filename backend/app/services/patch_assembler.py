@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_FENCE_RE = re.compile(r"^```[\w-]*\s*$", re.MULTILINE)
+# 紧邻的 ---/+++ 行才视为文件头，避免把 hunk 中以 "--" 开头的删除行误判为文件头
+_FILE_HEADER_RE = re.compile(r"^--- (\S+)[^\n]*\n\+\+\+ (\S+)[^\n]*$", re.MULTILINE)
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@(.*)$")
+_DEV_NULL = "/dev/null"
+
+
+@dataclass(frozen=True)
+class FileDiff:
+    path: str
+    diff: str
+
+
+def extract_file_diff(raw: str, expected_path: str) -> FileDiff:
+    """从模型输出中提取单个文件的 unified diff 并规范化为 a/ b/ 前缀；不合法时抛出 ValueError"""
+    text = _FENCE_RE.sub("", raw)
+    first = _FILE_HEADER_RE.search(text)
+    if first is None:
+        raise ValueError("missing ---/+++ file headers")
+    text = text[first.start():].strip("\n") + "\n"
+
+    headers = _FILE_HEADER_RE.findall(text)
+    if len(headers) != 1:
+        raise ValueError("diff must touch exactly one file")
+    if "\n@@ " not in text:
+        raise ValueError("diff has no hunks")
+
+    old_path, new_path = (_strip_prefix(path) for path in headers[0])
+    path = new_path if new_path != _DEV_NULL else old_path
+    expected = expected_path.removeprefix("./")
+    if path != expected:
+        raise ValueError(f"diff targets {path}, expected {expected}")
+
+    old_header = _DEV_NULL if old_path == _DEV_NULL else f"a/{old_path}"
+    new_header = _DEV_NULL if new_path == _DEV_NULL else f"b/{new_path}"
+    text = _FILE_HEADER_RE.sub(f"--- {old_header}\n+++ {new_header}", text)
+    return FileDiff(path=path, diff=_recount_hunks(text))
+
+
+async def git_apply_check(repo_path: str, diff: str, timeout: float) -> str | None:
+    """以 git apply --check 校验补丁能否应用到仓库当前内容，返回错误信息；通过时返回 None。
+
+    未安装 git 时跳过校验。
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "git", "apply", "--check", "-",
+            cwd=repo_path,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        logger.warning("git not found, skipping patch apply check")
+        return None
+
+    try:
+        _, stderr = await asyncio.wait_for(proc.communicate(diff.encode("utf-8")), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return f"git apply --check timed out after {timeout:g}s"
+    if proc.returncode == 0:
+        return None
+    return stderr.decode("utf-8", errors="replace").strip() or f"git apply exited with {proc.returncode}"
+
+
+def merge_diffs(diffs: list[FileDiff]) -> str:
+    """按顺序合并各文件的 diff；同一文件出现多次时保留第一个"""
+    seen: set[str] = set()
+    merged: list[str] = []
+    for item in diffs:
+        if item.path in seen:
+            continue
+        seen.add(item.path)
+        merged.append(item.diff)
+    return "".join(merged)
+
+
+def read_repo_file(repo_path: str, rel_path: str, max_chars: int) -> str | None:
+    """读取仓库内文件用于提示词；文件不存在或路径越出仓库时返回 None"""
+    root = Path(repo_path).resolve()
+    target = (root / rel_path).resolve()
+    if not target.is_relative_to(root) or not target.is_file():
+        return None
+    return target.read_text(encoding="utf-8", errors="ignore")[:max_chars]
+
+
+def _recount_hunks(text: str) -> str:
+    """按 hunk 实际内容重写 @@ 行数（模型给出的行数经常不准），空行视为空白上下文行。
+
+    不依赖 git apply --recount：合并多个文件后，--recount 会把下一个文件的 "--- " 头当作删除行。
+    """
+    lines = text.split("\n")[:-1]
+    output: list[str] = []
+    header_index: int | None = None
+    old_count = new_count = 0
+
+    def close_hunk() -> None:
+        if header_index is None:
+            return
+        match = _HUNK_RE.match(output[header_index])
+        old_start, new_start, section = match.group(1), match.group(2), match.group(3)
+        output[header_index] = f"@@ -{old_start},{old_count} +{new_start},{new_count} @@{section}"
+
+    for line in lines:
+        if _HUNK_RE.match(line):
+            close_hunk()
+            header_index = len(output)
+            old_count = new_count = 0
+            output.append(line)
+            continue
+        if header_index is not None:
+            if line == "":
+                line = " "
+            if line.startswith(" "):
+                old_count += 1
+                new_count += 1
+            elif line.startswith("-"):
+                old_count += 1
+            elif line.startswith("+"):
+                new_count += 1
+        output.append(line)
+    close_hunk()
+    return "\n".join(output) + "\n"
+
+
+def _strip_prefix(path: str) -> str:
+    if path == _DEV_NULL:
+        return path
+    return path[2:] if path.startswith(("a/", "b/")) else path
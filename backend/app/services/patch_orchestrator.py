@@ -1,14 +1,43 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
+import operator
+import time
+import uuid
 from dataclasses import dataclass, field
-from typing import Any, TypedDict
+from typing import Annotated, Any, AsyncIterator, TypedDict
 
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, START, StateGraph
 
+from app.config import settings
+from app.services.checkpoint_store import checkpoint_store, invoke_checkpointed
 from app.services.deepseek_service import DeepSeekService
+from app.services.event_channel import EventChannel, stage_scope
 from app.services.llm_service import LLMService
+from app.services.patch_assembler import FileDiff, extract_file_diff, git_apply_check, merge_diffs, read_repo_file
 from app.services.repo_analyzer import RepoAnalyzer
+from app.utils.exceptions import LLMError, ValidationError
+from app.utils.json_stream import STRING, STRING_LIST, object_schema
+
+logger = logging.getLogger(__name__)
+
+_INTENT_SCHEMA = object_schema(intent=STRING, goal=STRING, constraints=STRING_LIST, risks=STRING_LIST)
+# per_file 模式下架构阶段额外给出机器可读的目标文件列表
+_ARCHITECTURE_PLAN_SCHEMA = object_schema(
+    summary=STRING,
+    files={
+        "type": "array",
+        "items": object_schema(
+            path=STRING,
+            change={"type": "string", "enum": ["add", "modify", "delete"]},
+            description=STRING,
+        ),
+    },
+)
+_PATCH_SYSTEM_PROMPT = "你是 DeepSeek-R1 代码补丁生成器。请根据架构方案输出统一 diff 格式补丁，仅输出 diff 内容。"
 
 
 class PatchState(TypedDict, total=False):
@@ -19,6 +48,13 @@ class PatchState(TypedDict, total=False):
     architecture: str
     patch: str
     mcp_context: dict[str, Any]
+    per_file: bool
+    # 同一需求的第 k/N 个候选方案（批量生成多个候选时），用于提示架构阶段给出不同的设计
+    candidate: tuple[int, int] | None
+    file_plan: list[dict[str, Any]]
+    patch_files: dict[str, Any]
+    # 并发节点各自写入自己的耗时，按字典合并
+    node_timings: Annotated[dict[str, Any], operator.or_]
 
 
 @dataclass
@@ -30,8 +66,25 @@ class PatchResult:
     metadata: dict[str, Any] = field(default_factory=dict)
 
 
+@dataclass
+class BatchItemResult:
+    index: int  # 需求在请求列表中的位置
+    request: str
+    candidate: int  # 同一需求的第几个候选（从 1 开始）
+    result: PatchResult | None = None
+    error: str = ""
+
+
 class PatchOrchestrator:
-    """LangGraph 驱动的补丁生成编排器。"""
+    """LangGraph 驱动的补丁生成编排器。
+
+    intent（LLM）与 repo（磁盘扫描，在线程中执行）互不依赖，从 START 并发展开，
+    两者都完成后汇合到 architecture，再生成 patch。节点只返回自己写入的字段。
+    per_file 模式下 architecture 同时给出目标文件列表，patch 按文件有限并发生成，
+    每个文件的 diff 到达后立即解析并以 git apply --check 校验，只重试未通过的文件，最后合并为一个 diff。
+    启用检查点时每个节点完成后写入检查点，中断的运行可通过 resume(run_id) 从最后完成的节点继续。
+    传入预先计算的 repo_summary 时 repo 节点直接复用，generate_batch 据此对多个需求只分析一次仓库。
+    """
 
     def __init__(self, llm_service: LLMService, deepseek_service: DeepSeekService) -> None:
         self._llm = llm_service
@@ -44,14 +97,112 @@ class PatchOrchestrator:
         request: str,
         repo_path: str,
         mcp_context: dict[str, Any] | None = None,
+        events: EventChannel | None = None,
+        *,
+        per_file: bool = False,
+        run_id: str | None = None,
+        run_context: dict[str, Any] | None = None,
+        repo_summary: dict[str, Any] | None = None,
+        candidate: tuple[int, int] | None = None,
     ) -> PatchResult:
+        """生成补丁；传入 events 时每个节点投递 stage_started/stage_finished 事件，
+        各节点耗时与 token 用量记录在 metadata["node_timings"]。
+
+        run_id 用作检查点键（未传入时自动生成，见 metadata["run_id"]），run_context 随运行保存供恢复时使用。
+        """
+        run_id = run_id or uuid.uuid4().hex
         initial_state: PatchState = {
             "request": request,
             "repo_path": repo_path,
             "mcp_context": mcp_context or {},
+            "per_file": per_file,
+            "candidate": candidate,
+            "node_timings": {},
         }
-        result_state = await self._workflow.ainvoke(initial_state)
+        if repo_summary is not None:
+            initial_state["repo_summary"] = repo_summary
+        if checkpoint_store is not None:
+            await checkpoint_store.start_run(run_id, "patch", run_context)
+        started = time.perf_counter()
+        result_state = await invoke_checkpointed(self._workflow, initial_state, run_id, {"events": events})
+        return self._result(result_state, run_id, started, resumed=False)
+
+    async def analyze_repo(self, repo_path: str, events: EventChannel | None = None) -> dict[str, Any]:
+        """单独执行仓库分析，供批量生成共享"""
+        with stage_scope(events, "repo") as report:
+            repo_summary = await asyncio.to_thread(self._analyzer.analyze, repo_path)
+            report.artifact = {
+                "file_count": repo_summary["file_count"],
+                "languages": repo_summary["languages"],
+            }
+        return repo_summary
 
+    async def generate_batch(
+        self,
+        requests: list[str],
+        repo_path: str,
+        repo_summary: dict[str, Any],
+        *,
+        mcp_contexts: list[dict[str, Any]] | None = None,
+        per_file: bool = False,
+        candidates: int = 1,
+        concurrency: int | None = None,
+        run_context: dict[str, Any] | None = None,
+    ) -> AsyncIterator[BatchItemResult]:
+        """对同一仓库的多个需求（每个需求可生成 candidates 个候选）并发生成补丁，按完成顺序产出结果。
+
+        所有运行共享同一份 repo_summary，并发数受 concurrency（默认 PATCH_BATCH_CONCURRENCY）限制；
+        单个运行失败只影响该条结果。run_context 随每个运行的检查点保存，失败的运行可单独恢复。
+        """
+        semaphore = asyncio.Semaphore(concurrency or settings.PATCH_BATCH_CONCURRENCY)
+        # 仓库分析本身与 focus 无关（focus 只随摘要带给模型），按各自需求补上以与单条生成一致；
+        # focus 放在摘要末尾，各运行的提示词仍共享文件列表等长前缀
+        shared = {key: value for key, value in repo_summary.items() if key != "focus"}
+        items = [
+            (position, request, mcp_contexts[position] if mcp_contexts else {}, candidate)
+            for position, request in enumerate(requests)
+            for candidate in range(1, candidates + 1)
+        ]
+
+        async def run(position: int, request: str, mcp_context: dict[str, Any], candidate: int) -> BatchItemResult:
+            item = BatchItemResult(index=position, request=request, candidate=candidate)
+            async with semaphore:
+                try:
+                    item.result = await self.generate(
+                        request,
+                        repo_path,
+                        mcp_context,
+                        per_file=per_file,
+                        repo_summary={**shared, "focus": request},
+                        candidate=(candidate, candidates) if candidates > 1 else None,
+                        run_context=run_context,
+                    )
+                except Exception as exc:
+                    logger.warning("Batch patch %d (candidate %d) failed: %s", position, candidate, exc)
+                    item.error = str(exc) or type(exc).__name__
+            return item
+
+        tasks = [asyncio.create_task(run(*item)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 调用方提前结束迭代（如客户端断开）时取消剩余运行
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def resume(self, run_id: str, events: EventChannel | None = None) -> PatchResult:
+        """从最新检查点继续未完成的运行，已完成的节点不再重新执行"""
+        run = await checkpoint_store.resumable_run(run_id, "patch") if checkpoint_store is not None else None
+        if run is None:
+            raise ValidationError(f"没有可恢复的补丁运行: {run_id}", field="run_id")
+        started = time.perf_counter()
+        result_state = await invoke_checkpointed(self._workflow, None, run_id, {"events": events})
+        return self._result(result_state, run_id, started, resumed=True)
+
+    @staticmethod
+    def _result(result_state: PatchState, run_id: str, started: float, *, resumed: bool) -> PatchResult:
         return PatchResult(
             intent=result_state.get("intent", {}),
             repo_summary=result_state.get("repo_summary", {}),
@@ -59,6 +210,11 @@ class PatchOrchestrator:
             patch=result_state.get("patch", ""),
             metadata={
                 "mcp_context": result_state.get("mcp_context", {}),
+                "node_timings": result_state.get("node_timings", {}),
+                "patch_files": result_state.get("patch_files", {}),
+                "total_duration": round(time.perf_counter() - started, 4),
+                "run_id": run_id,
+                "resumed": resumed,
             },
         )
 
@@ -70,68 +226,214 @@ class PatchOrchestrator:
         workflow.add_node("patch", self._patch_node)
 
         workflow.add_edge(START, "intent")
-        workflow.add_edge("intent", "repo")
-        workflow.add_edge("repo", "architecture")
+        workflow.add_edge(START, "repo")
+        workflow.add_edge(["intent", "repo"], "architecture")
         workflow.add_edge("architecture", "patch")
         workflow.add_edge("patch", END)
-        return workflow.compile()
+        return workflow.compile(checkpointer=checkpoint_store)
 
-    async def _intent_node(self, state: PatchState) -> PatchState:
+    async def _intent_node(self, state: PatchState, config: RunnableConfig) -> PatchState:
         prompt = (
             "你是架构师助手，请提取用户需求的核心意图。\n"
             "请输出 JSON，字段包含: intent, goal, constraints, risks。\n\n"
             f"用户请求:\n{state['request']}\n\n"
             f"MCP 上下文:\n{json.dumps(state.get('mcp_context', {}), ensure_ascii=False)}"
         )
-        response = await self._llm.generate_simple(prompt, model=self._llm.get_recommended_model(state["request"]))
-        intent = self._safe_json(response)
-        return {**state, "intent": intent}
+        with stage_scope(self._events(config), "intent") as report:
+            intent = await self._llm.generate_json(
+                prompt, _INTENT_SCHEMA, model=self._llm.get_recommended_model(state["request"]), name="patch_intent"
+            )
+            # 重试后仍无法解析时以原始请求作为意图，后续节点照常运行
+            intent = intent or {"intent": state["request"][:200]}
+            report.artifact = intent
+        return {"intent": intent, "node_timings": {"intent": report.timing()}}
+
+    async def _repo_node(self, state: PatchState, config: RunnableConfig) -> PatchState:
+        if state.get("repo_summary"):
+            # 批量生成时仓库已分析过，直接复用
+            with stage_scope(self._events(config), "repo", shared=True) as report:
+                report.artifact = {"file_count": state["repo_summary"].get("file_count"), "shared": True}
+            return {"node_timings": {"repo": report.timing()}}
 
-    async def _repo_node(self, state: PatchState) -> PatchState:
-        repo_summary = self._analyzer.analyze(state["repo_path"], focus=state.get("request"))
-        return {**state, "repo_summary": repo_summary}
+        with stage_scope(self._events(config), "repo") as report:
+            # 目录遍历与文件读取是阻塞 IO，放到线程中执行，不占用事件循环
+            repo_summary = await asyncio.to_thread(
+                self._analyzer.analyze, state["repo_path"], focus=state.get("request")
+            )
+            report.artifact = {
+                "file_count": repo_summary["file_count"],
+                "languages": repo_summary["languages"],
+            }
+        return {"repo_summary": repo_summary, "node_timings": {"repo": report.timing()}}
 
-    async def _architecture_node(self, state: PatchState) -> PatchState:
+    async def _architecture_node(self, state: PatchState, config: RunnableConfig) -> PatchState:
+        # 仓库摘要放在最前：批量生成时各运行的提示词共享同一前缀，可命中上游的提示词缓存
         prompt = (
             "你是资深架构师，请基于仓库概览与需求输出架构设计建议，"
             "包含关键模块、需要新增/修改的文件，以及数据流简述。\n\n"
+            f"仓库摘要:\n{json.dumps(state.get('repo_summary', {}), ensure_ascii=False)}\n\n"
             f"需求:\n{state['request']}\n\n"
-            f"意图摘要:\n{json.dumps(state.get('intent', {}), ensure_ascii=False)}\n\n"
-            f"仓库摘要:\n{json.dumps(state.get('repo_summary', {}), ensure_ascii=False)}"
+            f"意图摘要:\n{json.dumps(state.get('intent', {}), ensure_ascii=False)}"
         )
-        response = await self._llm.generate_simple(prompt, model=self._llm.get_recommended_model(state["request"]))
-        return {**state, "architecture": response.strip()}
+        if candidate := state.get("candidate"):
+            prompt += (
+                f"\n\n这是同一需求的第 {candidate[0]}/{candidate[1]} 个候选方案，"
+                "请给出与其他候选不同的实现取舍。"
+            )
+        model = self._llm.get_recommended_model(state["request"])
+        with stage_scope(self._events(config), "architecture") as report:
+            if state.get("per_file"):
+                plan = await self._llm.generate_json(
+                    prompt
+                    + "\n\n请输出 JSON：summary 为上述架构设计说明；files 列出需要改动的文件，"
+                    "path 为相对仓库根目录的路径，change 为 add|modify|delete，description 为该文件的改动说明。",
+                    _ARCHITECTURE_PLAN_SCHEMA,
+                    model=model,
+                    name="patch_architecture",
+                )
+                architecture = str(plan.get("summary", "")).strip()
+                file_plan = self._normalize_plan(plan.get("files", []))
+                report.artifact = {"preview": architecture, "files": [item["path"] for item in file_plan]}
+            else:
+                architecture = (await self._llm.generate_simple(prompt, model=model)).strip()
+                file_plan = []
+                report.artifact = {"preview": architecture}
+        return {
+            "architecture": architecture,
+            "file_plan": file_plan,
+            "node_timings": {"architecture": report.timing()},
+        }
 
-    async def _patch_node(self, state: PatchState) -> PatchState:
-        system_prompt = (
-            "你是 DeepSeek-R1 代码补丁生成器。"
-            "请根据架构方案输出统一 diff 格式补丁，仅输出 diff 内容。"
-        )
+    async def _patch_node(self, state: PatchState, config: RunnableConfig) -> PatchState:
+        events = self._events(config)
+        with stage_scope(events, "patch") as report:
+            if state.get("file_plan"):
+                patch, patch_files = await self._per_file_patch(state, events)
+                report.artifact = {
+                    "files": {path: item["status"] for path, item in patch_files.items()},
+                    "patch_lines": patch.count("\n"),
+                }
+            else:
+                # 单次调用模式（或架构阶段未给出文件列表）
+                patch, patch_files = await self._single_patch(state), {}
+                report.artifact = {"patch_lines": patch.count("\n") + 1 if patch else 0}
+        return {"patch": patch, "patch_files": patch_files, "node_timings": {"patch": report.timing()}}
+
+    async def _single_patch(self, state: PatchState) -> str:
         user_prompt = (
+            "仓库摘要:\n"
+            f"{json.dumps(state.get('repo_summary', {}), ensure_ascii=False)}\n\n"
             "需求:\n"
             f"{state['request']}\n\n"
             "意图:\n"
             f"{json.dumps(state.get('intent', {}), ensure_ascii=False)}\n\n"
             "架构:\n"
-            f"{state.get('architecture', '')}\n\n"
-            "仓库摘要:\n"
-            f"{json.dumps(state.get('repo_summary', {}), ensure_ascii=False)}"
+            f"{state.get('architecture', '')}"
         )
         deepseek_response = await self._deepseek.generate_patch(
             [
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": _PATCH_SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt},
             ]
         )
-        patch = deepseek_response.get("content", "")
-        return {
-            **state,
-            "patch": patch,
-        }
+        return deepseek_response.get("content", "")
+
+    async def _per_file_patch(
+        self,
+        state: PatchState,
+        events: EventChannel | None,
+    ) -> tuple[str, dict[str, Any]]:
+        """按文件并发生成补丁，合并通过校验的 diff；返回 (合并后的 diff, 每个文件的状态)"""
+        plan = state["file_plan"]
+        semaphore = asyncio.Semaphore(settings.PATCH_FILE_CONCURRENCY)
+        results = await asyncio.gather(*(self._patch_file(state, item, plan, semaphore, events) for item in plan))
+        patch = merge_diffs([diff for diff, _ in results if diff is not None])
+        return patch, {item["path"]: status for item, (_, status) in zip(plan, results)}
+
+    async def _patch_file(
+        self,
+        state: PatchState,
+        item: dict[str, Any],
+        plan: list[dict[str, Any]],
+        semaphore: asyncio.Semaphore,
+        events: EventChannel | None,
+    ) -> tuple[FileDiff | None, dict[str, Any]]:
+        path = item["path"]
+        current = await asyncio.to_thread(
+            read_repo_file, state["repo_path"], path, settings.PATCH_FILE_CONTEXT_CHARS
+        )
+        user_prompt = (
+            f"需求:\n{state['request']}\n\n"
+            f"意图:\n{json.dumps(state.get('intent', {}), ensure_ascii=False)}\n\n"
+            f"架构:\n{state.get('architecture', '')}\n\n"
+            f"本次改动涉及的文件: {', '.join(entry['path'] for entry in plan)}\n\n"
+            f"目标文件: {path}（{item['change']}）\n改动说明: {item['description']}\n\n"
+            f"文件当前内容:\n{current if current is not None else '（文件不存在，作为新文件创建）'}\n\n"
+            f"只输出 {path} 的 unified diff（--- a/{path} 与 +++ b/{path}，新文件使用 --- /dev/null），"
+            "不要包含其他文件。"
+        )
+        messages = [
+            {"role": "system", "content": _PATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ]
+
+        error = ""
+        attempts = 0
+        for attempts in range(1, settings.PATCH_FILE_MAX_RETRIES + 2):
+            try:
+                async with semaphore:
+                    response = await self._deepseek.generate_patch(messages)
+            except LLMError as exc:
+                # 上游错误已在服务内重试过，不再按文件重试
+                error = exc.message
+                break
+            raw = response.get("content", "")
+            try:
+                file_diff = extract_file_diff(raw, path)
+                error = await git_apply_check(
+                    state["repo_path"], file_diff.diff, settings.PATCH_APPLY_CHECK_TIMEOUT_SECONDS
+                ) or ""
+            except ValueError as exc:
+                error = str(exc)
+            if not error:
+                if events:
+                    events.publish("patch_file", path=path, status="ok", attempts=attempts, diff=file_diff.diff)
+                return file_diff, {"status": "ok", "attempts": attempts}
+
+            logger.warning("Patch for %s rejected (attempt %d): %s", path, attempts, error)
+            messages = [
+                *messages,
+                {"role": "assistant", "content": raw},
+                {
+                    "role": "user",
+                    "content": f"该补丁无法应用：{error}\n请基于上面给出的文件当前内容，重新输出 {path} 的完整 unified diff。",
+                },
+            ]
+
+        if events:
+            events.publish("patch_file", path=path, status="failed", attempts=attempts, error=error)
+        return None, {"status": "failed", "attempts": attempts, "error": error}
 
     @staticmethod
-    def _safe_json(payload: str) -> dict[str, Any]:
-        try:
-            return json.loads(payload)
-        except Exception:
-            return {"intent": payload.strip()[:200]}
+    def _normalize_plan(files: list[Any]) -> list[dict[str, Any]]:
+        plan: list[dict[str, Any]] = []
+        seen: set[str] = set()
+        for item in files:
+            if not isinstance(item, dict):
+                continue
+            path = str(item.get("path", "")).strip().removeprefix("./")
+            if not path or path in seen:
+                continue
+            seen.add(path)
+            plan.append(
+                {
+                    "path": path,
+                    "change": str(item.get("change") or "modify"),
+                    "description": str(item.get("description", "")),
+                }
+            )
+        return plan[: settings.PATCH_MAX_FILES]
+
+    @staticmethod
+    def _events(config: RunnableConfig) -> EventChannel | None:
+        return config.get("configurable", {}).get("events")
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Mapping
+
+from app.config import settings
+from app.utils.exceptions import LLMError
+
+logger = logging.getLogger(__name__)
+
+# AIMD：429 时按比例降低放行速率，成功后缓慢恢复
+_BACKOFF_FACTOR = 0.7
+_RECOVERY_STEP = 0.02
+_MIN_RATE_SCALE = 0.1
+_DEFAULT_RETRY_AFTER = 1.0
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+
+class TokenBucket:
+    """令牌桶；rate_per_minute <= 0 表示不限速。"""
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def wait_time(self, amount: float, scale: float) -> float:
+        """返回获取 amount 个令牌还需等待的秒数（0 表示可立即获取）"""
+        if self.unlimited:
+            return 0.0
+        self._refill(scale)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.capacity * scale / 60.0)
+
+    def consume(self, amount: float) -> None:
+        if not self.unlimited:
+            self.tokens -= min(amount, self.capacity)
+
+    def clamp(self, remaining: float) -> None:
+        """以服务端返回的剩余额度为准"""
+        if not self.unlimited:
+            self.tokens = min(self.tokens, remaining)
+
+    def _refill(self, scale: float) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity * scale / 60.0)
+
+
+class DeploymentScheduler:
+    """单个 deployment 的请求调度：在途并发上限 + RPM/TPM 令牌桶 + 服务端限流反馈，排队超时报错。"""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        max_inflight: int,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        queue_timeout: float,
+    ) -> None:
+        self.name = name
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self._max_inflight = max_inflight
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._queue_timeout = queue_timeout
+        self._paused_until = 0.0
+        self._rate_scale = 1.0
+
+        self._waiting = 0
+        self._inflight = 0
+        self._queued_total = 0
+        self._queue_timeouts = 0
+        self._throttled = 0
+        self._total_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int) -> AsyncIterator[None]:
+        started = time.monotonic()
+        deadline = started + self._queue_timeout
+        self._waiting += 1
+        try:
+            await self._acquire_semaphore(deadline)
+        finally:
+            self._waiting -= 1
+
+        try:
+            await self._wait_for_budget(estimated_tokens, deadline)
+            waited = time.monotonic() - started
+            self._total_wait += waited
+            if waited > 0.01:
+                self._queued_total += 1
+            self._inflight += 1
+            try:
+                yield
+            finally:
+                self._inflight -= 1
+        finally:
+            self._semaphore.release()
+
+    def observe(self, status_code: int, headers: Mapping[str, str]) -> None:
+        """根据响应状态码与 x-ratelimit-* / Retry-After 头调整放行节奏"""
+        remaining_requests = _parse_float(headers.get("x-ratelimit-remaining-requests"))
+        remaining_tokens = _parse_float(headers.get("x-ratelimit-remaining-tokens"))
+        if remaining_requests is not None:
+            self._requests.clamp(remaining_requests)
+        if remaining_tokens is not None:
+            self._tokens.clamp(remaining_tokens)
+
+        if status_code == 429:
+            self._throttled += 1
+            self._rate_scale = max(_MIN_RATE_SCALE, self._rate_scale * _BACKOFF_FACTOR)
+            self._pause(_retry_after(headers))
+            logger.warning(
+                "Deployment %s throttled (429); pausing %.1fs, rate scale %.2f",
+                self.name,
+                max(0.0, self._paused_until - time.monotonic()),
+                self._rate_scale,
+            )
+            return
+
+        if remaining_requests == 0:
+            self._pause(_parse_duration(headers.get("x-ratelimit-reset-requests")) or _DEFAULT_RETRY_AFTER)
+        if remaining_tokens == 0:
+            self._pause(_parse_duration(headers.get("x-ratelimit-reset-tokens")) or _DEFAULT_RETRY_AFTER)
+
+        if status_code < 400 and self._rate_scale < 1.0:
+            self._rate_scale = min(1.0, self._rate_scale + _RECOVERY_STEP)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int | None) -> None:
+        """用真实用量修正预扣的 token 数"""
+        if actual_tokens is not None and actual_tokens > estimated_tokens:
+            self._tokens.consume(actual_tokens - estimated_tokens)
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "max_inflight": self._max_inflight,
+            "inflight": self._inflight,
+            "waiting": self._waiting,
+            "queued_total": self._queued_total,
+            "queue_timeouts": self._queue_timeouts,
+            "throttled": self._throttled,
+            "total_wait_seconds": round(self._total_wait, 3),
+            "rate_scale": round(self._rate_scale, 3),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 3),
+        }
+
+    async def _acquire_semaphore(self, deadline: float) -> None:
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._raise_queue_timeout()
+
+    async def _wait_for_budget(self, estimated_tokens: int, deadline: float) -> None:
+        while True:
+            now = time.monotonic()
+            wait = max(
+                self._paused_until - now,
+                self._requests.wait_time(1, self._rate_scale),
+                self._tokens.wait_time(estimated_tokens, self._rate_scale),
+            )
+            if wait <= 0:
+                self._requests.consume(1)
+                self._tokens.consume(estimated_tokens)
+                return
+            if now + wait > deadline:
+                self._raise_queue_timeout()
+            await asyncio.sleep(wait)
+
+    def _pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _raise_queue_timeout(self) -> None:
+        self._queue_timeouts += 1
+        raise LLMError(
+            "LLM 请求排队超时，请稍后重试",
+            details={"deployment": self.name, "queue_timeout": self._queue_timeout},
+        )
+
+
+class RateLimiterRegistry:
+    """按 deployment 名惰性创建调度器。"""
+
+    def __init__(self) -> None:
+        self._schedulers: dict[str, DeploymentScheduler] = {}
+
+    def get(self, name: str) -> DeploymentScheduler:
+        scheduler = self._schedulers.get(name)
+        if scheduler is None:
+            scheduler = DeploymentScheduler(
+                name,
+                max_inflight=settings.LLM_MAX_INFLIGHT_PER_DEPLOYMENT,
+                requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+                tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+                queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+            )
+            self._schedulers[name] = scheduler
+        return scheduler
+
+    def get_stats(self) -> dict[str, Any]:
+        return {name: scheduler.get_stats() for name, scheduler in self._schedulers.items()}
+
+
+def _parse_float(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _parse_duration(value: str | None) -> float | None:
+    """解析 "1s" / "6m0s" / "20ms" 形式的重置时间"""
+    if not value:
+        return None
+    plain = _parse_float(value)
+    if plain is not None:
+        return plain
+    units = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    matches = _DURATION_RE.findall(value)
+    if not matches:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in matches)
+
+
+def _retry_after(headers: Mapping[str, str]) -> float:
+    retry_after_ms = _parse_float(headers.get("retry-after-ms"))
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000.0
+    retry_after = _parse_float(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    return _DEFAULT_RETRY_AFTER
+
+
+rate_limiters = RateLimiterRegistry()
@@ -1,12 +1,17 @@
 from __future__ import annotations
 
+import uuid
 from dataclasses import dataclass, field
 from typing import Any, Iterable, Literal, TypedDict
 
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, START, StateGraph
 
 from app.core.agent import Agent
+from app.services.checkpoint_store import checkpoint_store, invoke_checkpointed
+from app.services.event_channel import EventChannel, stage_scope
 from app.services.llm_service import LLMService
+from app.utils.exceptions import ValidationError
 
 
 @dataclass
@@ -20,7 +25,8 @@ class ReasoningResult:
 
 class ReasoningState(TypedDict, total=False):
     question: str
-    conversation_history: list[Any]
+    # 以 {"role", "content"} 字典保存，便于写入检查点
+    conversation_history: list[dict[str, str]]
     mcp_context: dict[str, Any]
     model: str
     strategy: Literal["cot", "react"]
@@ -31,11 +37,14 @@ class ReasoningState(TypedDict, total=False):
 
 
 class ReasoningOrchestrator:
-    """基于 LangGraph 的推理编排器。"""
+    """基于 LangGraph 的推理编排器。
+
+    启用检查点时按 run_id 保存每个节点完成后的状态，中断的运行可通过 resume(run_id) 继续。
+    """
 
     def __init__(self, llm_service: LLMService) -> None:
         self._llm = llm_service
-        self._agent = Agent()
+        self._agent = Agent(llm_service)
         self._workflow = self._build_workflow()
 
     async def reason(
@@ -43,21 +52,42 @@ class ReasoningOrchestrator:
         question: str,
         conversation_history: Iterable[Any],
         mcp_context: dict[str, Any] | None = None,
+        events: EventChannel | None = None,
+        run_id: str | None = None,
+        run_context: dict[str, Any] | None = None,
     ) -> ReasoningResult:
+        """执行推理；传入 events 时投递阶段事件，cot 路径的最终答案以 chunk 事件流式输出。
+        run_id 用作检查点键，run_context 随运行保存供恢复时使用。"""
+        run_id = run_id or uuid.uuid4().hex
         initial_state: ReasoningState = {
             "question": question,
-            "conversation_history": list(conversation_history),
+            "conversation_history": [
+                {"role": getattr(item, "role", None) or "user", "content": getattr(item, "content", None) or ""}
+                for item in conversation_history
+            ],
             "mcp_context": mcp_context or {},
             "metadata": {},
         }
-        result_state = await self._workflow.ainvoke(initial_state)
-
+        if checkpoint_store is not None:
+            await checkpoint_store.start_run(run_id, "reasoning", run_context)
+        result_state = await invoke_checkpointed(self._workflow, initial_state, run_id, {"events": events})
+        return self._result(result_state, run_id)
+
+    async def resume(self, run_id: str, events: EventChannel | None = None) -> ReasoningResult:
+        """从最新检查点继续未完成的推理运行"""
+        run = await checkpoint_store.resumable_run(run_id, "reasoning") if checkpoint_store is not None else None
+        if run is None:
+            raise ValidationError(f"没有可恢复的推理运行: {run_id}", field="run_id")
+        result_state = await invoke_checkpointed(self._workflow, None, run_id, {"events": events})
+        return self._result(result_state, run_id)
+
+    def _result(self, result_state: ReasoningState, run_id: str) -> ReasoningResult:
         return ReasoningResult(
             answer=result_state.get("answer", ""),
             strategy=result_state.get("strategy", "cot"),
-            model=result_state.get("model", self._llm.get_recommended_model(question)),
+            model=result_state.get("model", self._llm.get_recommended_model(result_state.get("question", ""))),
             confidence=result_state.get("confidence", 0.7),
-            metadata=result_state.get("metadata", {}),
+            metadata={**result_state.get("metadata", {}), "run_id": run_id},
         )
 
     def _build_workflow(self):
@@ -79,14 +109,16 @@ class ReasoningOrchestrator:
         workflow.add_edge("cot", "finalize")
         workflow.add_edge("react", "finalize")
         workflow.add_edge("finalize", END)
-        return workflow.compile()
+        return workflow.compile(checkpointer=checkpoint_store)
 
-    async def _classify_node(self, state: ReasoningState) -> ReasoningState:
+    async def _classify_node(self, state: ReasoningState, config: RunnableConfig) -> ReasoningState:
         question = state["question"]
         mcp_context = state.get("mcp_context", {})
-        is_complex = await self._agent._is_complex_question(question, mcp_context)
-        model = self._llm.get_recommended_model(question)
-        strategy: Literal["cot", "react"] = "react" if is_complex else "cot"
+        with stage_scope(self._events(config), "classify") as report:
+            is_complex = await self._agent._is_complex_question(question, mcp_context)
+            model = self._llm.get_recommended_model(question)
+            strategy: Literal["cot", "react"] = "react" if is_complex else "cot"
+            report.artifact = {"is_complex": is_complex, "model": model, "strategy": strategy}
 
         return {
             **state,
@@ -99,12 +131,16 @@ class ReasoningOrchestrator:
     def _route_node(state: ReasoningState) -> Literal["cot", "react"]:
         return state.get("strategy", "cot")
 
-    async def _cot_node(self, state: ReasoningState) -> ReasoningState:
-        answer, _ = await self._agent._cot_reasoning(
-            state["question"],
-            state.get("conversation_history", []),
-            state.get("mcp_context", {}),
-        )
+    async def _cot_node(self, state: ReasoningState, config: RunnableConfig) -> ReasoningState:
+        events = self._events(config)
+        # 答案本身以 chunk 事件流式输出，阶段事件不再附带产物
+        with stage_scope(events, "cot"):
+            answer, _ = await self._agent._cot_reasoning(
+                state["question"],
+                state.get("conversation_history", []),
+                state.get("mcp_context", {}),
+                on_token=events.chunk if events else None,
+            )
         confidence = 0.8
         return {
             **state,
@@ -115,12 +151,14 @@ class ReasoningOrchestrator:
             },
         }
 
-    async def _react_node(self, state: ReasoningState) -> ReasoningState:
-        answer, used_tools = await self._agent._react_reasoning(
-            state["question"],
-            state.get("conversation_history", []),
-            state.get("mcp_context", {}),
-        )
+    async def _react_node(self, state: ReasoningState, config: RunnableConfig) -> ReasoningState:
+        with stage_scope(self._events(config), "react") as report:
+            answer, used_tools = await self._agent._react_reasoning(
+                state["question"],
+                state.get("conversation_history", []),
+                state.get("mcp_context", {}),
+            )
+            report.artifact = {"used_tools": used_tools}
         confidence = 0.9 if used_tools else 0.75
         return {
             **state,
@@ -132,6 +170,10 @@ class ReasoningOrchestrator:
             },
         }
 
+    @staticmethod
+    def _events(config: RunnableConfig) -> EventChannel | None:
+        return config.get("configurable", {}).get("events")
+
     @staticmethod
     async def _finalize_node(state: ReasoningState) -> ReasoningState:
         return state
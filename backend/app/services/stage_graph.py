@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+from app.services.event_channel import EventChannel, stage_scope
+
+StageFn = Callable[[dict[str, Any]], Awaitable[Any]]
+# 从阶段结果中提取随 stage_finished 事件下发的中间产物
+ArtifactFn = Callable[[Any], Any]
+
+
+class StageGraph:
+    """按依赖关系并发执行流水线阶段。
+
+    每个阶段在其依赖全部完成后立即启动（依赖结果以 {阶段名: 结果} 传入），
+    互不依赖的阶段并发运行；阶段可在运行中动态添加，推测性启动的阶段不再需要时可取消。
+    每个阶段的开始偏移、耗时、状态与 token 用量记录在 timings 中，并以 stage_started/stage_finished 事件投递。
+    """
+
+    def __init__(self, events: EventChannel | None = None) -> None:
+        self._events = events
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._origin = time.perf_counter()
+        self.timings: dict[str, dict[str, Any]] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tasks
+
+    def add(
+        self,
+        name: str,
+        fn: StageFn,
+        deps: tuple[str, ...] = (),
+        *,
+        speculative: bool = False,
+        artifact: ArtifactFn | None = None,
+    ) -> None:
+        if name in self._tasks:
+            raise ValueError(f"Stage already added: {name}")
+        missing = [dep for dep in deps if dep not in self._tasks]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stage(s): {', '.join(missing)}")
+        self.timings[name] = {"status": "pending", "speculative": speculative}
+        self._tasks[name] = asyncio.create_task(self._run(name, fn, deps, artifact), name=f"stage:{name}")
+
+    async def result(self, name: str) -> Any:
+        return await self._tasks[name]
+
+    async def wait(self, name: str, timeout: float | None) -> bool:
+        """等待阶段完成，最多 timeout 秒；返回是否已完成（不取消未完成的阶段）"""
+        done, _ = await asyncio.wait({self._tasks[name]}, timeout=timeout)
+        return bool(done)
+
+    def cancel(self, name: str) -> None:
+        """取消不再需要的阶段（通常是推测性启动的阶段）"""
+        task = self._tasks.get(name)
+        if task is not None and not task.done():
+            task.cancel()
+            self.timings[name]["status"] = "cancelled"
+
+    async def aclose(self) -> None:
+        """取消并等待所有未完成的阶段"""
+        pending = [task for task in self._tasks.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _run(
+        self,
+        name: str,
+        fn: StageFn,
+        deps: tuple[str, ...],
+        artifact: ArtifactFn | None,
+    ) -> Any:
+        inputs = {dep: await self._tasks[dep] for dep in deps}
+        timing = self.timings[name]
+        started = time.perf_counter()
+        timing.update(status="running", start=round(started - self._origin, 4))
+        with stage_scope(self._events, name, speculative=timing["speculative"]) as report:
+            try:
+                result = await fn(inputs)
+                if artifact:
+                    report.artifact = artifact(result)
+            except asyncio.CancelledError:
+                timing["status"] = "cancelled"
+                raise
+            except Exception:
+                timing["status"] = "failed"
+                raise
+            finally:
+                timing["duration"] = round(time.perf_counter() - started, 4)
+                timing["usage"] = report.usage.to_dict()
+        timing["status"] = "ok"
+        return result
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+
+@dataclass
+class TokenUsage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    calls: int = 0
+
+    def add(self, usage: dict[str, Any] | None) -> None:
+        usage = usage or {}
+        self.calls += 1
+        self.prompt_tokens += int(usage.get("prompt_tokens") or 0)
+        self.completion_tokens += int(usage.get("completion_tokens") or 0)
+        self.total_tokens += int(usage.get("total_tokens") or 0)
+
+    def to_dict(self) -> dict[str, int]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "calls": self.calls,
+        }
+
+
+# 当前阶段的用量累加器；asyncio 任务创建时复制上下文，阶段内派生的任务（对冲等）共享同一累加器
+_current_usage: ContextVar[TokenUsage | None] = ContextVar("current_usage", default=None)
+
+
+@contextmanager
+def usage_scope() -> Iterator[TokenUsage]:
+    """在作用域内累计上游 LLM 调用的 token 用量（命中缓存的调用不计入）"""
+    usage = TokenUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+def record_usage(usage: dict[str, Any] | None) -> None:
+    """由 LLM 服务在上游调用成功后调用"""
+    current = _current_usage.get()
+    if current is not None:
+        current.add(usage)
@@ -5,8 +5,51 @@ import re
 from dataclasses import dataclass, field
 from typing import Any
 
-from app.services.llm_service import LLMService
-from app.tools.tavily_search import tavily_search
+from app.services.event_channel import EventChannel
+from app.services.latency_budget import LatencyBudget, LatencyMode, stage_latency
+from app.services.llm_service import FieldCallback, LLMService, TokenCallback
+from app.services.stage_graph import StageGraph
+from app.tools.registry import tool_executor
+from app.utils.json_stream import BOOLEAN, STRING, STRING_LIST, object_schema
+
+# 明显需要实时信息的问题：在理解阶段完成前就推测性地开始搜索
+_SEARCH_HINT_RE = re.compile(
+    r"latest|today|news|current|price|weather|20\d\d|最新|今天|今日|新闻|现在|目前|价格|股价|天气|汇率",
+    re.IGNORECASE,
+)
+
+# 各 JSON 阶段的输出 schema；理解阶段把决定是否搜索的字段排在前面，便于流式解析时提前开始搜索
+_UNDERSTANDING_SCHEMA = object_schema(
+    requires_web_search=BOOLEAN,
+    domain=STRING,
+    key_concepts=STRING_LIST,
+    intent=STRING,
+    requires_code=BOOLEAN,
+)
+_REFLECTION_SCHEMA = object_schema(
+    strengths=STRING_LIST,
+    weaknesses=STRING_LIST,
+    improvements=STRING_LIST,
+    refined_answer=STRING,
+)
+_DETAILED_ANALYSIS_SCHEMA = object_schema(
+    requirements=STRING_LIST,
+    architecture=STRING,
+    tech_stack=STRING_LIST,
+    clarifications=STRING_LIST,
+)
+_CODE_GENERATION_SCHEMA = object_schema(
+    title=STRING,
+    language=STRING,
+    code=STRING,
+    explanation=STRING,
+    dependencies=STRING_LIST,
+)
+_SEARCH_DOMAINS = {"medical", "legal"}
+
+
+def _search_preview(result: str) -> dict[str, Any]:
+    return {"preview": result}
 
 
 @dataclass
@@ -42,62 +85,201 @@ class V1ParityPipeline:
         *,
         deep_thinking: bool = False,
         web_search_enabled: bool = False,
+        events: EventChannel | None = None,
+        latency_mode: LatencyMode | None = None,
+        latency_budget: float | None = None,
     ) -> V1PipelineResult:
-        model = self._llm.get_recommended_model(question)
-        intent = await self._understanding(question, conversation_history, model)
-
-        should_search = (
-            web_search_enabled
-            or intent.requires_web_search
-            or intent.domain.lower() in {"medical", "legal"}
-        )
+        """按依赖图执行多阶段流水线；传入 events 时投递阶段事件，最终答案按生成顺序以 chunk 事件输出。
+
+        依赖关系：understanding → initial_analysis → reflection → detailed_analysis → code_generation，
+        未开启深度思考或反思被预算跳过时详细分析直接接在初步分析之后；
+        search 只依赖问题本身时（显式开启或问题明显需要实时信息）与 understanding 并发推测执行，
+        理解结果表明不需要搜索时取消。各阶段耗时记录在 metadata["stage_timings"]。
+
+        latency_mode / latency_budget 决定本次请求的截止时间：反思与详细分析→代码生成为可选阶段，
+        按剩余时间与阶段耗时估计完整运行、缩减输出 token 或跳过，运行中超出截止时间的可选阶段被取消；
+        跳过的阶段及原因记录在 metadata["latency"]。
+        """
+        on_token = events.chunk if events else None
+        budget = LatencyBudget.create(latency_mode, latency_budget)
+        model = budget.choose_model(self._llm.get_recommended_model(question))
+        graph = StageGraph(events)
+        try:
+            if web_search_enabled or _SEARCH_HINT_RE.search(question):
+                graph.add(
+                    "search",
+                    lambda _: self._search(question),
+                    speculative=not web_search_enabled,
+                    artifact=_search_preview,
+                )
+            partial: dict[str, Any] = {}
+
+            async def on_field(key: str, value: Any) -> None:
+                # 理解结果流式到达：是否搜索与关键词一旦确定就开始搜索，不等待整段输出结束
+                partial[key] = value
+                if "search" in graph or "key_concepts" not in partial:
+                    return
+                if partial.get("requires_web_search") or str(partial.get("domain", "")).lower() in _SEARCH_DOMAINS:
+                    intent = V1Intent(key_concepts=self._to_str_list(partial["key_concepts"]))
+                    graph.add(
+                        "search",
+                        lambda _: self._search(self._build_search_query(question, intent)),
+                        artifact=_search_preview,
+                    )
+
+            graph.add(
+                "understanding",
+                lambda _: self._understanding(
+                    question,
+                    conversation_history,
+                    model,
+                    # 搜索已启动时无需逐字段解析，改用可对冲的非流式调用
+                    on_field=None if "search" in graph else on_field,
+                ),
+                artifact=lambda intent: intent.__dict__,
+            )
 
-        search_result = ""
-        if should_search:
-            search_query = self._build_search_query(question, intent)
-            search_result = tavily_search(search_query)
+            intent: V1Intent = await graph.result("understanding")
+            head = self._synthesis_head(intent)
+            if on_token:
+                await on_token(head)
 
-        initial_analysis = await self._initial_analysis(
-            question, conversation_history, intent, search_result, model
-        )
+            should_search = (
+                web_search_enabled
+                or intent.requires_web_search
+                or intent.domain.lower() in _SEARCH_DOMAINS
+            )
+            if should_search and "search" not in graph:
+                graph.add(
+                    "search",
+                    lambda _: self._search(self._build_search_query(question, intent)),
+                    artifact=_search_preview,
+                )
+            elif not should_search and "search" in graph:
+                graph.cancel("search")
+
+            # 可选阶段都在初步分析之后开始，按预算规划是否运行
+            ahead = ("search", "initial_analysis") if should_search else ("initial_analysis",)
+            reflect_plan = budget.plan(("reflection",), model, after=ahead) if deep_thinking else None
+            reflect = reflect_plan is not None and reflect_plan.run
+
+            # 无反思阶段时初步分析即最终分析，可直接流式输出
+            graph.add(
+                "initial_analysis",
+                lambda inputs: self._initial_analysis(
+                    question,
+                    conversation_history,
+                    intent,
+                    inputs.get("search", ""),
+                    model,
+                    on_token=None if reflect else on_token,
+                    max_tokens=budget.max_tokens,
+                ),
+                deps=("search",) if should_search else (),
+                # 需要反思时初步分析不直接流式输出，先以阶段产物下发预览
+                artifact=(lambda text: {"preview": text}) if reflect else None,
+            )
+            if reflect:
+                graph.add(
+                    "reflection",
+                    lambda inputs: self._reflection(
+                        question, inputs["initial_analysis"], model, max_tokens=reflect_plan.max_tokens
+                    ),
+                    deps=("initial_analysis",),
+                    artifact=lambda result: {
+                        key: result.get(key) for key in ("strengths", "weaknesses", "improvements")
+                    },
+                )
 
-        refined_answer = initial_analysis
-        reflection = None
-        if deep_thinking:
-            reflection = await self._reflection(question, initial_analysis, model)
-            refined_answer = reflection.get("refined_answer", initial_analysis)
-
-        detailed_analysis = None
-        code_artifact = None
-        code_modifications: list[dict[str, Any]] = []
-
-        if intent.requires_code or intent.domain.lower() in {"arch/dev", "development", "engineering"}:
-            detailed_analysis = await self._detailed_analysis(question, refined_answer, model)
-            code_artifact = await self._code_generation(question, detailed_analysis)
-            if code_artifact.get("code"):
-                code_modifications.append(
-                    {
-                        "file_path": f"generated/{code_artifact.get('title', 'solution').replace(' ', '_')}.txt",
-                        "modification_type": "ADD",
-                        "content": code_artifact.get("code", ""),
-                    }
+            # 详细分析基于反思后的答案；无反思（未开启或被预算跳过）时只依赖初步分析
+            basis = ("initial_analysis", "reflection") if reflect else ("initial_analysis",)
+            needs_code = intent.requires_code or intent.domain.lower() in {"arch/dev", "development", "engineering"}
+            if needs_code:
+                code_plan = budget.plan(
+                    ("detailed_analysis", "code_generation"),
+                    model,
+                    after=ahead + ("reflection",) if reflect else ahead,
+                )
+                needs_code = code_plan.run
+            if needs_code:
+                code_model = budget.choose_model(self._llm.get_recommended_model("code generation " + question))
+                graph.add(
+                    "detailed_analysis",
+                    lambda inputs: self._detailed_analysis(
+                        question, self._refined_basis(inputs), model, max_tokens=code_plan.max_tokens
+                    ),
+                    deps=basis,
+                    artifact=lambda result: result,
+                )
+                graph.add(
+                    "code_generation",
+                    lambda inputs: self._code_generation(
+                        inputs["detailed_analysis"], code_model, max_tokens=code_plan.max_tokens
+                    ),
+                    deps=("detailed_analysis",),
+                    artifact=lambda result: {key: result.get(key) for key in ("title", "language")},
                 )
 
-        final_answer = self._synthesis(
-            intent=intent,
-            initial_analysis=initial_analysis,
-            refined_answer=refined_answer,
+            search_result: str = await graph.result("search") if should_search else ""
+            initial_analysis: str = await graph.result("initial_analysis")
+
+            refined_answer = initial_analysis
+            reflection = None
+            if reflect:
+                if await self._finish_within_budget(graph, budget, "reflection"):
+                    reflection = await graph.result("reflection")
+                    refined_answer = str(reflection.get("refined_answer") or initial_analysis)
+                elif needs_code:
+                    # 详细分析依赖反思，反思超时后代码阶段同样无法在截止时间内完成
+                    for stage in ("detailed_analysis", "code_generation"):
+                        graph.cancel(stage)
+                        budget.skip(stage, "deadline")
+                    needs_code = False
+                if on_token:
+                    await on_token(refined_answer)
+
+            detailed_analysis = None
+            code_artifact = None
+            code_modifications: list[dict[str, Any]] = []
+            if needs_code and await self._finish_within_budget(graph, budget, "detailed_analysis"):
+                detailed_analysis = await graph.result("detailed_analysis")
+                if await self._finish_within_budget(graph, budget, "code_generation"):
+                    code_artifact = await graph.result("code_generation")
+            elif needs_code:
+                graph.cancel("code_generation")
+                budget.skip("code_generation", "deadline")
+            if code_artifact:
+                if code_artifact.get("code"):
+                    code_modifications.append(
+                        {
+                            "file_path": f"generated/{code_artifact.get('title', 'solution').replace(' ', '_')}.txt",
+                            "modification_type": "ADD",
+                            "content": code_artifact.get("code", ""),
+                        }
+                    )
+        finally:
+            await graph.aclose()
+        stage_latency.observe(graph.timings, model)
+        if events:
+            for stage, reason in budget.skipped.items():
+                events.publish("stage_skipped", stage=stage, reason=reason)
+
+        tail = self._synthesis_tail(
             search_result=search_result,
             reflection=reflection,
             detailed_analysis=detailed_analysis,
             code_artifact=code_artifact,
         )
+        if on_token and tail:
+            await on_token(tail)
+
+        final_answer = (head + refined_answer + tail).strip()
 
         return V1PipelineResult(
             answer=final_answer,
             strategy="v1-parity-pipeline",
             model=model,
-            confidence=0.88 if deep_thinking else 0.8,
+            confidence=0.88 if reflection else 0.8,
             metadata={
                 "intent": intent.__dict__,
                 "used_web_search": should_search,
@@ -106,27 +288,64 @@ class V1ParityPipeline:
                 "detailed_analysis": detailed_analysis,
                 "code_artifact": code_artifact,
                 "reflection": reflection,
+                "stage_timings": graph.timings,
+                "latency": budget.to_metadata(),
+                "skipped_stages": list(budget.skipped),
             },
             code_modifications=code_modifications,
             suggestions=[] if should_search else ["如需最新外部信息，可启用 web_search 模式。"],
         )
 
-    async def _understanding(self, question: str, history: list[Any], model: str) -> V1Intent:
+    @staticmethod
+    def _refined_basis(inputs: dict[str, Any]) -> str:
+        """详细分析的输入：有反思结果时取 refined_answer，否则（或反思未给出）取初步分析"""
+        reflection = inputs.get("reflection")
+        if reflection is not None and reflection.get("refined_answer"):
+            return str(reflection["refined_answer"])
+        return inputs.get("initial_analysis", "")
+
+    @staticmethod
+    async def _finish_within_budget(graph: StageGraph, budget: LatencyBudget, name: str) -> bool:
+        """在剩余预算内等待可选阶段完成；超时则取消并记为因截止时间跳过"""
+        remaining = budget.remaining()
+        if await graph.wait(name, None if remaining is None else max(remaining, 0.0)):
+            return True
+        graph.cancel(name)
+        budget.skip(name, "deadline")
+        return False
+
+    async def _search(self, query: str) -> str:
+        return (await tool_executor.run("tavily_search", query)).output
+
+    async def _understanding(
+        self,
+        question: str,
+        history: list[Any],
+        model: str,
+        *,
+        on_field: FieldCallback | None = None,
+    ) -> V1Intent:
         prompt = f"""
 你是 Understanding Agent。请分析用户问题并严格返回 JSON：
 {{
-  "intent": "...",
-  "domain": "general|arch/dev|medical|legal",
   "requires_web_search": true/false,
-  "requires_code": true/false,
-  "key_concepts": ["..."]
+  "domain": "general|arch/dev|medical|legal",
+  "key_concepts": ["..."],
+  "intent": "...",
+  "requires_code": true/false
 }}
 
 用户问题：{question}
 最近历史（最多10条）：{self._history_to_text(history[-10:])}
 """
-        raw = await self._llm.generate_simple(prompt, model=model)
-        data = self._safe_json(raw)
+        if on_field is None:
+            data = await self._llm.generate_json(
+                prompt, _UNDERSTANDING_SCHEMA, model=model, name="understanding", hedge=True
+            )
+        else:
+            data = await self._llm.stream_json(
+                prompt, _UNDERSTANDING_SCHEMA, model=model, name="understanding", on_field=on_field
+            )
         return V1Intent(
             intent=str(data.get("intent", "general_help")),
             domain=str(data.get("domain", "general")),
@@ -142,6 +361,8 @@ class V1ParityPipeline:
         intent: V1Intent,
         search_result: str,
         model: str,
+        on_token: TokenCallback | None = None,
+        max_tokens: int | None = None,
     ) -> str:
         system_prompt = "你是 Initial Analysis Agent。请给出结构化、可执行、面向落地的分析。"
         user_message = (
@@ -150,10 +371,23 @@ class V1ParityPipeline:
             f"搜索结果：{search_result[:3000] if search_result else '无'}\n"
             "请输出：问题理解、可执行步骤、关键风险、下一步建议。"
         )
-        result = await self._llm.generate_response(system_prompt, user_message, history[-10:], model=model)
-        return result["content"]
-
-    async def _reflection(self, question: str, initial_analysis: str, model: str) -> dict[str, Any]:
+        if on_token is None:
+            result = await self._llm.generate_response(
+                system_prompt, user_message, history[-10:], model=model, max_tokens=max_tokens
+            )
+            return result["content"]
+
+        chunks: list[str] = []
+        async for delta in self._llm.stream_response(
+            system_prompt, user_message, history[-10:], model=model, max_tokens=max_tokens
+        ):
+            chunks.append(delta)
+            await on_token(delta)
+        return "".join(chunks)
+
+    async def _reflection(
+        self, question: str, initial_analysis: str, model: str, *, max_tokens: int | None = None
+    ) -> dict[str, Any]:
         prompt = f"""
 你是 Reflection Agent。请对初步分析进行批判性反思，并严格输出 JSON：
 {{
@@ -166,9 +400,14 @@ class V1ParityPipeline:
 问题：{question}
 初步分析：{initial_analysis}
 """
-        return self._safe_json(await self._llm.generate_simple(prompt, model=model))
+        # 反思需要每次重新审视，不复用缓存结果
+        return await self._llm.generate_json(
+            prompt, _REFLECTION_SCHEMA, model=model, name="reflection", cache=False, max_tokens=max_tokens
+        )
 
-    async def _detailed_analysis(self, question: str, refined_answer: str, model: str) -> dict[str, Any]:
+    async def _detailed_analysis(
+        self, question: str, refined_answer: str, model: str, *, max_tokens: int | None = None
+    ) -> dict[str, Any]:
         prompt = f"""
 你是 Detailed Analysis Agent。请严格输出 JSON：
 {{
@@ -181,10 +420,13 @@ class V1ParityPipeline:
 问题：{question}
 已有答案：{refined_answer}
 """
-        return self._safe_json(await self._llm.generate_simple(prompt, model=model))
+        return await self._llm.generate_json(
+            prompt, _DETAILED_ANALYSIS_SCHEMA, model=model, name="detailed_analysis", max_tokens=max_tokens
+        )
 
-    async def _code_generation(self, question: str, detailed_analysis: dict[str, Any]) -> dict[str, Any]:
-        model = self._llm.get_recommended_model("code generation " + question)
+    async def _code_generation(
+        self, detailed_analysis: dict[str, Any], model: str, *, max_tokens: int | None = None
+    ) -> dict[str, Any]:
         prompt = f"""
 你是 Code Generation Agent。请严格输出 JSON：
 {{
@@ -197,19 +439,13 @@ class V1ParityPipeline:
 
 详细分析：{json.dumps(detailed_analysis, ensure_ascii=False)}
 """
-        return self._safe_json(await self._llm.generate_simple(prompt, model=model))
+        return await self._llm.generate_json(
+            prompt, _CODE_GENERATION_SCHEMA, model=model, name="code_generation", max_tokens=max_tokens
+        )
 
-    def _synthesis(
-        self,
-        *,
-        intent: V1Intent,
-        initial_analysis: str,
-        refined_answer: str,
-        search_result: str,
-        reflection: dict[str, Any] | None,
-        detailed_analysis: dict[str, Any] | None,
-        code_artifact: dict[str, Any] | None,
-    ) -> str:
+    @staticmethod
+    def _synthesis_head(intent: V1Intent) -> str:
+        """最终答案中分析结果之前的部分（仅依赖理解阶段，可提前输出）"""
         sections = [
             "## 需求理解",
             f"- 意图: {intent.intent}",
@@ -217,8 +453,19 @@ class V1ParityPipeline:
             f"- 关键概念: {', '.join(intent.key_concepts) if intent.key_concepts else '无'}",
             "",
             "## 分析结果",
-            refined_answer or initial_analysis,
         ]
+        return "\n".join(sections) + "\n"
+
+    def _synthesis_tail(
+        self,
+        *,
+        search_result: str,
+        reflection: dict[str, Any] | None,
+        detailed_analysis: dict[str, Any] | None,
+        code_artifact: dict[str, Any] | None,
+    ) -> str:
+        """最终答案中分析结果之后的部分"""
+        sections: list[str] = []
 
         if search_result:
             sections.extend(["", "## 网络搜索摘要", search_result[:1200]])
@@ -252,7 +499,7 @@ class V1ParityPipeline:
                     code_artifact.get("explanation", ""),
                 ]
             )
-        return "\n".join(sections).strip()
+        return "\n" + "\n".join(sections) if sections else ""
 
     @staticmethod
     def _history_to_text(history: list[Any]) -> str:
@@ -272,23 +519,3 @@ class V1ParityPipeline:
         if value is None:
             return []
         return [str(value)]
-
-    @staticmethod
-    def _safe_json(raw: str) -> dict[str, Any]:
-        raw = raw.strip()
-        if raw.startswith("```"):
-            raw = re.sub(r"^```(?:json)?\s*", "", raw)
-            raw = re.sub(r"\s*```$", "", raw)
-
-        try:
-            data = json.loads(raw)
-            return data if isinstance(data, dict) else {}
-        except Exception:
-            match = re.search(r"\{[\s\S]*\}", raw)
-            if not match:
-                return {}
-            try:
-                data = json.loads(match.group(0))
-                return data if isinstance(data, dict) else {}
-            except Exception:
-                return {}
@@ -1,4 +1,15 @@
-from .tavily_search import tavily_search 
+from .tavily_search import TavilySearchTool, tavily_search, tavily_tool
 from .base import BaseTool
+from .registry import ToolExecutor, ToolRegistry, ToolResult, tool_executor, tool_registry
 
-all = ["tavily_search", "BaseTool"]
\ No newline at end of file
+all = [
+    "tavily_search",
+    "tavily_tool",
+    "TavilySearchTool",
+    "BaseTool",
+    "ToolExecutor",
+    "ToolRegistry",
+    "ToolResult",
+    "tool_executor",
+    "tool_registry",
+]
\ No newline at end of file
@@ -1,6 +1,6 @@
 """
 工具基类/协议：每个工具实现 get_context，返回要注入到模型上下文的字符串。
-新增功能时在此目录下新建模块并实现 get_context，然后在 tools/__init__.py 中注册。
+新增功能时在此目录下新建模块并实现 get_context，然后在 tools/registry.py 的 _build_registry 中注册。
 """
 from typing import Optional, Any
 from abc import ABC, abstractmethod
@@ -10,6 +10,12 @@ class BaseTool(ABC):
     """可选基类：工具可继承此类并实现 get_context。"""
 
     name: str = "base"
+    # 写入 ReAct 工具列表的说明
+    description: str = ""
+    # 执行超时（秒），None 使用 TOOL_DEFAULT_TIMEOUT_SECONDS
+    timeout: Optional[float] = None
+    # 是否由 ToolExecutor 缓存结果；自带缓存或结果依赖实时状态的工具应设为 False
+    cacheable: bool = True
 
     @abstractmethod
     async def get_context(
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from app.config import settings
+from app.tools.base import BaseTool
+from app.tools.tavily_search import tavily_tool
+from app.utils.llm_cache import LLMResponseCache
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图桶上界（毫秒），最后一个桶收纳更慢的调用
+_LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+@dataclass
+class ToolResult:
+    tool: str
+    output: str
+    ok: bool
+    latency: float
+    cached: bool = False
+    truncated: bool = False
+
+
+class ToolRegistry:
+    """按名称注册工具；别名用于兼容模型输出的旧工具名。"""
+
+    def __init__(self) -> None:
+        self._tools: dict[str, BaseTool] = {}
+        self._aliases: dict[str, str] = {}
+
+    def register(self, tool: BaseTool, *, aliases: tuple[str, ...] = ()) -> None:
+        if tool.name in self._tools:
+            raise ValueError(f"Tool already registered: {tool.name}")
+        self._tools[tool.name] = tool
+        for alias in aliases:
+            self._aliases[alias] = tool.name
+
+    def get(self, name: str) -> BaseTool | None:
+        return self._tools.get(self._aliases.get(name, name))
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._tools)
+
+    def describe(self) -> str:
+        """生成 prompt 中的工具列表"""
+        return "\n".join(
+            f"{index}. {tool.name}: {tool.description}" for index, tool in enumerate(self._tools.values(), 1)
+        )
+
+
+class _LatencyHistogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(_LATENCY_BUCKETS_MS) + 1)
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cache_hits = 0
+        self.total_ms = 0.0
+
+    def observe(self, latency: float) -> None:
+        ms = latency * 1000
+        self.counts[bisect.bisect_left(_LATENCY_BUCKETS_MS, ms)] += 1
+        self.total_ms += ms
+
+    def get_stats(self) -> dict[str, Any]:
+        labels = [f"le_{bound}ms" for bound in _LATENCY_BUCKETS_MS] + ["inf"]
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "cache_hits": self.cache_hits,
+            "mean_ms": round(self.total_ms / max(sum(self.counts), 1), 2),
+            "histogram": dict(zip(labels, self.counts)),
+        }
+
+
+class ToolExecutor:
+    """异步执行工具：单工具超时、全局并发上限、结果长度上限与结果缓存，并记录每个工具的延迟直方图。"""
+
+    def __init__(
+        self,
+        registry: ToolRegistry,
+        *,
+        max_concurrency: int,
+        default_timeout: float,
+        max_result_chars: int,
+        cache: LLMResponseCache,
+    ) -> None:
+        self._registry = registry
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._default_timeout = default_timeout
+        self._max_result_chars = max_result_chars
+        self._cache = cache
+        self._stats: dict[str, _LatencyHistogram] = {}
+
+    async def run(self, name: str, message: str, **kwargs: Any) -> ToolResult:
+        """执行工具；未知工具、超时与异常都转换为 ok=False 的结果，不向上抛出"""
+        tool = self._registry.get(name)
+        if tool is None:
+            return ToolResult(tool=name, output=f"[ERROR] Unknown tool: {name}", ok=False, latency=0.0)
+
+        stats = self._stats.setdefault(tool.name, _LatencyHistogram())
+        stats.calls += 1
+        key = self._cache_key(tool.name, message, kwargs) if tool.cacheable else None
+        if key:
+            cached = await self._cache.get(key)
+            if cached is not None:
+                stats.cache_hits += 1
+                return ToolResult(tool=tool.name, output=cached["output"], ok=True, latency=0.0, cached=True)
+
+        timeout = tool.timeout or self._default_timeout
+        started = time.perf_counter()
+        async with self._semaphore:
+            try:
+                output = await asyncio.wait_for(tool.get_context(message, **kwargs), timeout)
+                ok = True
+            except asyncio.TimeoutError:
+                stats.timeouts += 1
+                output, ok = f"[ERROR] {tool.name} timed out after {timeout:g}s", False
+            except Exception as exc:
+                logger.warning("Tool %s failed: %r", tool.name, exc)
+                stats.errors += 1
+                output, ok = f"[ERROR] {tool.name} failed: {type(exc).__name__} {exc}".rstrip(), False
+        latency = time.perf_counter() - started
+        stats.observe(latency)
+
+        truncated = ok and len(output) > self._max_result_chars
+        if truncated:
+            output = output[: self._max_result_chars] + " …[truncated]"
+        if key and ok:
+            await self._cache.set(key, {"output": output})
+        return ToolResult(tool=tool.name, output=output, ok=ok, latency=latency, truncated=truncated)
+
+    def get_stats(self) -> dict[str, Any]:
+        return {name: stats.get_stats() for name, stats in self._stats.items()}
+
+    @staticmethod
+    def _cache_key(name: str, message: str, kwargs: dict[str, Any]) -> str:
+        raw = f"{name}:{' '.join(message.lower().split())}:{sorted(kwargs.items())!r}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _build_registry() -> ToolRegistry:
+    registry = ToolRegistry()
+    registry.register(tavily_tool, aliases=("search",))
+    return registry
+
+
+tool_registry = _build_registry()
+tool_executor = ToolExecutor(
+    tool_registry,
+    max_concurrency=settings.TOOL_MAX_CONCURRENCY,
+    default_timeout=settings.TOOL_DEFAULT_TIMEOUT_SECONDS,
+    max_result_chars=settings.TOOL_MAX_RESULT_CHARS,
+    cache=LLMResponseCache(
+        ttl_seconds=settings.TOOL_RESULT_CACHE_TTL_SECONDS,
+        max_entries=settings.TOOL_RESULT_CACHE_MAX_ENTRIES,
+        max_bytes=settings.LLM_CACHE_MAX_BYTES,
+    ),
+)
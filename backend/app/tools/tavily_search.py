@@ -1,25 +1,154 @@
-import os
-import requests
+from __future__ import annotations
 
-TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Optional
 
-def tavily_search(query: str) -> str:
-    """
-    调用 Tavily Search API，返回文本内容。
+from app.config import settings
+from app.tools.base import BaseTool
+from app.utils.http_client import http_clients
+from app.utils.llm_cache import LLMResponseCache
+from app.utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class TavilySearchTool(BaseTool):
+    """Tavily 网页搜索（异步）：共享连接池 + 超时 + 按归一化查询缓存，过期结果先返回再后台刷新。
+
+    缓存在 fresh_seconds 内视为新鲜；超过后仍直接返回旧结果，
+    同时在后台重新请求（stale-while-revalidate）；超过缓存 TTL 后视为未命中。
     """
-    if not TAVILY_API_KEY:
-        return "Tavily API key not found."
-
-    url = "https://api.tavily.com/search"
-    payload = {
-        "api_key": TAVILY_API_KEY,
-        "query": query,
-        "max_results": 5
-    }
-
-    try:
-        response = requests.post(url, json=payload)
+
+    name = "tavily_search"
+    description = "Search the web for up-to-date information."
+    # 自带 stale-while-revalidate 缓存，不再由 ToolExecutor 缓存
+    cacheable = False
+
+    def __init__(
+        self,
+        *,
+        api_key: str,
+        base_url: str,
+        timeout: float,
+        max_results: int,
+        fresh_seconds: float,
+        cache: LLMResponseCache,
+    ) -> None:
+        self._api_key = api_key
+        self._base_url = base_url.rstrip("/")
+        self._timeout = timeout
+        self._max_results = max_results
+        self._fresh_seconds = fresh_seconds
+        self._cache = cache
+        self._inflight = SingleFlight()
+        self._revalidating: set[asyncio.Task] = set()
+
+        self._searches = 0
+        self._stale_served = 0
+        self._errors = 0
+
+    async def get_context(
+        self,
+        message: str,
+        project_id: Optional[int] = None,
+        **kwargs: Any,
+    ) -> str:
+        # 失败时抛出，由 ToolExecutor 转换为 ok=False 的结果并计入该工具的错误统计
+        return await self._search(message)
+
+    async def search(self, query: str) -> str:
+        """返回拼接后的搜索结果文本；出错时返回错误说明而不是抛异常"""
+        if not self._api_key:
+            return "Tavily API key not found."
+        try:
+            return await self._search(query)
+        except Exception as e:
+            return f"Search error: {e}"
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "searches": self._searches,
+            "stale_served": self._stale_served,
+            "errors": self._errors,
+            "revalidating": len(self._revalidating),
+            "cache": self._cache.get_stats(),
+        }
+
+    async def _search(self, query: str) -> str:
+        """返回拼接后的搜索结果文本；网络错误、非 2xx 与响应体解析失败时抛出异常"""
+        if not self._api_key:
+            raise RuntimeError("Tavily API key not found.")
+
+        self._searches += 1
+        key = self._cache_key(query)
+        cached = await self._cache.get(key)
+        if cached is not None:
+            if time.time() - cached["fetched_at"] > self._fresh_seconds:
+                self._stale_served += 1
+                self._revalidate(key, query)
+            return cached["content"]
+
+        try:
+            return await self._inflight.do(key, lambda: self._fetch_and_store(key, query))
+        except Exception as e:
+            self._errors += 1
+            logger.warning("Tavily search failed: %r", e)
+            raise
+
+    async def _fetch_and_store(self, key: str, query: str) -> str:
+        content = await self._fetch(query)
+        await self._cache.set(key, {"content": content, "fetched_at": time.time()})
+        return content
+
+    async def _fetch(self, query: str) -> str:
+        client = http_clients.get(self._base_url)
+        response = await client.post(
+            f"{self._base_url}/search",
+            json={"api_key": self._api_key, "query": query, "max_results": self._max_results},
+            timeout=self._timeout,
+        )
+        response.raise_for_status()
         data = response.json()
-        return "\n".join(i.get("content", "") for i in data.get("results", []))
-    except Exception as e:
-        return f"Search error: {e}"
\ No newline at end of file
+        return "\n".join(item.get("content", "") for item in data.get("results", []))
+
+    def _revalidate(self, key: str, query: str) -> None:
+        if any(task.get_name() == key for task in self._revalidating):
+            return
+
+        async def refresh() -> None:
+            try:
+                await self._inflight.do(key, lambda: self._fetch_and_store(key, query))
+            except Exception as e:
+                logger.warning("Tavily background refresh failed: %r", e)
+
+        task = asyncio.create_task(refresh(), name=key)
+        self._revalidating.add(task)
+        task.add_done_callback(self._revalidating.discard)
+
+    def _cache_key(self, query: str) -> str:
+        normalized = " ".join(query.lower().split())
+        raw = f"tavily:{self._max_results}:{normalized}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+tavily_tool = TavilySearchTool(
+    api_key=settings.TAVILY_API_KEY,
+    base_url=settings.TAVILY_API_BASE,
+    timeout=settings.TAVILY_TIMEOUT_SECONDS,
+    max_results=settings.TAVILY_MAX_RESULTS,
+    fresh_seconds=settings.TAVILY_CACHE_TTL_SECONDS,
+    cache=LLMResponseCache(
+        ttl_seconds=settings.TAVILY_CACHE_TTL_SECONDS + settings.TAVILY_CACHE_STALE_SECONDS,
+        max_entries=settings.TAVILY_CACHE_MAX_ENTRIES,
+        max_bytes=settings.LLM_CACHE_MAX_BYTES,
+        sqlite_path=settings.TAVILY_CACHE_SQLITE_PATH or None,
+    ),
+)
+
+
+async def tavily_search(query: str) -> str:
+    """调用 Tavily Search API，返回文本内容。"""
+    return await tavily_tool.search(query)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import importlib.util
+import logging
+from typing import Any, Iterable
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClientPool:
+    """按上游 endpoint 复用的长连接 httpx.AsyncClient 池。
+
+    每个上游（Azure OpenAI、DeepSeek 等）持有一个带连接池与 keep-alive 的客户端，
+    在 FastAPI lifespan 中创建、关闭；未启动时首次使用会惰性创建。
+    """
+
+    def __init__(self) -> None:
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._http2 = self._resolve_http2()
+
+    async def startup(self, endpoints: Iterable[str]) -> None:
+        for endpoint in endpoints:
+            if endpoint:
+                self.get(endpoint)
+        logger.info(
+            "HTTP client pool started: %d upstream(s), http2=%s",
+            len(self._clients),
+            self._http2,
+        )
+
+    def get(self, endpoint: str) -> httpx.AsyncClient:
+        key = self._normalize(endpoint)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = self._create_client()
+            self._clients[key] = client
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            if not client.is_closed:
+                await client.aclose()
+        logger.info("HTTP client pool closed: %d upstream(s)", len(clients))
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "upstreams": sorted(self._clients.keys()),
+            "http2": self._http2,
+            "timeouts": {
+                "connect": settings.HTTP_CONNECT_TIMEOUT,
+                "read": settings.HTTP_READ_TIMEOUT,
+                "write": settings.HTTP_WRITE_TIMEOUT,
+                "pool": settings.HTTP_POOL_TIMEOUT,
+            },
+            "limits": {
+                "max_connections": settings.HTTP_MAX_CONNECTIONS,
+                "max_keepalive_connections": settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                "keepalive_expiry": settings.HTTP_KEEPALIVE_EXPIRY,
+            },
+        }
+
+    def _create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=build_timeout(),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=self._http2,
+        )
+
+    @staticmethod
+    def _normalize(endpoint: str) -> str:
+        url = httpx.URL(endpoint)
+        return f"{url.scheme}://{url.netloc.decode('ascii')}"
+
+    @staticmethod
+    def _resolve_http2() -> bool:
+        if not settings.HTTP2_ENABLED:
+            return False
+        if importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP2_ENABLED is set but 'h2' is not installed; falling back to HTTP/1.1")
+            return False
+        return True
+
+
+def build_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=settings.HTTP_CONNECT_TIMEOUT,
+        read=settings.HTTP_READ_TIMEOUT,
+        write=settings.HTTP_WRITE_TIMEOUT,
+        pool=settings.HTTP_POOL_TIMEOUT,
+    )
+
+
+http_clients = HTTPClientPool()
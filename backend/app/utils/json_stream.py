@@ -0,0 +1,141 @@
+"""模型 JSON 输出的流式解析、宽松提取与 Schema 校验"""
+import json
+import re
+from typing import Any
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class JsonStreamParser:
+    """增量解析模型流式输出的 JSON 对象，每个顶层字段的值完整后立即产出。
+
+    只跟踪顶层对象的结构（嵌套深度、字符串与转义状态），顶层 "key": value 完整时
+    单独解析该成员，因此下游可以在整段输出结束前拿到已完成的字段。
+    对象前的代码围栏或说明文字会被跳过。
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start: int | None = None
+        self.fields: dict[str, Any] = {}
+        self.done = False
+
+    def feed(self, delta: str) -> list[tuple[str, Any]]:
+        """写入一段增量文本，返回本次新完成的 (字段名, 值) 列表"""
+        if self.done:
+            return []
+        self._buffer += delta
+        completed: list[tuple[str, Any]] = []
+
+        while self._pos < len(self._buffer):
+            char = self._buffer[self._pos]
+            if self._member_start is None:
+                # 尚未进入顶层对象
+                if char == "{":
+                    self._depth = 1
+                    self._member_start = self._pos + 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.extend(self._close_member(self._pos))
+                    self.done = True
+                    self._pos += 1
+                    break
+            elif char == "," and self._depth == 1:
+                completed.extend(self._close_member(self._pos))
+                self._member_start = self._pos + 1
+            self._pos += 1
+
+        return completed
+
+    def _close_member(self, end: int) -> list[tuple[str, Any]]:
+        member = self._buffer[self._member_start:end].strip()
+        if not member:
+            return []
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return []
+        self.fields.update(parsed)
+        return list(parsed.items())
+
+
+def extract_json_object(raw: str) -> dict[str, Any] | None:
+    """从模型输出中提取 JSON 对象：去掉代码围栏，整体解析失败时取第一个 { 到最后一个 } 之间的内容"""
+    raw = _FENCE_RE.sub("", raw.strip())
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        start, end = raw.find("{"), raw.rfind("}")
+        if start < 0 or end <= start:
+            return None
+        try:
+            data = json.loads(raw[start:end + 1])
+        except json.JSONDecodeError:
+            return None
+    return data if isinstance(data, dict) else None
+
+
+_TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+
+def validate_json(data: Any, schema: dict[str, Any], path: str = "$") -> list[str]:
+    """按 JSON Schema 子集（type / properties / required / items / enum）校验，返回错误列表"""
+    errors: list[str] = []
+    expected = schema.get("type")
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_TYPE_CHECKS[name](data) for name in types):
+            return [f"{path}: expected {'|'.join(types)}"]
+    if "enum" in schema and data not in schema["enum"]:
+        errors.append(f"{path}: not one of {schema['enum']}")
+
+    if isinstance(data, dict):
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}.{key}: missing")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in data:
+                errors.extend(validate_json(data[key], subschema, f"{path}.{key}"))
+    elif isinstance(data, list) and "items" in schema:
+        for index, item in enumerate(data):
+            errors.extend(validate_json(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+
+def object_schema(**properties: dict[str, Any]) -> dict[str, Any]:
+    """构造 strict 模式可用的对象 schema：所有字段必填且不允许额外字段，字段顺序即期望的输出顺序"""
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+STRING = {"type": "string"}
+BOOLEAN = {"type": "boolean"}
+STRING_LIST = {"type": "array", "items": {"type": "string"}}
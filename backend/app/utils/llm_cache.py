@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """LLM 响应缓存：内存 LRU（TTL + 条数/字节上限）+ 可选 SQLite 持久层。
+
+    键由 (deployment, 归一化 messages, 请求参数) 哈希得到；SQLite 层命中后回填内存层。
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float,
+        max_entries: int,
+        max_bytes: int,
+        sqlite_path: str | None = None,
+    ) -> None:
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._bytes = 0
+        self._sqlite_path = Path(sqlite_path) if sqlite_path else None
+        self._sqlite_ready = False
+        self._disk_writes = 0
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def make_key(deployment: str, messages: list[dict[str, str]], params: dict[str, Any] | None = None) -> str:
+        normalized = [
+            {"role": item.get("role", "user"), "content": " ".join(str(item.get("content", "")).split())}
+            for item in messages
+        ]
+        raw = json.dumps(
+            {"deployment": deployment, "messages": normalized, "params": params or {}},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> dict[str, Any] | None:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self._memory_hits += 1
+                return json.loads(value)
+            self._remove(key)
+
+        if self._sqlite_path is not None:
+            row = await asyncio.to_thread(self._disk_get, key, now)
+            if row is not None:
+                expires_at, value = row
+                self._store(key, value, expires_at)
+                self._disk_hits += 1
+                return json.loads(value)
+
+        self._misses += 1
+        return None
+
+    async def set(self, key: str, response: dict[str, Any]) -> None:
+        value = json.dumps(response, ensure_ascii=False)
+        if len(value) > self._max_bytes:
+            return
+
+        expires_at = time.time() + self._ttl
+        self._store(key, value, expires_at)
+        if self._sqlite_path is not None:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+
+    async def delete(self, key: str) -> None:
+        if key in self._entries:
+            self._remove(key)
+        if self._sqlite_path is not None:
+            await asyncio.to_thread(self._disk_delete, key)
+
+    def get_stats(self) -> dict[str, Any]:
+        hits = self._memory_hits + self._disk_hits
+        lookups = hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "memory_hits": self._memory_hits,
+            "disk_hits": self._disk_hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "hit_rate": hits / max(lookups, 1),
+            "persistent": self._sqlite_path is not None,
+        }
+
+    def _store(self, key: str, value: str, expires_at: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value)
+        self._bytes += len(value)
+
+        while self._entries and (len(self._entries) > self._max_entries or self._bytes > self._max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._sqlite_ready:
+            self._sqlite_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self._sqlite_path)
+        if not self._sqlite_ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+            self._sqlite_ready = True
+        return conn
+
+    def _disk_get(self, key: str, now: float) -> tuple[float, str] | None:
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT expires_at, value FROM llm_cache WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as exc:
+            logger.warning("LLM cache read failed: %s", exc)
+            return None
+        return (row[0], row[1]) if row else None
+
+    def _disk_set(self, key: str, value: str, expires_at: float) -> None:
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                self._disk_writes += 1
+                if self._disk_writes % 100 == 0:
+                    conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as exc:
+            logger.warning("LLM cache write failed: %s", exc)
+
+    def _disk_delete(self, key: str) -> None:
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as exc:
+            logger.warning("LLM cache delete failed: %s", exc)
+
+
+llm_cache = LLMResponseCache(
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    max_bytes=settings.LLM_CACHE_MAX_BYTES,
+    sqlite_path=settings.LLM_CACHE_SQLITE_PATH or None,
+)
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """合并相同键的并发请求：同一时刻同键只有一个上游调用，其余调用方共享其结果。
+
+    共享调用运行在独立 Task 中；单个调用方取消不会影响其他等待者，
+    只有全部等待者都取消时才取消上游调用。
+    """
+
+    def __init__(self) -> None:
+        self._inflight: dict[str, tuple[asyncio.Task, list[int]]] = {}
+        self._calls = 0
+        self._deduplicated = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self._calls += 1
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(fn())
+            entry = (task, [0])
+            self._inflight[key] = entry
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            self._deduplicated += 1
+
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            waiters[0] -= 1
+            if waiters[0] == 0 and not task.done():
+                task.cancel()
+            raise
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            "calls": self._calls,
+            "deduplicated": self._deduplicated,
+            "inflight": len(self._inflight),
+        }
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        entry = self._inflight.get(key)
+        if entry is not None and entry[0] is task:
+            del self._inflight[key]
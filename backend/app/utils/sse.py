@@ -0,0 +1,39 @@
+"""OpenAI 兼容接口的 SSE 流解析"""
+import json
+import logging
+from typing import Any, AsyncIterator
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+async def aiter_sse_json(response: httpx.Response) -> AsyncIterator[dict[str, Any]]:
+    """逐条解析 `data: {...}` 事件，遇到 `[DONE]` 结束；无法解析的事件跳过。"""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+
+        data = line[len("data:"):].strip()
+        if not data:
+            continue
+        if data == "[DONE]":
+            break
+
+        try:
+            payload = json.loads(data)
+        except json.JSONDecodeError:
+            logger.debug("Skipping malformed SSE event: %s", data[:200])
+            continue
+
+        if isinstance(payload, dict):
+            yield payload
+
+
+def chat_chunk_delta(chunk: dict[str, Any]) -> str:
+    """提取 chat.completion.chunk 中的增量文本"""
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    delta = choices[0].get("delta") or {}
+    return delta.get("content") or ""
@@ -0,0 +1,48 @@
+"""基于 tiktoken 的 token 估算"""
+import logging
+from functools import lru_cache
+from typing import Any, Iterable
+
+logger = logging.getLogger(__name__)
+
+# 每条消息的格式开销（role/分隔符），与 OpenAI 计数规则一致
+_MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as exc:
+        # 离线环境可能无法下载 BPE 文件，退化为按字符估算
+        logger.warning("tiktoken unavailable, falling back to character estimate: %s", exc)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 3)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: Iterable[dict[str, Any]]) -> int:
+    return sum(count_tokens(str(item.get("content", ""))) + _MESSAGE_OVERHEAD for item in messages) + 2
+
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = " …[truncated]") -> str:
+    """截断到最多 max_tokens 个 token，被截断时追加 marker"""
+    if max_tokens <= 0 or not text:
+        return ""
+    encoding = _encoding()
+    if encoding is None:
+        limit = max_tokens * 3
+        return text if len(text) <= limit else text[:limit] + marker
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]) + marker
@@ -0,0 +1,71 @@
+"""ReAct 每步发送的 prompt token 数：旧的字符串拼接 vs 结构化消息上下文。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.react_context_tokens [--steps 20] [--observation-tokens 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+
+import app.services  # noqa: F401  先初始化 services 包，避免直接导入 app.core 时的循环导入
+from app.config import settings
+from app.core.agent import build_react_system_prompt
+from app.core.react_context import ReactContext
+from app.utils.tokens import count_message_tokens, count_tokens
+
+_WORDS = (
+    "latency throughput cache region deployment token budget search result summary "
+    "benchmark release kernel network database index query planner vector embedding"
+).split()
+
+
+def _synthetic_text(rng: random.Random, approx_tokens: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(approx_tokens))
+
+
+def run(steps: int, observation_tokens: int, seed: int = 0) -> list[tuple[int, int, int]]:
+    rng = random.Random(seed)
+    system_prompt = build_react_system_prompt()
+    question = "Compare the latest GPU cloud offerings and their pricing."
+    question_prompt = f"MCP context (JSON):\n{{}}\n\nUser question:\n{question}\n\nThought:"
+
+    # 旧实现：单个 prompt 字符串不断追加模型输出与完整观察结果
+    legacy_prompt = f"{system_prompt}\n\n{question_prompt}\n"
+    context = ReactContext(
+        system_prompt=system_prompt,
+        question_prompt=question_prompt,
+        observation_max_tokens=settings.REACT_OBSERVATION_MAX_TOKENS,
+        step_token_budget=settings.REACT_STEP_TOKEN_BUDGET,
+        compact_observation_tokens=settings.REACT_COMPACT_OBSERVATION_TOKENS,
+    )
+
+    rows = []
+    for step in range(1, steps + 1):
+        rows.append((step, count_tokens(legacy_prompt), count_message_tokens(context.messages())))
+
+        output = f"Thought: {_synthetic_text(rng, 40)}\nAction: {{\"tool\": \"search\", \"query\": \"q{step}\"}}"
+        observation = _synthetic_text(rng, observation_tokens)
+        legacy_prompt += f"\n{output}\n\nObservation: {observation}\n\nThought: "
+        context.add_step(output)
+        context.add_observation(observation)
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--observation-tokens", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = run(args.steps, args.observation_tokens)
+    print(f"{'step':>4} {'legacy':>10} {'messages':>10}")
+    for step, legacy, current in rows:
+        print(f"{step:>4} {legacy:>10} {current:>10}")
+    legacy_total = sum(row[1] for row in rows)
+    current_total = sum(row[2] for row in rows)
+    print(f"total {legacy_total:>9} {current_total:>10}  ({current_total / max(legacy_total, 1):.1%} of legacy)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
 import axios from 'axios';
-import type { ChatRequest, ChatResponse, Conversation, ConversationDetail, IntentResponse } from '@/types';
+import type {
+  ChatRequest,
+  ChatResponse,
+  Conversation,
+  ConversationDetail,
+  IntentResponse,
+  StageEvent,
+} from '@/types';
 
 const backendUrl = (process.env.NEXT_PUBLIC_BACKEND_URL ?? '').replace(/\/$/, '');
 
@@ -15,6 +22,7 @@ interface StreamHandlers {
   onChunk: (chunk: string) => void;
   onDone: (payload: ChatResponse) => void;
   onStatus?: (status: string) => void;
+  onStage?: (event: StageEvent) => void;
   onError?: (message: string) => void;
 }
 
@@ -73,6 +81,11 @@ export const chatApi = {
               case 'status':
                 handlers.onStatus?.(parsed.content || '');
                 break;
+              case 'stage_started':
+              case 'stage_finished':
+              case 'stage_skipped':
+                handlers.onStage?.(parsed as StageEvent);
+                break;
               case 'error':
                 handlers.onError?.(parsed.message || 'Stream error');
                 break;
@@ -102,6 +102,9 @@ export const useChatStore = create<ChatState>((set, get) => ({
       // 意图识别失败不影响主流程
     }
 
+    // 状态提示只在收到首个增量文本前显示，之后由真实内容替换
+    let hasChunk = false;
+
     try {
       await chatApi.streamMessage(
         {
@@ -110,10 +113,12 @@ export const useChatStore = create<ChatState>((set, get) => ({
         },
         {
           onChunk: (chunk) => {
+            const isFirstChunk = !hasChunk;
+            hasChunk = true;
             set((state) => ({
               messages: state.messages.map((msg) =>
                 msg.id === localAssistantId
-                  ? { ...msg, content: `${msg.content}${chunk}` }
+                  ? { ...msg, content: isFirstChunk ? chunk : `${msg.content}${chunk}` }
                   : msg,
               ),
             }));
@@ -121,12 +126,22 @@ export const useChatStore = create<ChatState>((set, get) => ({
           onStatus: (status) => {
             set((state) => ({
               messages: state.messages.map((msg) =>
-                msg.id === localAssistantId && msg.content.length === 0
+                msg.id === localAssistantId && !hasChunk
                   ? { ...msg, content: status }
                   : msg,
               ),
             }));
           },
+          onStage: (event) => {
+            if (event.type !== 'stage_started') return;
+            set((state) => ({
+              messages: state.messages.map((msg) =>
+                msg.id === localAssistantId && !hasChunk
+                  ? { ...msg, content: `正在执行: ${event.stage}...` }
+                  : msg,
+              ),
+            }));
+          },
           onError: (message) => {
             set((state) => ({
               messages: state.messages.map((msg) =>
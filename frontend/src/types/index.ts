@@ -43,6 +43,24 @@ export interface ChatRequest {
   conversation_id?: string;
   deep_thinking?: boolean;
   web_search_enabled?: boolean;
+  latency_mode?: 'fast' | 'balanced' | 'thorough';
+  latency_budget?: number;
+  run_id?: string;
+}
+
+export interface StageEvent {
+  type: 'stage_started' | 'stage_finished' | 'stage_skipped';
+  stage: string;
+  status?: 'ok' | 'failed' | 'cancelled';
+  duration?: number;
+  usage?: {
+    prompt_tokens: number;
+    completion_tokens: number;
+    total_tokens: number;
+    calls: number;
+  };
+  artifact?: unknown;
+  reason?: string;
 }
 
 export interface ChatResponse {